@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Request, Response, Form, Path
+from fastapi import APIRouter, Request, Response, Form, Path, Depends
 from fastapi.responses import JSONResponse
 import tools
 from ow_config import MAIN_URL
-from sqlalchemy.orm import sessionmaker
+from sql_logic.sql_session import request_session
 from sqlalchemy import insert
 from sql_logic import sql_catalog as catalog
 import standarts
+from caching.invalidation import catalog_changes
+from sql_logic.sql_changes import record_change
 
 
 router = APIRouter()
@@ -25,6 +27,7 @@ ASSOCIATION_RESPONSES = {
 
 @router.post(
     MAIN_URL+"/association/game/genre", 
+    dependencies=[Depends(catalog_changes("games"))],
     tags=["Association", "Game", "Genre"],
     summary="Создание ассоциации между игрой и жанром",
     status_code=202,
@@ -44,13 +47,14 @@ async def association_game_with_genre(
     access_result = await tools.access_admin(response=response, request=request)
 
     if access_result == True:
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
 
         if mode:
             output = session.query(catalog.game_genres).filter_by(game_id=game_id, genre_id=genre_id).first()
             if output is None:
                 insert_statement = insert(catalog.game_genres).values(game_id=game_id, genre_id=genre_id)
                 session.execute(insert_statement)
+                record_change(session, "games", game_id)
                 session.commit()
                 session.close()
                 return JSONResponse(status_code=202, content="Complite")
@@ -63,6 +67,7 @@ async def association_game_with_genre(
 
             # Выполнение операции DELETE
             session.execute(delete_genre_association)
+            record_change(session, "games", game_id)
             session.commit()
             session.close()
             return JSONResponse(status_code=202, content="Complite")
@@ -72,6 +77,7 @@ async def association_game_with_genre(
 
 @router.post(
     MAIN_URL+"/mods/{mod_id}/dependencies/{dependencie_id}",
+    dependencies=[Depends(catalog_changes("mods"))],
     tags=["Association", "Mod"],
     summary="Добавление зависимости мода",
     status_code=202,
@@ -98,6 +104,7 @@ async def mod_add_dependency(
 
 @router.delete(
     MAIN_URL+"/mods/{mod_id}/dependencies/{dependencie_id}",
+    dependencies=[Depends(catalog_changes("mods"))],
     tags=["Association", "Mod"],
     summary="Удаление зависимости мода",
     status_code=202,
@@ -123,6 +130,7 @@ async def mod_delete_dependency(
 
 @router.post(
     MAIN_URL+"/association/game/tag", 
+    dependencies=[Depends(catalog_changes("tags"))],
     tags=["Association", "Game", "Tag"],
     summary="Создание ассоциации между игрой и тегом",
     status_code=202,
@@ -142,13 +150,14 @@ async def association_game_with_tag(
     access_result = await tools.access_admin(response=response, request=request)
 
     if access_result == True:
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
 
         if mode:
             output = session.query(catalog.allowed_mods_tags).filter_by(game_id=game_id, tag_id=tag_id).first()
             if output is None:
                 insert_statement = insert(catalog.allowed_mods_tags).values(game_id=game_id, tag_id=tag_id)
                 session.execute(insert_statement)
+                record_change(session, "games", game_id)
                 session.commit()
                 session.close()
                 return JSONResponse(status_code=202, content="Complite")
@@ -161,6 +170,7 @@ async def association_game_with_tag(
 
             # Выполнение операции DELETE
             session.execute(delete_tags_association)
+            record_change(session, "games", game_id)
             session.commit()
             session.close()
             return JSONResponse(status_code=202, content="Complite")
@@ -169,6 +179,7 @@ async def association_game_with_tag(
 
 @router.post(
     MAIN_URL+"/association/mod/tag", 
+    dependencies=[Depends(catalog_changes("mods"))],
     tags=["Association", "Mod", "Tag"],
     summary="Создание ассоциации между модом и тегом",
     status_code=202,
@@ -188,13 +199,14 @@ async def association_mod_with_tag(
     access_result = await tools.access_mods(response=response, request=request, mods_ids=mod_id)
 
     if access_result == True:
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
 
         if mode:
             output = session.query(catalog.mods_tags).filter_by(mod_id=mod_id, tag_id=tag_id).first()
             if output is None:
                 insert_statement = insert(catalog.mods_tags).values(mod_id=mod_id, tag_id=tag_id)
                 session.execute(insert_statement)
+                record_change(session, "mods", mod_id)
                 session.commit()
                 session.close()
                 return JSONResponse(status_code=202, content="Complite")
@@ -207,6 +219,7 @@ async def association_mod_with_tag(
 
             # Выполнение операции DELETE
             session.execute(delete_tags_association)
+            record_change(session, "mods", mod_id)
             session.commit()
             session.close()
             return JSONResponse(status_code=202, content="Complite")
@@ -215,6 +228,7 @@ async def association_mod_with_tag(
 
 @router.post(
     MAIN_URL+"/mods/{mod_id}/tags/{tag_id}",
+    dependencies=[Depends(catalog_changes("mods"))],
     tags=["Association", "Mod", "Tag"],
     summary="Добавление тега модификации",
     status_code=202,
@@ -241,6 +255,7 @@ async def mod_add_tag(
 
 @router.delete(
     MAIN_URL+"/mods/{mod_id}/tags/{tag_id}",
+    dependencies=[Depends(catalog_changes("mods"))],
     tags=["Association", "Mod", "Tag"],
     summary="Удаление тега модификации",
     status_code=202,
@@ -266,6 +281,7 @@ async def mod_delete_tag(
 
 @router.post(
     MAIN_URL+"/association/mod/dependencie", 
+    dependencies=[Depends(catalog_changes("mods"))],
     tags=["Association", "Mod"],
     summary="Создание ассоциации между модом и зависимостью",
     status_code=202,
@@ -288,13 +304,14 @@ async def association_mod_with_dependencie(
     access_result = await tools.access_mods(response=response, request=request, mods_ids=mod_id)
 
     if access_result == True:
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
 
         if mode:
             output = session.query(catalog.mods_dependencies).filter_by(mod_id=mod_id, dependence=dependencie).first()
             if output is None:
                 insert_statement = insert(catalog.mods_dependencies).values(mod_id=mod_id, dependence=dependencie)
                 session.execute(insert_statement)
+                record_change(session, "mods", mod_id)
                 session.commit()
                 session.close()
                 return JSONResponse(status_code=202, content="Complite")
@@ -308,6 +325,7 @@ async def association_mod_with_dependencie(
 
             # Выполнение операции DELETE
             session.execute(delete_dependence_association)
+            record_change(session, "mods", mod_id)
             session.commit()
             session.close()
             return JSONResponse(status_code=202, content="Complite")
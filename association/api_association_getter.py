@@ -4,8 +4,14 @@ import tools
 from ow_config import MAIN_URL
 from limits import LIMITS
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import insert
+from sqlalchemy import insert, and_
 from sql_logic import sql_catalog as catalog
+from sql_logic.sql_session import db_session
+from caching import counts
+from fast_json import FastJSONResponse
+from caching.etag import conditional_json
+from caching.responses import cached_response
+from caching import dictionary
 
 
 router = APIRouter()
@@ -66,6 +72,14 @@ router = APIRouter()
                 }
             }
         },
+        400: {
+            "description": "ID тегов не являются целыми числами.",
+            "content": {
+                "application/json": {
+                    "example": {"message": "ids must be integers", "error_id": 2}
+                }
+            }
+        },
         413: {
             "description": "Неккоректный диапазон параметров(размеров).",
             "content": {
@@ -79,12 +93,15 @@ router = APIRouter()
         }
     }
 )
+@cached_response("tags")
 async def list_tags(
+    request: Request,
     game_id: int = Query(-1, description="ID игры *(для активации фильтра значение `>0`)*."),
     page_size: int = Query(LIMITS.page.default, description="Размер 1 страницы. Диапазон - 1...50 элементов."),
     page: int = Query(0, description="Номер страницы. Не должна быть отрицательной."),
     name: str = Query("", description="Поиск по названию.", max_length=LIMITS.tag.name_max),
     tags_ids = Query([], description="Фильтрация по id тегов *(массив id)*.", example="[1, 2, 3]"),
+    count: counts.CountMode = Query("exact", description="Подсчет `database_size`: `none` - не считать *(`null`)*, `approx` и `exact` - точное количество *(считается в памяти)*."),
 ):
     """
     Возвращает список тегов. Они могут быть отфильтрованны по закрепленности за конкретной игрой.
@@ -92,26 +109,28 @@ async def list_tags(
     if page_size > LIMITS.page.max or page_size < LIMITS.page.min:
         return JSONResponse(status_code=413, content={"message": "incorrect page size", "error_id": 1})
 
-    tags_ids = tools.str_to_list(tags_ids)
+    tags_ids = tools.ids_to_int(tools.str_to_list(tags_ids))
+    if tags_ids is None:
+        return JSONResponse(status_code=400, content={"message": "ids must be integers", "error_id": 2})
 
-    # Создание сессии
-    session = sessionmaker(bind=catalog.engine)()
-    # Выполнение запроса
-    query = session.query(catalog.Tag)
+    # Теги и разрешенные играми теги - из снимка словарей в памяти, без запросов к БД
+    snapshot = await dictionary.current()
     if game_id > 0:
-        query = query.filter(catalog.Tag.associated_games.any(catalog.Game.id == game_id))
-    if len(name) > 0:
-        query = query.filter(catalog.Tag.name.ilike(f'%{name}%'))
-
-    if len(tags_ids) > 0:
-        query = query.filter(catalog.Tag.id.in_(tags_ids))
+        allowed = snapshot.game_tags.get(game_id, frozenset())
+        tags_ids = [tag_id for tag_id in tags_ids if tag_id in allowed] if tags_ids else list(allowed)
+        tags = snapshot.filter_names(snapshot.tags, name=name, ids=tags_ids) if tags_ids else []
+    else:
+        tags = snapshot.filter_names(snapshot.tags, name=name, ids=tags_ids)
 
-    tags_count = query.count()
+    tags_count = None if count == "none" else len(tags)
     offset = page_size * page
-    tags = query.offset(offset).limit(page_size).all()
+    tags = tags[offset:offset + page_size]
 
-    session.close()
-    return {"database_size": tags_count, "offset": offset, "results": tags}
+    return conditional_json(request, {
+        "database_size": tags_count,
+        "offset": offset,
+        "results": [{"id": tag_id, "name": tag_name} for tag_id, tag_name in tags],
+    })
 
 @router.get(
     MAIN_URL+"/list/tags/mods/{mods_ids_list}",
@@ -142,42 +161,56 @@ async def list_tags_for_mods(
     only_ids: bool = Query(False, description="Если True вернет только ID тегов, если False вернет все данные о теге.")
 ):
     """
-    Возвращает ассоциации модов с тегами.
+    Возвращает ассоциации модов с тегами. Несуществующие моды возвращаются с пустым списком.
     """
-    mods_ids_list = tools.str_to_list(mods_ids_list)
-    tags = tools.str_to_list(tags)
+    mods_ids_list = tools.ids_to_int(tools.str_to_list(mods_ids_list))
+    tags = tools.ids_to_int(tools.str_to_list(tags))
 
-    if (len(mods_ids_list) + len(tags)) > LIMITS.association.filters_max:
+    if mods_ids_list is None or tags is None:
+        return JSONResponse(status_code=400, content={"message": "ids must be integers", "error_id": 2})
+    elif (len(mods_ids_list) + len(tags)) > LIMITS.association.filters_max:
         return JSONResponse(status_code=413,
-                            content={"message": "the maximum complexity of filters is 80 elements in sum",
+                            content={"message": f"the maximum complexity of filters is {LIMITS.association.filters_max} elements in sum",
                                      "error_id": 1})
 
-    # Создание сессии
-    session = sessionmaker(bind=catalog.engine)()
+    # Один запрос на все моды: LEFT JOIN оставляет и моды без тегов, заодно проверяя их существование
+    join_condition = catalog.mods_tags.c.mod_id == catalog.Mod.id
+    if len(tags) > 0:
+        join_condition = and_(join_condition, catalog.mods_tags.c.tag_id.in_(tags))
 
-    query = session.query(catalog.Mod.id)
-    query = query.filter(catalog.Mod.id.in_(mods_ids_list))
+    with db_session(catalog.engine) as session:
+        query = session.query(catalog.Mod.id, catalog.Mod.public, catalog.mods_tags.c.tag_id)
+        query = query.outerjoin(catalog.mods_tags, join_condition)
+        rows = query.filter(catalog.Mod.id.in_(mods_ids_list)).all()
 
-    if len(query.all()) > 0:
-        result_access = await tools.access_mods(response=response, request=request, mods_ids=mods_ids_list)
+    # Скрытые моды (public >= 2) - одна проверка доступа на все
+    hidden_ids = list({row.id for row in rows if row.public >= 2})
+    if hidden_ids:
+        result_access = await tools.access_mods(response=response, request=request, mods_ids=hidden_ids)
         if result_access != True:
             return result_access
 
-    # Выполнение запроса
-    result = {}
-    query_global = session.query(catalog.Tag).join(catalog.mods_tags)
-    for mod_id in mods_ids_list:
-        query = query_global.filter(catalog.mods_tags.c.mod_id == mod_id)
-        if len(tags) > 0:
-            query = query.filter(catalog.Tag.id.in_(tags))
+    result = {mod_id: [] for mod_id in mods_ids_list}
+    rows = [row for row in rows if row.tag_id is not None]
+    if only_ids:
+        for row in rows:
+            result.setdefault(row.id, []).append(row.tag_id)
+        return FastJSONResponse(content=result, response=response)
 
-        if only_ids:
-            if result.get(mod_id, None) == None: result[mod_id] = []
-            for id in query.all(): result[mod_id].append(id.id)
-        else:
-            result[mod_id] = query.all()
+    # Названия тегов - из снимка словарей в памяти; теги новее снимка дочитываются из БД
+    tags_names = (await dictionary.current()).tags
+    missing = {row.tag_id for row in rows if row.tag_id not in tags_names}
+    if missing:
+        with db_session(catalog.engine) as session:
+            loaded = session.query(catalog.Tag.id, catalog.Tag.name).filter(catalog.Tag.id.in_(missing)).all()
+        tags_names = {**tags_names, **{tag_id: name for tag_id, name in loaded}}
+
+    for row in rows:
+        # Тег уже удален, а связь с модом еще осталась - пропускаем
+        if row.tag_id in tags_names:
+            result.setdefault(row.id, []).append({"id": row.tag_id, "name": tags_names[row.tag_id]})
 
-    return result
+    return FastJSONResponse(content=result, response=response)
 
 @router.get(
     MAIN_URL+"/list/genres/games/{games_ids_list}", 
@@ -195,11 +228,19 @@ async def list_tags_for_mods(
                 }
             },
         },
+        400: {
+            "description": "ID игр или жанров не являются целыми числами.",
+            "content": {
+                "application/json": {
+                    "example": {"message": "ids must be integers", "error_id": 3}
+                }
+            },
+        },
         413: {
             "description": "Превышен максимальный размер сложности фильтрации.",
             "content": {
                 "application/json": {
-                    "example": {"message": "the maximum complexity of filters is 80 elements in sum", "error_id": 2}
+                    "example": {"message": "the maximum complexity of filters is 200 elements in sum", "error_id": 2}
                 }
             },
         },
@@ -213,30 +254,26 @@ async def list_genres_for_games(
     """
     Передает информацию о жанрах запрошенных игр.
     """
-    games_ids_list = tools.str_to_list(games_ids_list)
-    genres = tools.str_to_list(genres)
+    games_ids_list = tools.ids_to_int(tools.str_to_list(games_ids_list))
+    genres = tools.ids_to_int(tools.str_to_list(genres))
 
-    if (len(games_ids_list) + len(genres)) > LIMITS.association.filters_max:
+    if games_ids_list is None or genres is None:
+        return JSONResponse(status_code=400, content={"message": "ids must be integers", "error_id": 3})
+    elif (len(games_ids_list) + len(genres)) > LIMITS.association.filters_max:
         return JSONResponse(status_code=413,
-                            content={"message": "the maximum complexity of filters is 80 elements in sum",
+                            content={"message": f"the maximum complexity of filters is {LIMITS.association.filters_max} elements in sum",
                                      "error_id": 2})
 
-    # Создание сессии
-    Session = sessionmaker(bind=catalog.engine)
-    session = Session()
+    # Жанры игр - из снимка словарей в памяти, без запросов к БД
+    snapshot = await dictionary.current()
+    genres = set(genres)
 
-    # Выполнение запроса
     result = {}
-    query_global = session.query(catalog.Genre).join(catalog.game_genres)
     for game_id in games_ids_list:
-        query = query_global.filter(catalog.game_genres.c.game_id == game_id)
-        if len(genres) > 0:
-            query = query.filter(catalog.Genre.id.in_(genres))
-
+        genres_ids = [genre_id for genre_id in snapshot.game_genres.get(game_id, ()) if not genres or genre_id in genres]
         if only_ids:
-            if result.get(game_id, None) == None: result[game_id] = []
-            for id in query.all(): result[game_id].append(id.id)
+            result[game_id] = genres_ids
         else:
-            result[game_id] = query.all()
+            result[game_id] = [{"id": genre_id, "name": snapshot.genres[genre_id]} for genre_id in genres_ids if genre_id in snapshot.genres]
 
-    return result
+    return FastJSONResponse(content=result)
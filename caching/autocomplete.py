@@ -0,0 +1,234 @@
+"""
+In-memory prefix index for autocomplete over names of mods, games, tags and genres.
+
+Every name is indexed by the start of each of its words ("Better Zombies" is found by "bet" and "zom"):
+the keys live in one sorted array and a prefix is a contiguous range of it found with `bisect`.
+Results are the top entries by score (downloads for mods and games, usage count for tags and genres).
+Short prefixes (up to `SHORT_PREFIX` characters) match most of the index, so for each of them a bounded top list
+is kept up to date on every change; longer prefixes match few keys and scan their range.
+
+The index is built in `main.lifespan`, rebuilt periodically by the scheduler in a worker thread (changes made
+by other workers, download counters) and updated in place by the write routes through `refresh(kind, ids)`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+from bisect import bisect_left, insort
+from typing import Iterable
+
+from sqlalchemy import func
+
+from limits import LIMITS
+from sql_logic import sql_catalog as catalog
+from sql_logic.sql_session import session_factory
+
+
+KINDS = ("mods", "games", "tags", "genres")
+
+# Ключей на одно название не больше этого (по словам)
+MAX_WORDS_PER_NAME = 8
+# Префиксы до этой длины обслуживаются готовыми топ-списками
+SHORT_PREFIX = 3
+
+
+def _keys(name: str) -> list[str]:
+    lower = name.casefold().strip()
+    keys = []
+    for position, char in enumerate(lower):
+        if char.isalnum() and (position == 0 or not lower[position - 1].isalnum()):
+            keys.append(lower[position:])
+            if len(keys) >= MAX_WORDS_PER_NAME:
+                break
+    return keys
+
+
+def _short_prefixes(keys: list[str]) -> set[str]:
+    return {key[:length] for key in keys for length in range(1, min(SHORT_PREFIX, len(key)) + 1)}
+
+
+class PrefixIndex:
+    def __init__(self, items: Iterable[tuple[int, str, int]] = ()) -> None:
+        # id -> (name, score)
+        self._items: dict[int, tuple[str, int]] = {}
+        # Отсортированные пары (ключ, id)
+        self._index: list[tuple[str, int]] = []
+        # Короткий префикс -> отсортированные (-score, id), не длиннее _capacity
+        self._top: dict[str, list[tuple[int, int]]] = {}
+        # Префиксы, у которых в топ попали не все совпадения
+        self._truncated: set[str] = set()
+
+        candidates: dict[str, list[tuple[int, int]]] = {}
+        for item_id, name, score in items:
+            if name:
+                score = score or 0
+                self._items[item_id] = (name, score)
+                keys = _keys(name)
+                self._index.extend((key, item_id) for key in keys)
+                for prefix in _short_prefixes(keys):
+                    candidates.setdefault(prefix, []).append((-score, item_id))
+        self._index.sort()
+        for prefix, entries in candidates.items():
+            self._set_top(prefix, entries)
+
+    @property
+    def _capacity(self) -> int:
+        # Запас сверх лимита, чтобы удаление из топа редко требовало пересчета
+        return LIMITS.autocomplete.max * 2
+
+    def _set_top(self, prefix: str, entries: list[tuple[int, int]]) -> None:
+        self._top[prefix] = heapq.nsmallest(self._capacity, entries)
+        if len(entries) > self._capacity:
+            self._truncated.add(prefix)
+        else:
+            self._truncated.discard(prefix)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def upsert(self, item_id: int, name: str, score: int | None = None) -> None:
+        if score is None:
+            score = self._items.get(item_id, ("", 0))[1]
+        self.remove(item_id)
+        if not name:
+            return
+
+        score = score or 0
+        self._items[item_id] = (name, score)
+        keys = _keys(name)
+        for key in keys:
+            insort(self._index, (key, item_id))
+
+        entry = (-score, item_id)
+        for prefix in _short_prefixes(keys):
+            top = self._top.setdefault(prefix, [])
+            # В усеченный топ нельзя дописывать хуже последнего: за его пределами могут быть записи лучше
+            if prefix not in self._truncated or entry < top[-1]:
+                insort(top, entry)
+                if len(top) > self._capacity:
+                    del top[self._capacity:]
+                    self._truncated.add(prefix)
+
+    def remove(self, item_id: int) -> None:
+        old = self._items.pop(item_id, None)
+        if old is None:
+            return
+
+        keys = _keys(old[0])
+        for key in keys:
+            position = bisect_left(self._index, (key, item_id))
+            if position < len(self._index) and self._index[position] == (key, item_id):
+                del self._index[position]
+
+        entry = (-old[1], item_id)
+        for prefix in _short_prefixes(keys):
+            top = self._top.get(prefix)
+            if not top:
+                continue
+            position = bisect_left(top, entry)
+            if position < len(top) and top[position] == entry:
+                del top[position]
+                # Усеченный топ стал короче лимита - добираем из диапазона
+                if prefix in self._truncated and len(top) < LIMITS.autocomplete.max:
+                    self._set_top(prefix, self._matches(prefix))
+
+    def _matches(self, prefix: str) -> list[tuple[int, int]]:
+        matched = set()
+        position = bisect_left(self._index, (prefix,))
+        while position < len(self._index) and self._index[position][0].startswith(prefix):
+            matched.add(self._index[position][1])
+            position += 1
+        return [(-self._items[item_id][1], item_id) for item_id in matched]
+
+    def suggest(self, prefix: str, limit: int) -> list[dict]:
+        prefix = prefix.casefold().strip()
+        if not prefix:
+            return []
+        if len(prefix) <= SHORT_PREFIX:
+            top = self._top.get(prefix, [])[:limit]
+        else:
+            top = heapq.nsmallest(limit, self._matches(prefix))
+        return [{"id": item_id, "name": self._items[item_id][0]} for _, item_id in top]
+
+
+indexes: dict[str, PrefixIndex] = {kind: PrefixIndex() for kind in KINDS}
+# kind -> id, обновленные записью, пока индекс перестраивается в потоке (их нужно перечитать после замены)
+_pending: dict[str, set[int]] = {}
+
+
+def _load(kind: str, session, ids: list[int] | None = None) -> list[tuple[int, str, int]]:
+    match kind:
+        case "mods":
+            query = session.query(catalog.Mod.id, catalog.Mod.name, catalog.Mod.downloads).filter(
+                catalog.Mod.condition == 0, catalog.Mod.public == 0
+            )
+            id_column = catalog.Mod.id
+        case "games":
+            query = session.query(catalog.Game.id, catalog.Game.name, catalog.Game.mods_downloads)
+            id_column = catalog.Game.id
+        case "tags":
+            query = session.query(catalog.Tag.id, catalog.Tag.name, func.count(catalog.mods_tags.c.mod_id)).outerjoin(
+                catalog.mods_tags, catalog.mods_tags.c.tag_id == catalog.Tag.id
+            ).group_by(catalog.Tag.id, catalog.Tag.name)
+            id_column = catalog.Tag.id
+        case "genres":
+            query = session.query(catalog.Genre.id, catalog.Genre.name, func.count(catalog.game_genres.c.game_id)).outerjoin(
+                catalog.game_genres, catalog.game_genres.c.genre_id == catalog.Genre.id
+            ).group_by(catalog.Genre.id, catalog.Genre.name)
+            id_column = catalog.Genre.id
+        case _:
+            raise ValueError(f"unknown autocomplete kind {kind!r}")
+
+    if ids is not None:
+        query = query.filter(id_column.in_(ids))
+    return [(row[0], row[1], row[2]) for row in query.all()]
+
+
+def _read(kind: str, ids: list[int] | None = None) -> list[tuple[int, str, int]]:
+    # Работает в потоке: своя сессия, а не сессия запроса (она не потокобезопасна и держит старый снимок)
+    session = session_factory(catalog.engine)()
+    try:
+        return _load(kind, session, ids)
+    finally:
+        session.close()
+
+
+def _build(kind: str) -> PrefixIndex:
+    return PrefixIndex(_read(kind))
+
+
+async def rebuild(kinds: Iterable[str] = KINDS) -> None:
+    """Rebuilds the indexes from the database in a worker thread and swaps them in."""
+    for kind in kinds:
+        _pending[kind] = set()
+        try:
+            # Полное чтение таблицы и сортировка не должны держать event loop
+            index = await asyncio.to_thread(_build, kind)
+        finally:
+            changed = _pending.pop(kind)
+        indexes[kind] = index
+        if changed:
+            await refresh(kind, list(changed))
+
+
+async def refresh(kind: str, ids: list[int]) -> None:
+    """
+    Re-reads the given entities after a write (call it after the commit): upserts the existing ones,
+    drops the deleted/hidden ones. The query runs in a worker thread, the index is changed on the event loop.
+    """
+    if kind in _pending:
+        _pending[kind].update(ids)
+    rows = {row[0]: row for row in await asyncio.to_thread(_read, kind, ids)}
+
+    index = indexes[kind]
+    for item_id in ids:
+        row = rows.get(item_id)
+        if row is None:
+            index.remove(item_id)
+        else:
+            index.upsert(item_id, row[1], row[2])
+
+
+def suggest(kind: str, prefix: str, limit: int) -> list[dict]:
+    return indexes[kind].suggest(prefix, limit)
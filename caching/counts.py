@@ -0,0 +1,84 @@
+"""
+Cache of `database_size` counts of catalog listings.
+
+Keys are the listing namespace plus the normalized filter set, so `tags=[2,1]` and `tags=[1,2]` share an entry.
+Entries expire after `COUNT_CACHE_TTL` seconds and the whole namespace is dropped when the catalog changes
+(see `caching.invalidation`).
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Literal
+
+import ow_config as config
+from caching import invalidation
+from caching.ttl_cache import TTLCache
+
+
+CountMode = Literal["none", "approx", "exact"]
+
+count_cache = TTLCache(
+    maxsize=int(getattr(config, "COUNT_CACHE_SIZE", 5000)),
+    ttl=float(getattr(config, "COUNT_CACHE_TTL", 60)),
+)
+
+
+def _normalize(value):
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted({_normalize(item) for item in value}, key=repr))
+    if isinstance(value, str):
+        return value.strip().lower()
+    return value
+
+
+def count_key(namespace: str, **filters) -> tuple:
+    return (namespace, tuple(sorted((name, _normalize(value)) for name, value in filters.items())))
+
+
+def listing_count(
+    key: tuple,
+    mode: CountMode,
+    exact: Callable[[], int],
+    approx: Callable[[], int | None] | None = None,
+) -> int | None:
+    """
+    Count for a listing:
+    `exact` (the listings' default) - always COUNT (and refreshes the cache), `none` - not counted (None),
+    `approx` - opt-in: cache, then `approx()` if given and not None, then COUNT.
+    """
+    if mode == "none":
+        return None
+
+    if mode == "approx":
+        cached = count_cache.get(key)
+        if cached is not None:
+            return cached
+
+        if approx is not None:
+            value = approx()
+            if value is not None:
+                count_cache.set(key, value)
+                return value
+
+    value = exact()
+    count_cache.set(key, value)
+    return value
+
+
+def facet_counts(key: tuple, mode: CountMode, compute: Callable[[], dict]) -> dict:
+    """Per-value counts of a listing facet; shares the cache (and its invalidation) with `listing_count`."""
+    if mode != "exact":
+        cached = count_cache.get(key)
+        if cached is not None:
+            return cached
+
+    value = compute()
+    count_cache.set(key, value)
+    return value
+
+
+def invalidate(namespace: str) -> int:
+    return count_cache.discard_where(lambda key, _value: key[0] == namespace)
+
+
+invalidation.subscribe(invalidate)
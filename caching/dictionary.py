@@ -0,0 +1,126 @@
+"""
+Process-local snapshot of the small, rarely written dictionary tables:
+`tags`, `genres`, `unity_allowed_mods_tags` (tags allowed per game) and `unity_games_genres`.
+
+The snapshot is immutable and versioned; a rebuild reads the four tables and swaps the module-level reference
+in one assignment, so a request always sees one consistent version. It is loaded in `main.lifespan` and reloaded
+every `DICTIONARY_REFRESH_INTERVAL` seconds by the scheduler to pick up writes of other workers. Writes to tags,
+genres and game associations of this worker (see `caching.invalidation`) start a rebuild in the background.
+Requests never wait for a rebuild: they are served the last snapshot, only the very first one is loaded on demand.
+All rebuilds read the tables in a worker thread with their own session. If a rebuild fails, the previous snapshot
+keeps being served until the next one.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Mapping
+
+from caching import invalidation
+from sql_logic import sql_catalog as catalog
+from sql_logic.sql_session import session_factory
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: int = 0
+    tags: Mapping[int, str] = field(default_factory=dict)  # id -> name, по возрастанию id
+    genres: Mapping[int, str] = field(default_factory=dict)
+    game_tags: Mapping[int, frozenset[int]] = field(default_factory=dict)  # game_id -> разрешенные теги
+    game_genres: Mapping[int, tuple[int, ...]] = field(default_factory=dict)  # game_id -> жанры
+
+    def filter_names(self, names: Mapping[int, str], name: str = "", ids: list[int] | None = None) -> list[tuple[int, str]]:
+        # Аналог `ilike('%name%')` с регистронезависимой collation MySQL
+        name = name.casefold()
+        ids = set(ids) if ids else None
+        return [
+            (item_id, item_name) for item_id, item_name in names.items()
+            if (ids is None or item_id in ids) and (not name or name in (item_name or "").casefold())
+        ]
+
+
+_snapshot: Snapshot | None = None
+_stale = True
+# Счетчик инвалидаций: запись во время перестройки не должна потеряться
+_invalidations = 0
+# Фоновая перестройка после записи (одна на воркер)
+_rebuild_task: asyncio.Task | None = None
+
+
+def _load(version: int) -> Snapshot:
+    # Работает в потоке: своя сессия, а не сессия запроса
+    session = session_factory(catalog.engine)()
+    try:
+        tags = session.query(catalog.Tag.id, catalog.Tag.name).order_by(catalog.Tag.id).all()
+        genres = session.query(catalog.Genre.id, catalog.Genre.name).order_by(catalog.Genre.id).all()
+        allowed_tags = session.query(catalog.allowed_mods_tags.c.game_id, catalog.allowed_mods_tags.c.tag_id).all()
+        games_genres = session.query(catalog.game_genres.c.game_id, catalog.game_genres.c.genre_id).all()
+    finally:
+        session.close()
+
+    game_tags: dict[int, set[int]] = {}
+    for game_id, tag_id in allowed_tags:
+        game_tags.setdefault(game_id, set()).add(tag_id)
+    game_genres: dict[int, list[int]] = {}
+    for game_id, genre_id in games_genres:
+        game_genres.setdefault(game_id, []).append(genre_id)
+
+    return Snapshot(
+        version=version,
+        tags=MappingProxyType({tag_id: name for tag_id, name in tags}),
+        genres=MappingProxyType({genre_id: name for genre_id, name in genres}),
+        game_tags=MappingProxyType({game_id: frozenset(ids) for game_id, ids in game_tags.items()}),
+        game_genres=MappingProxyType({game_id: tuple(ids) for game_id, ids in game_genres.items()}),
+    )
+
+
+def rebuild_now() -> Snapshot:
+    global _snapshot, _stale
+    invalidations = _invalidations
+    snapshot = _load((_snapshot.version + 1) if _snapshot else 1)
+    _snapshot = snapshot
+    if invalidations == _invalidations:
+        _stale = False
+    return snapshot
+
+
+async def rebuild() -> None:
+    # Чтение таблиц не должно держать event loop
+    await asyncio.to_thread(rebuild_now)
+
+
+async def _rebuild_stale() -> None:
+    # Запись во время перестройки снова помечает снимок устаревшим - перечитываем, пока не догоним
+    while _stale:
+        try:
+            await rebuild()
+        except Exception as exc:
+            print(f"Dictionary: rebuild failed, serving version {_snapshot.version if _snapshot else None}: {exc!r}")
+            return
+
+
+async def current() -> Snapshot:
+    """The snapshot to serve a request from. Never rebuilt here, except the very first one."""
+    if _snapshot is not None:
+        return _snapshot
+    return await asyncio.to_thread(rebuild_now)
+
+
+def invalidate(namespace: str) -> None:
+    global _stale, _invalidations, _rebuild_task
+    # Ассоциации игра-жанр приходят как "games", игра-тег - как "tags"
+    if namespace not in ("tags", "genres", "games"):
+        return
+    _stale = True
+    _invalidations += 1
+
+    if _rebuild_task is None or _rebuild_task.done():
+        try:
+            _rebuild_task = asyncio.get_running_loop().create_task(_rebuild_stale())
+        except RuntimeError:
+            pass  # вне event loop (скрипты) - снимок обновит следующая перестройка
+
+
+invalidation.subscribe(invalidate)
@@ -0,0 +1,66 @@
+"""
+Conditional GET for catalog read endpoints.
+
+The ETag is a hash of the serialized body: unlike a per-namespace version counter it is the same on every
+gunicorn worker and can never outlive a change made by another worker. A matching `If-None-Match` turns the
+response into an empty 304, so repeat views cost the query and the serialization but not the transfer.
+
+`Cache-Control` lets a CDN in front of the manager serve anonymous catalog pages for
+`CATALOG_CACHE_MAX_AGE` seconds; responses that depend on the requester are marked `private`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Any
+
+from fastapi import Request, Response
+
+import ow_config as config
+import fast_json
+
+
+CATALOG_CACHE_MAX_AGE = int(getattr(config, "CATALOG_CACHE_MAX_AGE", 30))
+
+
+def make_etag(body: bytes) -> str:
+    # Слабый валидатор: тело эквивалентно, но сжатие/кодировка у CDN может отличаться
+    return 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Сравнение слабое (RFC 9110 13.1.2): W/ у сторон не учитывается
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def conditional_json(
+    request: Request,
+    content: Any,
+    response: Response | None = None,
+    status_code: int = 200,
+    shared: bool = True,
+) -> Response:
+    """
+    JSON response with ETag/Cache-Control, or 304 if the client already has this body.
+
+    `response` - the handler's injected response: its headers (e.g. refreshed session cookies) are carried over,
+    `shared=False` - the body depends on the requester and must not be stored by shared caches.
+    """
+    body = fast_json.dumps(content)
+    etag = make_etag(body)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CATALOG_CACHE_MAX_AGE}" if shared else "private, no-cache",
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        result = Response(status_code=304, headers=headers)
+    else:
+        result = Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
+
+    return fast_json.carry_headers(result, response)
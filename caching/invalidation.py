@@ -0,0 +1,40 @@
+"""
+Catalog change notifications for process-local caches.
+
+Write routes declare which parts of the catalog they touch:
+
+    @router.post(MAIN_URL+"/add/tag", dependencies=[Depends(catalog_changes("tags"))], ...)
+
+and caches subscribe with `subscribe(callback)`; the callback receives the namespace
+(`mods`, `games`, `genres`, `tags`, `resources`) after the handler has finished without an exception.
+Notifications are per worker: other workers rely on the TTL of their caches.
+"""
+
+from __future__ import annotations
+
+from typing import AsyncIterator, Callable
+
+
+_subscribers: list[Callable[[str], None]] = []
+
+
+def subscribe(callback: Callable[[str], None]) -> None:
+    _subscribers.append(callback)
+
+
+def notify(*namespaces: str) -> None:
+    for namespace in namespaces:
+        for callback in _subscribers:
+            try:
+                callback(namespace)
+            except Exception as exc:
+                print(f"Invalidation: subscriber failed for `{namespace}`: {exc!r}")
+
+
+def catalog_changes(*namespaces: str) -> Callable[[], AsyncIterator[None]]:
+    """FastAPI dependency factory: notifies subscribers once the write handler has run."""
+    async def dependency() -> AsyncIterator[None]:
+        yield
+        notify(*namespaces)
+
+    return dependency
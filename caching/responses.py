@@ -0,0 +1,107 @@
+"""
+Cache of whole responses of anonymous catalog listings.
+
+Most listing traffic comes without a session and repeats a handful of filter combinations (front page by
+downloads, per-game and per-tag lists), so such responses are kept per worker in an LRU with TTL:
+
+    @router.get(MAIN_URL+"/list/games/", ...)
+    @cached_response("games", "genres")
+    async def games_list(request: Request, ...):
+
+The key is the route path plus the normalized query string; entries of a namespace are dropped when a write
+route declares a change of it (see `caching.invalidation`), changes made on other workers and download counters
+are picked up within `RESPONSE_CACHE_TTL` seconds. Only `200` responses marked `Cache-Control: public`
+(see `caching.etag`) and without cookies are stored, so requester-dependent bodies are never shared.
+"""
+
+from __future__ import annotations
+
+import functools
+import json
+from typing import Awaitable, Callable
+
+from fastapi import Request, Response
+
+import ow_config as config
+from caching import invalidation
+from caching.etag import etag_matches
+from caching.ttl_cache import TTLCache
+
+
+response_cache = TTLCache(
+    maxsize=int(getattr(config, "RESPONSE_CACHE_SIZE", 1000)),
+    ttl=float(getattr(config, "RESPONSE_CACHE_TTL", 30)),
+)
+
+SESSION_COOKIES = ("accessToken", "refreshToken")
+
+
+def is_anonymous(request: Request) -> bool:
+    return not any(name in request.cookies for name in SESSION_COOKIES)
+
+
+def _normalize_value(value: str):
+    # `tags=[2, 1]` и `tags=[1,2]` - один и тот же фильтр
+    value = value.strip()
+    if value.startswith("["):
+        try:
+            items = json.loads(value)
+        except ValueError:
+            return value
+        if isinstance(items, list):
+            return tuple(sorted({repr(item) for item in items}))
+    return value
+
+
+def response_key(namespaces: tuple[str, ...], request: Request) -> tuple:
+    query = tuple(sorted((name, _normalize_value(value)) for name, value in request.query_params.multi_items()))
+    return (namespaces, request.url.path, query)
+
+
+def _cacheable(response: Response) -> bool:
+    return (
+        response.status_code == 200
+        and "public" in response.headers.get("cache-control", "")
+        and "set-cookie" not in response.headers
+        and isinstance(getattr(response, "body", None), bytes)
+    )
+
+
+def _replay(request: Request, entry: tuple[bytes, list[tuple[bytes, bytes]]]) -> Response:
+    body, raw_headers = entry
+    headers = dict((name.decode("latin-1"), value.decode("latin-1")) for name, value in raw_headers)
+    if etag_matches(request.headers.get("if-none-match"), headers.get("etag", "")):
+        return Response(status_code=304, headers={name: headers[name] for name in ("etag", "cache-control") if name in headers})
+    return Response(content=body, status_code=200, headers=headers)
+
+
+def cached_response(*namespaces: str) -> Callable:
+    """Decorator for read handlers taking `request: Request`; `namespaces` - what the response depends on."""
+    def decorator(handler: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            request: Request = kwargs["request"]
+            if not is_anonymous(request):
+                return await handler(*args, **kwargs)
+
+            key = response_key(namespaces, request)
+            entry = response_cache.get(key)
+            if entry is not None:
+                return _replay(request, entry)
+
+            response = await handler(*args, **kwargs)
+            if isinstance(response, Response) and _cacheable(response):
+                raw_headers = [(name, value) for name, value in response.headers.raw if name.lower() != b"content-length"]
+                response_cache.set(key, (response.body, raw_headers))
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate(namespace: str) -> int:
+    return response_cache.discard_where(lambda key, _value: namespace in key[0])
+
+
+invalidation.subscribe(invalidate)
@@ -0,0 +1,53 @@
+"""
+JSON responses serialized with orjson.
+
+`FastJSONResponse` is the application's `default_response_class`. Handlers on hot paths return it directly
+(`return FastJSONResponse(content=output)`) so FastAPI skips the reflective `jsonable_encoder` pass: the output must
+then consist of plain dicts/lists/scalars - datetimes, dates and UUIDs are serialized natively,
+ORM objects must be converted explicitly (e.g. `{"id": tag.id, "name": tag.name}`).
+
+A returned response replaces the handler's injected `response: Response`, so headers set on it (refreshed session
+cookies from `account.check_access`) have to be carried over: `FastJSONResponse(content=..., response=response)`.
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+
+def _default(value: Any) -> Any:
+    # Что orjson не умеет сам: SUM()/AVG() из MySQL приходят как Decimal
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    # OPT_NON_STR_KEYS - словари вида {mod_id: ...} с int-ключами, как у стандартного json
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def carry_headers(result: Response, response: Response | None) -> Response:
+    # Set-Cookie может повторяться, поэтому переносим сырые заголовки, а не словарь
+    if response is not None:
+        result.headers.raw.extend(
+            (name, value) for name, value in response.headers.raw
+            if name.lower() not in (b"content-length", b"content-type")
+        )
+    return result
+
+
+class FastJSONResponse(JSONResponse):
+    def __init__(self, content: Any, *args, response: Response | None = None, **kwargs) -> None:
+        super().__init__(content, *args, **kwargs)
+        carry_headers(self, response)
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,13 +1,20 @@
-from fastapi import APIRouter, Request, Response, Form, Query, Path
+from fastapi import APIRouter, Request, Response, Form, Query, Path, Depends
 from fastapi.responses import JSONResponse, PlainTextResponse
 import tools
 from ow_config import MAIN_URL
 from limits import LIMITS
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import insert, delete
+from sql_logic.sql_session import request_session
+from sqlalchemy import insert, delete, desc
 from sql_logic import sql_catalog as catalog
 from datetime import datetime
 import standarts
+from caching.invalidation import catalog_changes
+from caching import counts
+from caching import autocomplete
+from caching.etag import conditional_json
+from caching.responses import cached_response
+from sql_logic.sql_changes import record_change
+from sql_logic import sql_search
 
 
 router = APIRouter()
@@ -82,11 +89,14 @@ router = APIRouter()
         },
     }
 )
+@cached_response("games", "genres")
 async def games_list(
+    request: Request,
     page_size: int = Query(LIMITS.page.default, description="Размер 1 страницы. Диапазон - 1...50 элементов."), 
     page: int = Query(0, description="Номер страницы. Не должна быть отрицательной."), 
     sort: str = Query("MODS_DOWNLOADS", description="Сортировка. Префикс `i` указывает что сортировка должна быть инвертированной."),
     name: str = Query("", description="Фильтр по заголовку/названию."),
+    search_mode: str = Query("like", description="Режим поиска по `name`: `like` - вхождение подстроки в название, `fulltext` - полнотекстовый поиск по названию с ранжированием *(сортировка `RELEVANCE`)*."),
     type_app = Query([], description="Фильтр по типу *(`game` и/или `app`)*.", example="['game','app']"),
     genres=Query([], description="Фильтр по жанрам. Передать id интересующих жанров.", example="[1,2]"),
     primary_sources=Query([], description="Фильтр по источникам. Передать названия источников.", example="['local','steam']"), 
@@ -95,7 +105,8 @@ async def games_list(
     short_description: bool = Query(False, description="Отправлять ли короткое описание."),
     description: bool = Query(False, description="Отправлять ли описание."),
     dates: bool = Query(False, description="Отправлять ли даты (дата создания)."),
-    statistics: bool = Query(False, description="Отправлять ли статистику (количество модов и их общее количество скачиваний).")
+    statistics: bool = Query(False, description="Отправлять ли статистику (количество модов и их общее количество скачиваний)."),
+    count: counts.CountMode = Query("exact", description="Подсчет `database_size`: `exact` - точный подсчет, `approx` - из кеша, если есть *(может немного отставать)*, `none` - не считать *(`null`)*."),
 ):
     """
     О сортировке:
@@ -105,6 +116,7 @@ async def games_list(
     4. `MOD_DOWNLOADS` - сортировка по суммарному количеству скачанных модов для игры *(по умолчанию)*.
     5. `MODS_COUNT` - сортировка по суммарному количеству модов для игры.
     6. `SOURCE` - сортировка по источнику.
+    7. `RELEVANCE` - по релевантности поиску *(только с `search_mode=fulltext` и непустым `name`, иначе как по умолчанию)*.
     """
 
     genres = tools.str_to_list(genres)
@@ -121,7 +133,7 @@ async def games_list(
                                      "error_id": 2})
 
     # Создание сессии
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
 
     # Выполнение запроса
     query = session.query(catalog.Game.id, catalog.Game.name, catalog.Game.type, catalog.Game.source, catalog.Game.source_id)
@@ -134,19 +146,22 @@ async def games_list(
     if statistics:
         query = query.add_columns(catalog.Game.mods_count, catalog.Game.mods_downloads)
 
-    query = query.order_by(tools.sort_games(sort))
+    relevance = None
+    if search_mode == "fulltext" and len(name) > 0 and sql_search.fulltext_available("games"):
+        relevance = sql_search.games_relevance(name)
+
+    if relevance is not None and sort.removeprefix("i") == "RELEVANCE":
+        query = query.order_by(desc(relevance), catalog.Game.id)
+    else:
+        query = query.order_by(tools.sort_games(sort))
 
     # Фильтрация по разрешенным ID
     if len(allowed_ids) > 0:
         query = query.filter(catalog.Game.id.in_(allowed_ids))
 
-    # Фильтрация по жанрам
+    # Фильтрация по жанрам (игра должна иметь все переданные жанры)
     if len(genres) > 0:
-        for genre in genres:
-            print(type(genre))
-            query = query.filter(catalog.Game.genres.any(id=genre))
-
-            # filtered_games = session.query(Game).filter(Game.genres.any(id=excluded_genre_id))
+        query = query.filter(catalog.Game.id.in_(tools.games_with_all_genres(genres)))
 
     # Фильтрация по первоисточникам
     if len(primary_sources) > 0:
@@ -159,10 +174,19 @@ async def games_list(
         query = query.filter(catalog.Game.type.in_(type_app))
 
     # Фильтрация по имени
-    if len(name) > 0:
+    if relevance is not None:
+        query = query.filter(relevance > 0)
+    elif len(name) > 0:
         query = query.filter(catalog.Game.name.ilike(f'%{name}%'))
 
-    games_count = query.count()
+    games_count = counts.listing_count(
+        key=counts.count_key(
+            "games", name=name, search_mode=search_mode if relevance is not None else "like", type_app=type_app,
+            genres=genres, primary_sources=primary_sources, allowed_sources_ids=allowed_sources_ids, allowed_ids=allowed_ids,
+        ),
+        mode=count,
+        exact=query.count,
+    )
     offset = page_size * page
     games = query.offset(offset).limit(page_size).all()
 
@@ -181,7 +205,7 @@ async def games_list(
         output_games.append(out)
 
     session.close()
-    return {"database_size": games_count, "offset": offset, "results": output_games}
+    return conditional_json(request, {"database_size": games_count, "offset": offset, "results": output_games})
 
 
 @router.get(
@@ -194,14 +218,16 @@ async def games_list(
         404: {"description": "Игра не найдена."},
     },
 )
+@cached_response("games")
 async def game_info(
+    request: Request,
     game_id: int = Path(description="ID игры"),
     short_description: bool = Query(False, description="Отправлять ли короткое описание."),
     description: bool = Query(False, description="Отправлять ли описание."),
     dates: bool = Query(False, description="Отправлять ли даты (дата создания)."),
     statistics: bool = Query(False, description="Отправлять ли статистику (количество модов и их общее количество скачиваний)."),
 ):
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
 
     query = session.query(
         catalog.Game.id,
@@ -242,11 +268,12 @@ async def game_info(
         out["mods_count"] = row.mods_count
         out["mods_downloads"] = row.mods_downloads
 
-    return out
+    return conditional_json(request, out)
 
 
 @router.post(
     MAIN_URL+"/add/game", 
+    dependencies=[Depends(catalog_changes("games"))],
     tags=["Game"],
     summary="Добавление игры",
     status_code=202,
@@ -267,7 +294,7 @@ async def add_game(
     access_result = await tools.access_admin(response=response, request=request)
 
     if access_result == True:
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
 
         insert_statement = insert(catalog.Game).values(
             name=game_name,
@@ -283,8 +310,10 @@ async def add_game(
         result = session.execute(insert_statement)
         id = result.lastrowid
 
+        record_change(session, "games", id)
         session.commit()
         session.close()
+        await autocomplete.refresh("games", [id])
 
         return JSONResponse(status_code=202, content=id)
     else:
@@ -292,6 +321,7 @@ async def add_game(
 
 @router.post(
     MAIN_URL+"/edit/game",
+    dependencies=[Depends(catalog_changes("games"))],
     tags=["Game"],
     summary="Редактирование игры",
     status_code=202,
@@ -321,7 +351,7 @@ async def edit_game(
     access_result = await tools.access_admin(response=response, request=request)
 
     if access_result == True:
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
 
         game = session.query(catalog.Game).filter_by(id=game_id)
         if not game.first():
@@ -349,14 +379,17 @@ async def edit_game(
 
         # Меняем данные в БД
         game.update(data_edit)
+        record_change(session, "games", game_id)
         session.commit()
         session.close()
+        await autocomplete.refresh("games", [game_id])
         return PlainTextResponse(status_code=202, content="Complite")
     else:
         return access_result
 
 @router.delete(
     MAIN_URL+"/delete/game",
+    dependencies=[Depends(catalog_changes("games"))],
     tags=["Game"],
     summary="Удаление игры",
     status_code=202,
@@ -380,9 +413,11 @@ async def delete_game(
     access_result = await tools.access_admin(response=response, request=request)
 
     if access_result == True:
-        await tools.delete_resources(owner_type='games', owner_id=game_id)
+        session = request_session(catalog.engine)
 
-        session = sessionmaker(bind=catalog.engine)()
+        await tools.delete_resources(owner_type='games', owner_id=game_id)
+        # Файлы ресурсов уже удалены из storage - их записи фиксируются независимо от удаления игры
+        session.commit()
 
         delete_game = delete(catalog.Game).where(catalog.Game.id == game_id)
         delete_genres_association = catalog.game_genres.delete().where(catalog.game_genres.c.game_id == game_id)
@@ -392,8 +427,10 @@ async def delete_game(
         session.execute(delete_game)
         session.execute(delete_genres_association)
         session.execute(delete_tags_association)
+        record_change(session, "games", game_id, "delete")
         session.commit()
         session.close()
+        await autocomplete.refresh("games", [game_id])
 
         return JSONResponse(status_code=202, content="Complite")
     else:
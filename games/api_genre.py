@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Request, Response, Form, Query
+from fastapi import APIRouter, Request, Response, Form, Query, Depends
 from fastapi.responses import JSONResponse
 import tools
 from ow_config import MAIN_URL
 from limits import LIMITS
-from sqlalchemy.orm import sessionmaker
+from sql_logic.sql_session import request_session
 from sqlalchemy import insert, delete
 from sql_logic import sql_catalog as catalog
 import standarts
+from caching.invalidation import catalog_changes
+from caching import counts
+from caching import autocomplete
+from caching.etag import conditional_json
+from caching.responses import cached_response
+from caching import dictionary
+from sql_logic.sql_changes import record_change
 
 
 router = APIRouter()
@@ -46,31 +53,34 @@ router = APIRouter()
         }
     }
 )
+@cached_response("genres")
 async def list_genres(
+    request: Request,
     page_size: int = Query(LIMITS.page.default, description="Размер 1 страницы. Диапазон - 1...50 элементов."),
     page: int = Query(0, description="Номер страницы. Не должна быть отрицательной."),
     name: str = Query("", description="Поиск по названию.", max_length=LIMITS.genre.name_max),
+    count: counts.CountMode = Query("exact", description="Подсчет `database_size`: `none` - не считать *(`null`)*, `approx` и `exact` - точное количество *(считается в памяти)*."),
 ):
     if page_size > LIMITS.page.max or page_size < LIMITS.page.min:
         return JSONResponse(status_code=413, content={"message": "incorrect page size", "error_id": 1})
 
-    # Создание сессии
-    Session = sessionmaker(bind=catalog.engine)
-    session = Session()
-    # Выполнение запроса
-    query = session.query(catalog.Genre)
-    if len(name) > 0:
-        query = query.filter(catalog.Genre.name.ilike(f'%{name}%'))
+    # Жанры - из снимка словарей в памяти, без запросов к БД
+    snapshot = await dictionary.current()
+    genres = snapshot.filter_names(snapshot.genres, name=name)
 
-    genres_count = query.count()
+    genres_count = None if count == "none" else len(genres)
     offset = page_size * page
-    genres = query.offset(offset).limit(page_size).all()
+    genres = genres[offset:offset + page_size]
 
-    session.close()
-    return {"database_size": genres_count, "offset": offset, "results": genres}
+    return conditional_json(request, {
+        "database_size": genres_count,
+        "offset": offset,
+        "results": [{"id": genre_id, "name": genre_name} for genre_id, genre_name in genres],
+    })
 
 @router.post(
     MAIN_URL+"/add/genre", 
+    dependencies=[Depends(catalog_changes("genres"))],
     tags=["Genre"],
     summary="Добавляет жанр",
     status_code=202,
@@ -88,7 +98,7 @@ async def add_genre(
     access_result = await tools.access_admin(response=response, request=request)
 
     if access_result == True:
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
 
         insert_statement = insert(catalog.Genre).values(
             name=genre_name
@@ -97,8 +107,10 @@ async def add_genre(
         result = session.execute(insert_statement)
         id = result.lastrowid  # Получаем ID последней вставленной строки
 
+        record_change(session, "genres", id)
         session.commit()
         session.close()
+        await autocomplete.refresh("genres", [id])
 
         return JSONResponse(status_code=202, content=id)  # Возвращаем значение `id`
     else:
@@ -106,6 +118,7 @@ async def add_genre(
 
 @router.post(
     MAIN_URL+"/edit/genre", 
+    dependencies=[Depends(catalog_changes("genres"))],
     tags=["Genre"],
     summary="Редактирует жанр",
     status_code=202,
@@ -126,7 +139,7 @@ async def edit_genre(
     access_result = await tools.access_admin(response=response, request=request)
 
     if access_result == True:
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
 
         genre = session.query(catalog.Genre).filter_by(id=genre_id)
         if genre.first():
@@ -143,14 +156,17 @@ async def edit_genre(
         # Меняем данные в БД
         genre = session.query(catalog.Genre).filter_by(id=genre_id)
         genre.update(data_edit)
+        record_change(session, "genres", genre_id)
         session.commit()
         session.close()
+        await autocomplete.refresh("genres", [genre_id])
         return JSONResponse(status_code=202, content="Complite")
     else:
         return access_result
 
 @router.delete(
     MAIN_URL+"/delete/genre", 
+    dependencies=[Depends(catalog_changes("genres", "games"))],
     tags=["Genre"],
     summary="Удаляет жанр",
     status_code=202,
@@ -168,7 +184,7 @@ async def delete_genre(
     access_result = await tools.access_admin(response=response, request=request)
 
     if access_result == True:
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
 
         delete_game = delete(catalog.Genre).where(catalog.Genre.id == genre_id)
 
@@ -177,8 +193,10 @@ async def delete_genre(
         # Выполнение операции DELETE
         session.execute(delete_game)
         session.execute(delete_genres_association)
+        record_change(session, "genres", genre_id, "delete")
         session.commit()
         session.close()
+        await autocomplete.refresh("genres", [genre_id])
         return JSONResponse(status_code=202, content="Complite")
     else:
         return access_result
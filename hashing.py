@@ -0,0 +1,66 @@
+"""
+Bounded thread pool for bcrypt work.
+
+bcrypt deliberately costs tens of milliseconds per call, so running it inside an `async def` handler stalls
+every other request of the worker. All password and token hashing goes through this module instead.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+import bcrypt
+
+import ow_config as config
+
+
+HASH_POOL_WORKERS = int(getattr(config, "HASH_POOL_WORKERS", 2))
+HASH_QUEUE_LIMIT = int(getattr(config, "HASH_QUEUE_LIMIT", 32))
+
+T = TypeVar("T")
+
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing queue is full. Mapped to `503` in `main.py`."""
+
+
+_executor = ThreadPoolExecutor(max_workers=HASH_POOL_WORKERS, thread_name_prefix="bcrypt")
+_in_flight = 0
+_completed = 0
+_rejected = 0
+
+
+async def _submit(func: Callable[..., T], *args) -> T:
+    global _in_flight, _completed, _rejected
+
+    if _in_flight >= HASH_POOL_WORKERS + HASH_QUEUE_LIMIT:
+        _rejected += 1
+        raise HashingOverloaded()
+
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        _in_flight -= 1
+        _completed += 1
+
+
+async def checkpw(password: bytes, hashed_password: bytes) -> bool:
+    return await _submit(bcrypt.checkpw, password, hashed_password)
+
+
+async def hashpw(password: bytes, rounds: int) -> bytes:
+    return await _submit(lambda: bcrypt.hashpw(password, bcrypt.gensalt(rounds)))
+
+
+def stats() -> dict:
+    return {
+        "workers": HASH_POOL_WORKERS,
+        "queue_limit": HASH_QUEUE_LIMIT,
+        "in_flight": _in_flight,
+        "queued": max(0, _in_flight - HASH_POOL_WORKERS),
+        "completed": _completed,
+        "rejected": _rejected,
+    }
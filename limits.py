@@ -59,7 +59,7 @@ class GenreLimits:
 
 @dataclass(frozen=True)
 class AssociationLimits:
-    filters_max: int = 80
+    filters_max: int = 200
 
 
 @dataclass(frozen=True)
@@ -83,6 +83,19 @@ class SessionLimits:
     password_max: int = 100
 
 
+@dataclass(frozen=True)
+class AutocompleteLimits:
+    query_max: int = 128
+    default: int = 10
+    max: int = 20
+
+
+@dataclass(frozen=True)
+class ChangesLimits:
+    default: int = 500
+    max: int = 1000
+
+
 @dataclass(frozen=True)
 class Limits:
     page: PageLimits = field(default_factory=PageLimits)
@@ -94,6 +107,8 @@ class Limits:
     association: AssociationLimits = field(default_factory=AssociationLimits)
     profile: ProfileLimits = field(default_factory=ProfileLimits)
     session: SessionLimits = field(default_factory=SessionLimits)
+    autocomplete: AutocompleteLimits = field(default_factory=AutocompleteLimits)
+    changes: ChangesLimits = field(default_factory=ChangesLimits)
 
 
 LIMITS = Limits()
@@ -1,7 +1,21 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from ow_config import MAIN_URL
 import ow_config as config
+from scheduler import Scheduler, PeriodicTask, LeaderLock
+import hashing
+import session_tokens
+from sql_logic import sql_account as account
+from sql_logic import sql_changes
+from sql_logic.sql_async import dispose_async_engines
+from sql_logic.sql_engine import get_unpooled_engine, pool_status
+from sql_logic.sql_session import request_db_scope, session_stats
+import tools
+from fast_json import FastJSONResponse
+from caching.responses import response_cache
+from caching import autocomplete, dictionary
 
 from games.api_game import router as game_router
 from mods.api_mod import router as mod_router
@@ -10,6 +24,9 @@ from mods.api_tag import router as tag_router
 from mods.api_resource import router as resource_router
 from association.api_association_control import router as association_control_router
 from association.api_association_getter import router as association_getter_router
+from search.api_autocomplete import router as autocomplete_router
+from sync.api_export import router as export_router
+from sync.api_changes import router as changes_router
 from social.api_profile import router as profile_router
 from social.api_session import router as session_router
 from social.api_reaction import router as reaction_router
@@ -52,7 +69,65 @@ class CookieDefaultsMiddleware:
 
         await self.app(scope, receive, send_wrapper)
 
+HOUSEKEEPING_INTERVAL = float(getattr(config, "HOUSEKEEPING_INTERVAL", 60))
+HOUSEKEEPING_JITTER = float(getattr(config, "HOUSEKEEPING_JITTER", 10))
+
+# Блокировка лидера держит свое соединение вне пула запросов
+scheduler = Scheduler(lock=LeaderLock(engine=get_unpooled_engine("catalog"), name="ow_manager_housekeeping"))
+scheduler.add(PeriodicTask(
+    name="forget_accounts",
+    func=account.forget_accounts,
+    interval=HOUSEKEEPING_INTERVAL,
+    jitter=HOUSEKEEPING_JITTER,
+))
+scheduler.add(PeriodicTask(
+    name="prune_catalog_changes",
+    func=sql_changes.prune_changes,
+    interval=float(getattr(config, "CHANGES_PRUNE_INTERVAL", 3600)),
+    jitter=HOUSEKEEPING_JITTER,
+))
+scheduler.add(PeriodicTask(
+    name="flush_last_requests",
+    func=account.flush_last_requests,
+    interval=float(getattr(config, "SESSION_FLUSH_INTERVAL", 15)),
+    exclusive=False,  # буфер у каждого воркера свой
+))
+if session_tokens.ACCESS_TOKEN_SECRET:
+    scheduler.add(PeriodicTask(
+        name="sync_revoked_sessions",
+        func=account.sync_revoked_sessions,
+        interval=float(getattr(config, "REVOKED_SESSIONS_SYNC_INTERVAL", 10)),
+        exclusive=False,  # deny-list у каждого воркера свой
+    ))
+scheduler.add(PeriodicTask(
+    name="rebuild_dictionary",
+    func=dictionary.rebuild,
+    interval=float(getattr(config, "DICTIONARY_REFRESH_INTERVAL", 60)),
+    exclusive=False,  # снимок у каждого воркера свой
+))
+scheduler.add(PeriodicTask(
+    name="rebuild_autocomplete",
+    func=autocomplete.rebuild,
+    interval=float(getattr(config, "AUTOCOMPLETE_REBUILD_INTERVAL", 600)),
+    exclusive=False,  # индекс у каждого воркера свой
+))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await dictionary.rebuild()
+    await autocomplete.rebuild()
+    scheduler.start()
+    yield
+    await scheduler.stop()
+    await account.flush_last_requests()
+    await dispose_async_engines()
+
+
 app = FastAPI(
+    lifespan=lifespan,
+    dependencies=[Depends(request_db_scope)],  # одна сессия БД на движок на запрос, см. sql_logic/sql_session.py
+    default_response_class=FastJSONResponse,  # orjson вместо stdlib json, см. fast_json.py
     title="OpenWorkshop.Manager",
     openapi_url=MAIN_URL+"/openapi.json",
     contact={
@@ -113,6 +188,30 @@ app.add_middleware(
 )
 app.add_middleware(CookieDefaultsMiddleware)
 
+
+@app.exception_handler(hashing.HashingOverloaded)
+async def hashing_overloaded_handler(request: Request, exc: hashing.HashingOverloaded):
+    # Очередь bcrypt переполнена - просим клиента повторить позже, а не копим задержку
+    return PlainTextResponse(status_code=503, content="Сервер перегружен, попробуйте позже.", headers={"Retry-After": "1"})
+
+@app.get(MAIN_URL+"/service/pools", tags=["Service"])
+async def service_pools(response: Response, request: Request):
+    """
+    Состояние пулов соединений MySQL, статистика сессий на запрос, кешей ответов и access-токенов, пула bcrypt текущего воркера. Только для админов.
+    """
+    access_result = await tools.access_admin(response=response, request=request)
+
+    if access_result == True:
+        return {
+            **pool_status(),
+            "sessions": session_stats(),
+            "response_cache": response_cache.stats(),
+            "hashing": hashing.stats(),
+            "session_cache": account.session_cache.stats(),
+        }
+    else:
+        return access_result
+
 app.include_router(game_router)
 app.include_router(mod_router)
 app.include_router(genre_router)
@@ -120,6 +219,9 @@ app.include_router(tag_router)
 app.include_router(resource_router)
 app.include_router(association_control_router)
 app.include_router(association_getter_router)
+app.include_router(autocomplete_router)
+app.include_router(export_router)
+app.include_router(changes_router)
 app.include_router(profile_router)
 app.include_router(session_router)
 app.include_router(reaction_router)
@@ -1,18 +1,26 @@
-from fastapi import APIRouter, Request, Response, Form, Path, Query, File, UploadFile
+from fastapi import APIRouter, Request, Response, Form, Path, Query, File, UploadFile, Depends
 from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 from sql_logic import sql_account as account
 import tools
 import re
 import io
 from datetime import datetime
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import insert, func
+from sqlalchemy import insert, func, desc
 from sql_logic import sql_catalog as catalog
 from sql_logic import sql_statistics as statistics
+from sql_logic.sql_session import db_session, request_session
+from sql_logic import sql_search
 from ow_config import MAIN_URL
 import ow_config as config
 from limits import LIMITS
 import standarts
+from caching.invalidation import catalog_changes
+from caching import counts
+from caching import autocomplete
+from fast_json import FastJSONResponse
+from caching.etag import conditional_json
+from caching.responses import cached_response
+from sql_logic.sql_changes import record_change
 
 
 routers_edit_mod_response = {
@@ -48,6 +56,36 @@ routers_edit_mod_response = {
 
 router = APIRouter()
 
+# Фасеты mod_list: имя -> колонка группировки
+MOD_FACETS = {
+    "tags": catalog.mods_tags.c.tag_id,
+    "sources": catalog.Mod.source,
+    "games": catalog.Mod.game,
+}
+
+
+def mod_info_result(row, description: bool, short_description: bool, dates: bool, general: bool) -> dict:
+    # Поле "result" ответа info_mod/info_mods из строки запроса с соответствующими колонками
+    result = {"condition": row.condition}
+    if description:
+        result["description"] = row.description
+    if short_description:
+        result["short_description"] = row.short_description
+    if dates:
+        strformattime = "%Y-%m-%dT%H:%M:%S"
+
+        result["date_update_file"] = row.date_update_file.strftime(strformattime)
+        result["date_edit"] = row.date_edit.strftime(strformattime)
+        result["date_creation"] = row.date_creation.strftime(strformattime)
+    if general:
+        result["name"] = row.name
+        result["size"] = row.size
+        result["source"] = row.source
+        result["source_id"] = row.source_id
+        result["downloads"] = row.downloads
+        result["public"] = row.public
+    return result
+
 
 @router.get(
     MAIN_URL+"/mods/{mod_id}/download",
@@ -85,7 +123,7 @@ async def download_mod(
 
     Не рекомендую на уровне пользователя использовать фактический адрес, т.к. он может менятся, и данная функци доп. уровень абстракции.
     """
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
 
     mod_query = session.query(catalog.Mod).filter(catalog.Mod.id == mod_id)
     mod = mod_query.first()
@@ -145,7 +183,7 @@ async def access_to_mods(
         if user <= 0:  # Проверка неавторизованного доступа
             if edit: return [] # Неавторизованные пользователи не имеют edit прав, нет нужды обращаться к базе
             
-            session = sessionmaker(bind=catalog.engine)()
+            session = request_session(catalog.engine)
 
             # Выполнение запроса
             mods = session.query(catalog.Mod.id, catalog.Mod.public).filter(catalog.Mod.id.in_(ids_array))
@@ -198,7 +236,7 @@ async def public_mods(
     output = []
 
     # Создание сессии
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
 
     # Выполнение запроса
     query = session.query(catalog.Mod)
@@ -241,11 +279,15 @@ async def public_mods(
                                 "date_creation": "1984-01-01 00:00:00",
                                 "date_update": "1984-01-01 00:00:00"
                             }
-                        ]
+                        ],
+                        "next_cursor": "WyJET1dOTE9BRFMiLDEyMywzXQ"
                     }
                 }
             }
         },
+        400: {
+            "description": "Некорректный `cursor` (поврежден или получен с другой сортировкой) ИЛИ неизвестный фасет.",
+        },
         413: {
             "description": "Слишком сложный запрос ИЛИ page_size вне диапазона.",
         },
@@ -278,21 +320,28 @@ async def public_mods(
                                 "date_creation": "1984-01-01 00:00:00",
                                 "date_update": "1984-01-01 00:00:00"
                             }
-                        ]
+                        ],
+                        "next_cursor": "WyJET1dOTE9BRFMiLDEyMywzXQ"
                     }
                 }
             }
         },
+        400: {
+            "description": "Некорректный `cursor` (поврежден или получен с другой сортировкой) ИЛИ неизвестный фасет.",
+        },
         413: {
             "description": "Слишком сложный запрос ИЛИ page_size вне диапазона.",
         }
     }
 )
+@cached_response("mods", "tags")
 async def mod_list(
     response: Response, 
     request: Request, 
     page_size: int = Query(LIMITS.page.default, description="Размер 1 страницы. Диапазон - 1...50 элементов."), 
     page: int = Query(0, description="Номер страницы. Не должна быть отрицательной."),
+    cursor: str = Query("", description="Курсор следующей страницы (`next_cursor` из предыдущего ответа). Если передан, `page` игнорируется."),
+    count: counts.CountMode = Query("exact", description="Подсчет `database_size`: `exact` - точный подсчет, `approx` - из кеша, если есть *(может немного отставать)*, `none` - не считать *(`null`)*."),
     sort: str = Query("DOWNLOADS", description="Сортировка. Подробнее в полном описании функции."),
     tags = Query([], description="Массив ID тегов", examples={"example": {"value": "[1, 2, 3]"}}),
     game: int = Query(-1, description="ID игры."),
@@ -301,13 +350,15 @@ async def mod_list(
     primary_sources = Query([], description="Массив разрешенных источников.", examples={"example": {"value": "['local', 'steam']"}}),
     allowed_sources_ids = Query([], description="Массив ID модов в разрешенных источниках. Обязательно передать `primary_sources`.", examples={"example": {"value": "[1, 2, 3]"}}),
     name: str = Query("", description="Поиск по названию."),
+    search_mode: str = Query("like", description="Режим поиска по `name`: `like` - вхождение подстроки в название, `fulltext` - полнотекстовый поиск по названию и короткому описанию с ранжированием *(сортировка `RELEVANCE`)*."),
     user: int = Query(0, description="Фильтрация по модам определенного автора, 0 <= не фильтровать."),
     user_owner: int = Query(-1, description="Фильтрация по роли пользователя в разработке модов (работает если активен user параметр). -1 <= не фильтровать, 0 - владелец, 1 - разработчик"),
     show_not_public: bool = Query(False, description="Показывать непубличные моды пользователя *(только при фильтре `user` и если запрашивает этот пользователь или админ).*"),
     short_description: bool = Query(False, description="Включать ли в ответ короткое описание модов."),
     description: bool = Query(False, description="Включать ли в ответ полное описание модов."),
     dates: bool = Query(False, description="Включать ли в ответ даты создания и обновления модов."),
-    general: bool = Query(True, description="Включать ли в ответ общую информацию о моде (название, размер, источник, кол-во скачиваний).")
+    general: bool = Query(True, description="Включать ли в ответ общую информацию о моде (название, размер, источник, кол-во скачиваний)."),
+    facets: str = Query("", description="Через запятую: `tags`, `sources`, `games` - вернуть в `facets` количество модов по каждому значению.", examples={"example": {"value": "tags,sources"}}),
 ):
     """
     Возвращает список модов с возможностью многочисленных опциональных фильтров и настрое.
@@ -326,8 +377,24 @@ async def mod_list(
     5. REQUEST_DATE - сортировка по дате последнего запроса.
     6. SOURCE - сортировка по источнику.
     7. MOD_DOWNLOADS *(по умолчанию)* - сортировка по количеству загрузок.
+    8. RELEVANCE - по релевантности поиску *(только с `search_mode=fulltext` и непустым `name`, иначе как по умолчанию)*.
+
+    О поиске:
+    `search_mode=fulltext` ищет по n-граммам названия и короткого описания через полнотекстовый индекс:
+    находит части слов, терпит опечатки и ранжирует результаты. Если индекс недоступен, работает как `like`.
+
+    О пагинации:
+    `page` - постраничный обход через OFFSET, чем дальше страница, тем дольше запрос.
+    `cursor` - keyset-пагинация: передайте `next_cursor` из предыдущего ответа (с той же сортировкой и фильтрами),
+    скорость не зависит от глубины. `next_cursor` равен `null`, если страниц больше нет.
+
+    О фасетах:
+    `facets` добавляет в ответ `facets` - для каждого фасета словарь `{значение: количество модов}` по текущим фильтрам.
+    Фильтр самого фасета не учитывается (`sources` считаются без `primary_sources`, `games` - без `game`),
+    а для `tags` считается, сколько модов останется, если добавить этот тег. Считается с тем же `count` *(кеш при `approx`)*.
     """
     tags = tools.str_to_list(tags)
+    facets = [facet.strip() for facet in facets.split(",") if facet.strip()]
     primary_sources = tools.str_to_list(primary_sources)
     allowed_ids = tools.str_to_list(allowed_ids)
     allowed_sources_ids = tools.str_to_list(allowed_sources_ids)
@@ -339,6 +406,21 @@ async def mod_list(
                             content={"message": "the maximum complexity of filters is 90 elements in sum",
                                      "error_id": 2})
 
+    relevance = None
+    if search_mode == "fulltext" and len(name) > 0 and sql_search.fulltext_available("mods"):
+        relevance = sql_search.mods_relevance(name)
+    relevance_sort = relevance is not None and sort.removeprefix("i") == "RELEVANCE"
+
+    after = None
+    if cursor:
+        # Курсор по релевантности не поддерживается (оценка не хранится в таблице)
+        after = None if relevance_sort else tools.decode_cursor(cursor, sort)
+        if after is None:
+            return JSONResponse(status_code=400, content={"message": "incorrect cursor", "error_id": 3})
+
+    if any(facet not in MOD_FACETS for facet in facets):
+        return JSONResponse(status_code=400, content={"message": "unknown facet", "error_id": 4})
+
     want_not_public = show_not_public and user > 0
     if want_not_public:
         if user <= 0:
@@ -350,7 +432,7 @@ async def mod_list(
             return PlainTextResponse(status_code=401, content="Недействительный ключ сессии!")
 
         if req_user_id != user:
-            session_account = sessionmaker(bind=account.engine)()
+            session_account = request_session(account.engine)
             user_req = session_account.query(account.Account.admin).filter_by(id=req_user_id).first()
             session_account.close()
 
@@ -358,7 +440,7 @@ async def mod_list(
                 return PlainTextResponse(status_code=403, content="Заблокировано!")
 
     # Создание сессии
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
 
     # Выполнение запроса
     query = session.query(catalog.Mod.id)
@@ -371,53 +453,98 @@ async def mod_list(
     if general:
         query = query.add_columns(catalog.Mod.name, catalog.Mod.size, catalog.Mod.source, catalog.Mod.source_id, catalog.Mod.downloads)
 
-    query = query.order_by(tools.sort_mods(sort))
-    query = query.filter(catalog.Mod.condition == 0)
+    # id - уникальный тай-брейк, без него keyset-курсор может пропускать или дублировать моды
+    sort_column, sort_descending = tools.mod_sort_key(sort)
+    query = query.add_columns(sort_column.label("cursor_value"))
+    if relevance_sort:
+        query = query.order_by(desc(relevance), catalog.Mod.id)
+    else:
+        query = query.order_by(tools.sort_mods(sort), desc(catalog.Mod.id) if sort_descending else catalog.Mod.id)
     only_publics = not want_not_public
-    if only_publics:
-        query = query.filter(catalog.Mod.public == 0)
 
-    # Фильтрация по конкретным ID
-    if len(allowed_ids) > 0:
-        query = query.filter(catalog.Mod.id.in_(allowed_ids))
+    def apply_filters(query, skip: frozenset = frozenset()):
+        # skip - фасеты считаются без собственного фильтра, иначе видны только уже выбранные значения
+        query = query.filter(catalog.Mod.condition == 0)
+        if only_publics:
+            query = query.filter(catalog.Mod.public == 0)
+
+        # Фильтрация по конкретным ID
+        if len(allowed_ids) > 0:
+            query = query.filter(catalog.Mod.id.in_(allowed_ids))
 
-    # Фильтрация по играм
-    if game > 0:
-        query = query.filter(catalog.Mod.game == game)
+        # Фильтрация по играм
+        if game > 0 and "games" not in skip:
+            query = query.filter(catalog.Mod.game == game)
 
-    # Фильтрация по первоисточникам
-    if len(primary_sources) > 0:
-        query = query.filter(catalog.Mod.source.in_(primary_sources))
-        if len(allowed_sources_ids) > 0:
-            query = query.filter(catalog.Mod.source_id.in_(allowed_sources_ids))
+        # Фильтрация по первоисточникам
+        if len(primary_sources) > 0 and "sources" not in skip:
+            query = query.filter(catalog.Mod.source.in_(primary_sources))
+            if len(allowed_sources_ids) > 0:
+                query = query.filter(catalog.Mod.source_id.in_(allowed_sources_ids))
 
-    if independents:
-        query = query.outerjoin(catalog.mods_dependencies, catalog.Mod.id == catalog.mods_dependencies.c.mod_id).filter(
-            catalog.mods_dependencies.c.mod_id == None)
+        if independents:
+            query = query.outerjoin(catalog.mods_dependencies, catalog.Mod.id == catalog.mods_dependencies.c.mod_id).filter(
+                catalog.mods_dependencies.c.mod_id == None)
 
-    # Фильтрация по имени
-    if len(name) > 0:
-        print(len(name))
-        query = query.filter(catalog.Mod.name.ilike(f'%{name}%'))
+        # Фильтрация по имени
+        if relevance is not None:
+            query = query.filter(relevance > 0)
+        elif len(name) > 0:
+            query = query.filter(catalog.Mod.name.ilike(f'%{name}%'))
 
-    # Фильтрация по тегам
-    if len(tags) > 0:
-        for tag in tags:
-            query = query.filter(catalog.Mod.tags.any(catalog.Tag.id == tag))
+        # Фильтрация по тегам (мод должен иметь все переданные теги)
+        if len(tags) > 0:
+            query = query.filter(catalog.Mod.id.in_(tools.mods_with_all_tags(tags)))
 
-    # Сортировка по пользователю
-    if user > 0:
-        query = query.join(account.mod_and_author, account.mod_and_author.c.mod_id == catalog.Mod.id)
-        query = query.filter(account.mod_and_author.c.user_id == user)
+        # Сортировка по пользователю
+        if user > 0:
+            query = query.join(account.mod_and_author, account.mod_and_author.c.mod_id == catalog.Mod.id)
+            query = query.filter(account.mod_and_author.c.user_id == user)
 
-        if user_owner in [0, 1]:
-            query = query.filter(account.mod_and_author.c.owner == (user_owner == 0))
+            if user_owner in [0, 1]:
+                query = query.filter(account.mod_and_author.c.owner == (user_owner == 0))
 
+        return query
 
-    mods_count = query.count()
+    query = apply_filters(query)
 
-    offset = page_size * page
-    mods = query.offset(offset).limit(page_size).all()
+    filters_key = dict(
+        tags=tags, game=game, allowed_ids=allowed_ids, independents=independents,
+        primary_sources=primary_sources, allowed_sources_ids=allowed_sources_ids, name=name,
+        search_mode=search_mode if relevance is not None else "like",
+        user=user, user_owner=user_owner, only_publics=only_publics,
+    )
+    mods_count = counts.listing_count(
+        key=counts.count_key("mods", **filters_key),
+        mode=count,
+        exact=query.count,
+    )
+
+    facets_output = {}
+    for facet in facets:
+        # Один сгруппированный запрос на фасет, без сортировки и пагинации основного списка
+        group_column = MOD_FACETS[facet]
+        facet_query = session.query(group_column, func.count(func.distinct(catalog.Mod.id)))
+        if facet == "tags":
+            facet_query = facet_query.join(catalog.mods_tags, catalog.mods_tags.c.mod_id == catalog.Mod.id)
+        facet_query = apply_filters(facet_query, skip=frozenset({facet})).group_by(group_column)
+
+        facets_output[facet] = counts.facet_counts(
+            key=counts.count_key("mods", facet=facet, **filters_key),
+            mode=count,
+            compute=lambda: {value: amount for value, amount in facet_query.all() if value is not None},
+        )
+
+    if after is not None:
+        offset = None
+        mods = query.filter(tools.keyset_after(sort_column, sort_descending, *after)).limit(page_size).all()
+    else:
+        offset = page_size * page
+        mods = query.offset(offset).limit(page_size).all()
+
+    next_cursor = None
+    if len(mods) == page_size and not relevance_sort:
+        next_cursor = tools.encode_cursor(sort, mods[-1].cursor_value, mods[-1].id)
 
     session.close()
 
@@ -452,10 +579,14 @@ async def mod_list(
                 append_mod()
             else:
                 output_mods.append("Access denied (hide info)")
-                mods_count -= 1
+                if mods_count is not None:
+                    mods_count -= 1
 
     # Вывод результатов
-    return {"database_size": mods_count, "offset": offset, "results": output_mods}
+    output = {"database_size": mods_count, "offset": offset, "next_cursor": next_cursor, "results": output_mods}
+    if facets:
+        output["facets"] = facets_output
+    return conditional_json(request, output, response=response, shared=only_publics)
 
 
 @router.get(
@@ -569,7 +700,7 @@ async def info_mod(
     output = {}
 
     # Создание сессии
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
 
     # Выполнение запроса
     query = session.query(catalog.Mod.condition)
@@ -613,33 +744,17 @@ async def info_mod(
     # Закрытие сессии
     session.close()
 
-    output["result"] = {"condition": output["pre_result"].condition}
-    if description:
-        output["result"]["description"] = output["pre_result"].description
-    if short_description:
-        output["result"]["short_description"] = output["pre_result"].short_description
-    if dates:
-        strformattime = "%Y-%m-%dT%H:%M:%S"
-        
-        output["result"]["date_update_file"] = output["pre_result"].date_update_file.strftime(strformattime)
-        output["result"]["date_edit"] = output["pre_result"].date_edit.strftime(strformattime)
-        output["result"]["date_creation"] = output["pre_result"].date_creation.strftime(strformattime)
-    if general:
-        output["result"]["name"] = output["pre_result"].name
-        output["result"]["size"] = output["pre_result"].size
-        output["result"]["source"] = output["pre_result"].source
-        output["result"]["source_id"] = output["pre_result"].source_id
-        output["result"]["downloads"] = output["pre_result"].downloads
-        output["result"]["public"] = output["pre_result"].public
+    output["result"] = mod_info_result(output["pre_result"], description, short_description, dates, general)
     if game:
         output["result"]["game"] = output["game"]
         del output["game"]
+    public = output["pre_result"].public
     del output["pre_result"]
 
 
     if authors:
         # Создание сессии
-        session_account = sessionmaker(bind=account.engine)()
+        session_account = request_session(account.engine)
 
         # Исполнение
         row = session_account.query(account.mod_and_author).filter_by(mod_id=mod_id)
@@ -654,7 +769,153 @@ async def info_mod(
         session_account.close()
 
     statistics.update("mod", mod_id, "page_view")
-    return JSONResponse(status_code=200, content=output)
+    return conditional_json(request, output, response=response, shared=public < 2)
+
+
+@router.get(
+    MAIN_URL+"/list/mods/info/{ids_array}",
+    tags=["Mod"],
+    summary="Информация о нескольких модах",
+    status_code=200,
+    responses={
+        200: {
+            "description": "Словарь `ID мода: информация` *(как у `/mods/{mod_id}`)*. Вместо информации - строка, если мод не найден или нет доступа.",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "1": {
+                            "dependencies": [2, 3],
+                            "dependencies_count": 2,
+                            "authors": {1: {"owner": True}},
+                            "result": {
+                                "condition": 0,
+                                "name": "Some name",
+                                "size": 123456789,
+                                "source": "local",
+                                "source_id": None,
+                                "downloads": 42,
+                                "public": 0,
+                                "game": {"id": 1, "name": "game"}
+                            }
+                        },
+                        "2": "Access denied (hide info)",
+                        "3": "Mod not found."
+                    }
+                }
+            }
+        },
+        400: {
+            "description": "В массиве есть элементы, не являющиеся целочисленными ID",
+            "content": {
+                "text/plain": {
+                    "example": "the array must contain only integer IDs"
+                }
+            }
+        },
+        413: {
+            "description": "Слишком большой массив ID модов",
+            "content": {
+                "text/plain": {
+                    "example": "the size of the array is not correct"
+                }
+            }
+        }
+    }
+)
+async def info_mods(
+    response: Response,
+    request: Request,
+    ids_array = Path(description="Массив ID модов (максимум 50 штук)"),
+    dependencies: bool = Query(False, description="Передать ли списки зависимостей."),
+    short_description: bool = Query(False, description="Передать ли краткие описания модов."),
+    description: bool = Query(False, description="Передать ли описания модов."),
+    dates: bool = Query(False, description="Передать ли даты обновления и создания модов."),
+    general: bool = Query(True, description="Передать ли основные данные о модах."),
+    game: bool = Query(False, description="Передать ли информацию о играх модов."),
+    authors: bool = Query(False, description="Передать ли списки авторов модов."),
+):
+    """
+    Пакетный вариант `/mods/{mod_id}` для страницы модов: каждая связь (зависимости, игры, авторы)
+    читается одним `IN`-запросом на все моды, доступ к скрытым модам проверяется одним вызовом,
+    просмотры записываются в статистику одной транзакцией.
+    """
+    ids_array = tools.str_to_list(ids_array)
+    if not all(type(mod_id) is int for mod_id in ids_array):
+        return PlainTextResponse(status_code=400, content="the array must contain only integer IDs")
+    ids_array = list(dict.fromkeys(ids_array))
+
+    if len(ids_array) < LIMITS.mod.public_ids_min or len(ids_array) > LIMITS.mod.public_ids_max:
+        return PlainTextResponse(status_code=413, content="the size of the array is not correct")
+
+    # Аккаунты и каталог в одной БД - в рамках запроса это одна сессия (см. sql_logic/sql_session.py)
+    with db_session(catalog.engine) as session:
+        query = session.query(catalog.Mod.id, catalog.Mod.condition, catalog.Mod.public)
+        if description:
+            query = query.add_columns(catalog.Mod.description)
+        if short_description:
+            query = query.add_column(catalog.Mod.short_description)
+        if dates:
+            query = query.add_columns(catalog.Mod.date_update_file, catalog.Mod.date_creation, catalog.Mod.date_edit)
+        if general:
+            query = query.add_columns(catalog.Mod.name, catalog.Mod.size, catalog.Mod.source, catalog.Mod.source_id, catalog.Mod.downloads)
+        if game:
+            query = query.add_columns(catalog.Mod.game)
+
+        rows = {row.id: row for row in query.filter(catalog.Mod.id.in_(ids_array)).all()}
+
+        # Скрытые моды (public >= 2) - одна проверка доступа на все
+        hidden_ids = [mod_id for mod_id, row in rows.items() if row.public >= 2]
+        allowed_hidden = []
+        if hidden_ids:
+            access_result = await account.check_access(request=request, response=response)
+            uid = access_result.get("owner_id", -1) if access_result else -1
+            allowed_hidden = await tools.anonymous_access_mods(user_id=uid, mods_ids=hidden_ids, check_mode=True)
+
+        visible_ids = [mod_id for mod_id, row in rows.items() if row.public < 2 or mod_id in allowed_hidden]
+
+        dependencies_by_mod = {mod_id: [] for mod_id in visible_ids}
+        if dependencies and visible_ids:
+            query = session.query(catalog.mods_dependencies.c.mod_id, catalog.mods_dependencies.c.dependence)
+            for mod_id, dependence in query.filter(catalog.mods_dependencies.c.mod_id.in_(visible_ids)):
+                dependencies_by_mod[mod_id].append(dependence)
+
+        games_names = {}
+        if game and visible_ids:
+            games_ids = {rows[mod_id].game for mod_id in visible_ids}
+            query = session.query(catalog.Game.id, catalog.Game.name).filter(catalog.Game.id.in_(games_ids))
+            games_names = {row.id: row.name for row in query}
+
+        authors_by_mod = {mod_id: {} for mod_id in visible_ids}
+        if authors and visible_ids:
+            query = session.query(account.mod_and_author).filter(account.mod_and_author.c.mod_id.in_(visible_ids))
+            for row in query:
+                if len(authors_by_mod[row.mod_id]) < 100:
+                    authors_by_mod[row.mod_id][row.user_id] = {"owner": row.owner}
+
+    output = {}
+    for mod_id in ids_array:
+        row = rows.get(mod_id)
+        if row is None:
+            output[mod_id] = "Mod not found."
+            continue
+        if mod_id not in visible_ids:
+            output[mod_id] = "Access denied (hide info)"
+            continue
+
+        out = {}
+        if dependencies:
+            out["dependencies"] = dependencies_by_mod[mod_id][:100]
+            out["dependencies_count"] = len(dependencies_by_mod[mod_id])
+        out["result"] = mod_info_result(row, description, short_description, dates, general)
+        if game:
+            out["result"]["game"] = {"id": row.game, "name": games_names.get(row.game)}
+        if authors:
+            out["authors"] = authors_by_mod[mod_id]
+        output[mod_id] = out
+
+    if visible_ids:
+        statistics.update_many("mod", visible_ids, "page_view")
+    return conditional_json(request, output, response=response, shared=not hidden_ids)
 
 
 @router.get(
@@ -679,6 +940,7 @@ async def mod_resources(
     page: int = Query(0, description="Номер страницы. Не должна быть отрицательной."),
     types_resources = Query([], description="Фильтрация по типу ресурсов *(массив типов)*.", examples={"example": {"value": "[\"logo\", \"screenshot\"]"}}),
     only_urls: bool = Query(False, description="Возвращать только ссылки или полную информацию."),
+    count: counts.CountMode = Query("exact", description="Подсчет `database_size`: `exact` - точный подсчет, `approx` - из кеша, если есть *(может немного отставать)*, `none` - не считать *(`null`)*."),
 ):
     resources_list_id = tools.str_to_list(resources_list_id)
     types_resources = tools.str_to_list(types_resources)
@@ -690,7 +952,7 @@ async def mod_resources(
     elif page < 0:
         return JSONResponse(status_code=413, content={"message": "incorrect page", "error_id": 3})
 
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
     mod_exists = session.query(catalog.Mod.id).filter_by(id=mod_id).first()
     session.close()
     if not mod_exists:
@@ -700,7 +962,7 @@ async def mod_resources(
     if access_result != True:
         return access_result
 
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
     query = session.query(catalog.Resource)
     query = query.filter_by(owner_type="mods", owner_id=mod_id)
     if len(resources_list_id) > 0:
@@ -708,13 +970,17 @@ async def mod_resources(
     if len(types_resources) > 0:
         query = query.filter(catalog.Resource.type.in_(types_resources))
 
-    resources_count = query.count()
+    resources_count = counts.listing_count(
+        key=counts.count_key("resources", owner_type="mods", owner_ids=[mod_id], resources_list_id=resources_list_id, types_resources=types_resources),
+        mode=count,
+        exact=query.count,
+    )
     offset = page_size * page
     resources = query.offset(offset).limit(page_size).all()
     session.close()
 
     real_resources = await tools.resources_serialize(resources=resources, only_urls=only_urls)
-    return {"database_size": resources_count, "offset": offset, "results": real_resources}
+    return FastJSONResponse(content={"database_size": resources_count, "offset": offset, "results": real_resources}, response=response)
 
 
 @router.get(
@@ -735,7 +1001,7 @@ async def mod_tags(
     mod_id: int = Path(description="ID мода"),
     only_ids: bool = Query(False, description="Если True вернет только ID тегов."),
 ):
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
     mod_exists = session.query(catalog.Mod.id).filter_by(id=mod_id).first()
     session.close()
     if not mod_exists:
@@ -745,15 +1011,15 @@ async def mod_tags(
     if access_result != True:
         return access_result
 
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
     query = session.query(catalog.Tag).join(catalog.mods_tags)
     query = query.filter(catalog.mods_tags.c.mod_id == mod_id)
     tags = query.all()
     session.close()
 
     if only_ids:
-        return [tag.id for tag in tags]
-    return [{"id": tag.id, "name": tag.name} for tag in tags]
+        return FastJSONResponse(content=[tag.id for tag in tags], response=response)
+    return FastJSONResponse(content=[{"id": tag.id, "name": tag.name} for tag in tags], response=response)
 
 
 @router.get(
@@ -773,7 +1039,7 @@ async def mod_dependencies(
     request: Request,
     mod_id: int = Path(description="ID мода"),
 ):
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
     mod_exists = session.query(catalog.Mod.id).filter_by(id=mod_id).first()
     session.close()
     if not mod_exists:
@@ -783,7 +1049,7 @@ async def mod_dependencies(
     if access_result != True:
         return access_result
 
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
     query = session.query(catalog.mods_dependencies.c.dependence)
     query = query.filter(catalog.mods_dependencies.c.mod_id == mod_id)
     dependencies = [row[0] for row in query.all()]
@@ -794,6 +1060,7 @@ async def mod_dependencies(
 
 @router.post(
     MAIN_URL+"/mods",
+    dependencies=[Depends(catalog_changes("mods"))],
     tags=["Mod"],
     summary="Добавление мода",
     status_code=201,
@@ -816,6 +1083,7 @@ async def mod_dependencies(
 )
 @router.post(
     MAIN_URL+"/add/mod", 
+    dependencies=[Depends(catalog_changes("mods"))],
     tags=["Mod"],
     summary="Добавление мода",
     status_code=201,
@@ -867,24 +1135,24 @@ async def add_mod(
         elif not await tools.check_game_exists(mod_game):
             return PlainTextResponse(status_code=412, content="Такой игры не существует!")
 
-        # Выполнение запроса
-        session = sessionmaker(bind=account.engine)()
-        user_req = session.query(account.Account).filter_by(id=user_id).first()
+        # Аккаунты и каталог в одной БД - в рамках запроса это одна сессия (см. sql_logic/sql_session.py)
+        with db_session(catalog.engine) as session:
+            user_req = session.query(account.Account).filter_by(id=user_id).first()
 
-        async def mini():
-            if user_req.admin:
-                return True
-            else:
-                if without_author:
-                    return False
-                elif user_req.mute_until and user_req.mute_until > datetime.now():
-                    return False
-                elif user_req.publish_mods:
+            def mini():
+                if user_req.admin:
                     return True
-            return False
+                else:
+                    if without_author:
+                        return False
+                    elif user_req.mute_until and user_req.mute_until > datetime.now():
+                        return False
+                    elif user_req.publish_mods:
+                        return True
+                return False
 
-        if await mini():
-            session.close()
+            if not mini():
+                return JSONResponse(status_code=403, content="Заблокировано!")
 
             if mod_file.size >= LIMITS.mod.file_max_bytes:
                 return JSONResponse(status_code=413, content="The file is too large.")
@@ -895,8 +1163,6 @@ async def add_mod(
             if mod_public not in [0, 1, 2]:
                 mod_public = 0
 
-            Session = sessionmaker(bind=catalog.engine)
-            session = Session()
             # Create the insert statement
             insert_statement = insert(catalog.Mod)
             insert_statement = insert_statement.values(
@@ -918,20 +1184,15 @@ async def add_mod(
             if mod_source_id > 0 and mod_source != 'local':
                 insert_statement = insert_statement.values(source_id=mod_source_id)
 
-                tsession = sessionmaker(bind=catalog.engine)()
-                result = tsession.query(catalog.Mod).filter_by(source=mod_source, source_id=mod_source_id).first()
-                tsession.close()
+                result = session.query(catalog.Mod).filter_by(source=mod_source, source_id=mod_source_id).first()
                 if result:
                     return PlainTextResponse(status_code=412, content="Такая source-связка уже существует!")
 
             result = session.execute(insert_statement)
             rid = result.lastrowid  # Получаем ID последней вставленной строки
 
-            session.commit()
-
             # Указываем авторство, если пользователь не запросил обратного
             if not without_author:
-                session = sessionmaker(bind=account.engine)()
                 session.execute(
                     account.mod_and_author.insert().values(
                         mod_id=rid, 
@@ -939,42 +1200,35 @@ async def add_mod(
                         owner=True
                     )
                 )
-                session.commit()
 
-            session.close()
+            # commit возвращает соединение в пул на время загрузки файла
+            session.commit()
 
             file_ext = mod_file.filename.split(".")[-1]
             result_upload_code, result_content, result_upload = await tools.storage_file_upload(type="archive", path=f"mods/{rid}/main.{file_ext}", file=real_mod_file)
 
-            session = Session()
             if result_upload != False:
                 session.query(catalog.Mod).filter_by(id=rid).update({"condition": 0})
                 session.query(catalog.Game).filter_by(id=mod_game).update({
                     catalog.Game.mods_count: func.coalesce(catalog.Game.mods_count, 0) + 1
                 })
+                record_change(session, "mods", rid)
                 session.commit()
+                await autocomplete.refresh("mods", [rid])
 
-                session.close()
                 return JSONResponse(status_code=201, content=rid)  # Возвращаем значение `id`
             else:
                 session.query(catalog.Mod).filter_by(id=rid).delete()
-                session.commit()
-                session.close()
-
-                session = sessionmaker(bind=account.engine)()
                 session.query(account.mod_and_author).filter_by(mod_id=rid).delete()
                 session.commit()
-                session.close()
 
                 return JSONResponse(status_code=result_upload_code, content=f"Не удалось загрузить файл! {result_content}")
-        else:
-            session.close()
-            return JSONResponse(status_code=403, content="Заблокировано!")
     else:
         return JSONResponse(status_code=401, content="Недействительный ключ сессии!")
 
 @router.post(
     MAIN_URL+"/edit/mod",
+    dependencies=[Depends(catalog_changes("mods"))],
     tags=["Mod"],
     summary="Редактирование мода",
     status_code=201,
@@ -1025,7 +1279,7 @@ async def edit_mod(
             else:
                 body["source_id"] = None
             
-            session = sessionmaker(bind=catalog.engine)()
+            session = request_session(catalog.engine)
             result = session.query(catalog.Mod).filter_by(source=mod_source, source_id=body["source_id"]).first()
             session.close()
             if result:
@@ -1059,16 +1313,19 @@ async def edit_mod(
             if result_file_status == False:
                 return PlainTextResponse(status_code=result_file_update_code, content=f"Не удалось обновить файл! {result_file_update}")
                 
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
         session.query(catalog.Mod).filter_by(id=mod_id).update(body)
+        record_change(session, "mods", mod_id)
         session.commit()
         session.close()
+        await autocomplete.refresh("mods", [mod_id])
         return PlainTextResponse(status_code=201, content="OK")
     else:
         return access_result
 
 @router.patch(
     MAIN_URL+"/mods/{mod_id}",
+    dependencies=[Depends(catalog_changes("mods"))],
     tags=["Mod"],
     summary="Редактирование мода",
     status_code=201,
@@ -1112,6 +1369,7 @@ async def edit_mod_rest(
 
 @router.post(
     MAIN_URL+"/edit/mod/authors",
+    dependencies=[Depends(catalog_changes("mods"))],
     tags=["Mod"],
     summary="Редактирование авторов мода",
     status_code=202,
@@ -1133,8 +1391,7 @@ async def edit_authors_mod(
 
     if access_result and access_result.get("owner_id", -1) >= 0:
         # Создание сессии
-        Session = sessionmaker(bind=account.engine)
-        session = Session()
+        session = request_session(account.engine)
 
         req_user_id = access_result.get("owner_id", -1)
         user_req = session.query(account.Account).filter_by(id=req_user_id).first()
@@ -1181,12 +1438,14 @@ async def edit_authors_mod(
                         mod_id=mod_id
                     )
                     session.execute(insert_statement)
+                record_change(session, "mods", mod_id)
                 session.commit()
             else:
                 delete_member = account.mod_and_author.delete().where(account.mod_and_author.c.mod_id == mod_id,
                                                                       account.mod_and_author.c.user_id == author)
                 # Выполнение операции DELETE
                 session.execute(delete_member)
+                record_change(session, "mods", mod_id)
                 session.commit()
 
             session.close()
@@ -1199,6 +1458,7 @@ async def edit_authors_mod(
 
 @router.delete(
     MAIN_URL+"/delete/mod",
+    dependencies=[Depends(catalog_changes("mods"))],
     tags=["Mod"],
     summary="Удаление мода",
     status_code=200,
@@ -1226,16 +1486,13 @@ async def delete_mod(
     if not access_result or access_result.get("owner_id", -1) < 0:
         return PlainTextResponse(status_code=401, content="Недействительный ключ сессии!")
 
-    # Создание сессии для аккаунтов
-    Session = sessionmaker(bind=account.engine)
-    session = Session()
-
-    try:
+    # Аккаунты и каталог в одной БД - в рамках запроса это одна сессия (см. sql_logic/sql_session.py)
+    with db_session(catalog.engine) as session:
         user_req = session.query(account.Account).filter_by(id=access_result.get("owner_id")).first()
         if not user_req:
             return PlainTextResponse(status_code=403, content="Пользователь не найден!")
 
-        async def mini():
+        def mini():
             if user_req.admin:
                 return True
             if user_req.mute_until and user_req.mute_until > datetime.now():
@@ -1252,40 +1509,38 @@ async def delete_mod(
 
             return False
 
-        if not await mini():
+        if not mini():
             return PlainTextResponse(status_code=403, content="Заблокировано!")
-    finally:
-        session.close()
-
-    # Удаление ресурсов
-    resource_delete_result = await tools.delete_resources(owner_type="mods", owner_id=mod_id)
-    storage_delete_result = await tools.storage_file_delete(type="mods", path=f"mods/{mod_id}/main.zip")
 
-    if not (resource_delete_result and storage_delete_result):
-        return PlainTextResponse(status_code=500, content="Не удалось удалить мод!")
-
-    # Создание сессии для базы модов
-    session = sessionmaker(bind=catalog.engine)()
-    try:
         mod_obj = session.query(catalog.Mod).filter_by(id=mod_id).first()
         if not mod_obj:
             return PlainTextResponse(status_code=404, content="Мод не найден")
 
         game_id = mod_obj.game
+        # Не держим соединение, пока удаляются файлы в storage
+        session.rollback()
+
+        # Удаление ресурсов
+        resource_delete_result = await tools.delete_resources(owner_type="mods", owner_id=mod_id)
+        # Файлы ресурсов уже удалены из storage - их записи фиксируем сразу, даже если мод удалить не выйдет
+        session.commit()
+        storage_delete_result = await tools.storage_file_delete(type="mods", path=f"mods/{mod_id}/main.zip")
+
+        if not (resource_delete_result and storage_delete_result):
+            return PlainTextResponse(status_code=500, content="Не удалось удалить мод!")
 
         # Удаление записей
         session.query(catalog.Mod).filter_by(id=mod_id).delete()
         session.query(catalog.mods_dependencies).filter_by(mod_id=mod_id).delete()
         session.query(catalog.mods_tags).filter_by(mod_id=mod_id).delete()
-        session.commit()
 
         # Обновление количества модов в игре
         session.query(catalog.Game).filter_by(id=game_id).update({
             catalog.Game.mods_count: catalog.Game.mods_count - 1
         })
+        record_change(session, "mods", mod_id, "delete")
         session.commit()
 
-    finally:
-        session.close()
+    await autocomplete.refresh("mods", [mod_id])
 
     return PlainTextResponse(status_code=200, content="Удалено")
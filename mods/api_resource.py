@@ -1,14 +1,18 @@
-from fastapi import APIRouter, Request, Response, Form, Query, Path, UploadFile, File
+from fastapi import APIRouter, Request, Response, Form, Query, Path, UploadFile, File, Depends
 from fastapi.responses import JSONResponse, PlainTextResponse
 import tools
 import io
 from sql_logic import sql_catalog as catalog
 from sqlalchemy import insert
-from sqlalchemy.orm import sessionmaker
+from sql_logic.sql_session import request_session
 from ow_config import MAIN_URL
 from limits import LIMITS
 from datetime import datetime
 import standarts
+from caching.invalidation import catalog_changes
+from caching import counts
+from fast_json import FastJSONResponse
+from sql_logic.sql_changes import record_change
 
 
 router = APIRouter()
@@ -48,6 +52,7 @@ async def list_resources_rest(
     page: int = Query(0, description="Номер страницы. Не должна быть отрицательной."),
     types_resources = Query([], description="Фильтрация по типу ресурсов *(массив типов)*.", example='[\"logo\", \"screenshot\"]'),
     only_urls: bool = Query(False, description="Возвращать только ссылки или полную информацию."),
+    count: counts.CountMode = Query("exact", description="Подсчет `database_size`: `exact` - точный подсчет, `approx` - из кеша, если есть *(может немного отставать)*, `none` - не считать *(`null`)*."),
 ):
     owner_ids_value = owner_ids
     if owner_ids_value is None and owner_id is not None:
@@ -66,11 +71,13 @@ async def list_resources_rest(
         page=page,
         types_resources=types_resources,
         only_urls=only_urls,
+        count=count,
     )
 
 
 @router.post(
     MAIN_URL+"/resources",
+    dependencies=[Depends(catalog_changes("resources"))],
     tags=["Resource"],
     summary="Добавление ресурса",
     status_code=202,
@@ -108,6 +115,7 @@ async def add_resource_rest(
 
 @router.patch(
     MAIN_URL+"/resources/{resource_id}",
+    dependencies=[Depends(catalog_changes("resources"))],
     tags=["Resource"],
     summary="Редактирование ресурса",
     status_code=202,
@@ -141,6 +149,7 @@ async def edit_resource_rest(
 
 @router.delete(
     MAIN_URL+"/resources/{resource_id}",
+    dependencies=[Depends(catalog_changes("resources"))],
     tags=["Resource"],
     summary="Удаление ресурса",
     status_code=200,
@@ -158,7 +167,7 @@ async def delete_resource_rest(
     request: Request,
     resource_id: int = Path(description="ID ресурса для удаления."),
 ):
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
     resource = session.query(catalog.Resource).filter_by(id=resource_id).first()
     session.close()
 
@@ -182,6 +191,7 @@ async def delete_resource_rest(
         return access_result
 
     if await tools.delete_resources(owner_type=resource.owner_type, resources_ids=[resource_id]):
+        request_session(catalog.engine).commit()
         return PlainTextResponse(status_code=200, content="Complite!")
     return PlainTextResponse(status_code=500, content="Unknown error")
 
@@ -245,6 +255,7 @@ async def list_resources(
     page: int = Query(0, description="Номер страницы. Не должна быть отрицательной."),
     types_resources = Query([], description="Фильтрация по типу ресурсов *(массив типов)*.", example='["logo", "screenshot"]'),
     only_urls: bool = Query(False, description="Возвращать только ссылки или полную информацию."),
+    count: counts.CountMode = Query("exact", description="Подсчет `database_size`: `exact` - точный подсчет, `approx` - из кеша, если есть *(может немного отставать)*, `none` - не считать *(`null`)*."),
 ):
     """
     Возвращает список ресурсов. Фильтрационные списки не должны быть суммарно > 120 элементов.
@@ -266,7 +277,7 @@ async def list_resources(
         return JSONResponse(status_code=413, content={"message": "incorrect page", "error_id": 3})
 
     # Создание сессии
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
 
     # Выполнение запроса
     query = session.query(catalog.Resource)
@@ -277,12 +288,16 @@ async def list_resources(
     if len(types_resources) > 0:
         query = query.filter(catalog.Resource.type.in_(types_resources))
 
-    resources_count = query.count()
+    resources_count = counts.listing_count(
+        key=counts.count_key("resources", owner_type=owner_type, owner_ids=owner_ids, resources_list_id=resources_list_id, types_resources=types_resources),
+        mode=count,
+        exact=query.count,
+    )
     offset = page_size * page
     resources = query.offset(offset).limit(page_size).all()
 
     # Проверка правомерности
-    if resources_count > 0:
+    if len(resources) > 0:
         mods_ids_check = [ i.owner_id for i in resources ]
 
         query = session.query(catalog.Mod.id)
@@ -298,11 +313,12 @@ async def list_resources(
 
     # Возврат успешного результата
     session.close()
-    return {"database_size": resources_count, "offset": offset, "results": real_resources}
+    return FastJSONResponse(content={"database_size": resources_count, "offset": offset, "results": real_resources}, response=response)
 
 
 @router.post(
     MAIN_URL+"/add/resource/{owner_type}",
+    dependencies=[Depends(catalog_changes("resources"))],
     tags=["Resource"],
     summary="Добавление ресурса",
     status_code=202,
@@ -365,7 +381,7 @@ async def add_resource(
         elif len(resource_url) > LIMITS.resource.url_max or not resource_url.startswith('http'):
             return PlainTextResponse(status_code=400, content='Incorrect URL')
 
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
 
         insert_statement = insert(catalog.Resource).values(
             type=resource_type,
@@ -378,6 +394,7 @@ async def add_resource(
         result = session.execute(insert_statement)
         id = result.lastrowid  # Получаем ID последней вставленной строки
 
+        record_change(session, "resources", id)
         session.commit()
         session.close()
 
@@ -387,6 +404,7 @@ async def add_resource(
 
 @router.post(
     MAIN_URL+"/edit/resource",
+    dependencies=[Depends(catalog_changes("resources"))],
     tags=["Resource"],
     summary="Редактирование ресурса",
     status_code=202,
@@ -408,7 +426,7 @@ async def edit_resource(
     resource_url: str = Form(None, description="URL ресурса.", min_length=LIMITS.resource.url_min, max_length=LIMITS.resource.url_max),
     resource_file: UploadFile = File(None, description="Файл ресурса *(приоритетней `resource_url`)*.")
 ):
-    session = sessionmaker(bind=catalog.engine)()
+    session = request_session(catalog.engine)
 
     resource = session.query(catalog.Resource).filter_by(id=resource_id)
     got_resource = resource.first()
@@ -464,6 +482,7 @@ async def edit_resource(
 
         # Меняем данные в БД
         resource.update(data_edit)
+        record_change(session, "resources", resource_id)
         session.commit()
 
         session.close()
@@ -474,6 +493,7 @@ async def edit_resource(
 
 @router.delete(
     MAIN_URL+"/delete/resource/{owner_type}",
+    dependencies=[Depends(catalog_changes("resources"))],
     tags=["Resource"],
     summary="Удаление ресурса",
     status_code=200,
@@ -495,7 +515,7 @@ async def delete_resource(
     if owner_type not in ['mods', 'games']:
         return PlainTextResponse(status_code=405, content="unknown owner_type")
     elif owner_type == 'mods':
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
         query = session.query(catalog.Resource)
         query = query.filter_by(owner_type=owner_type, owner_id=resource_id).first()
         session.close()
@@ -510,6 +530,7 @@ async def delete_resource(
 
     if access_result == True:
         if await tools.delete_resources(owner_type=owner_type, resources_ids=[resource_id]):
+            request_session(catalog.engine).commit()
             return PlainTextResponse(status_code=200, content="Complite!")
         else:
             return PlainTextResponse(status_code=500, content="Unknown error")
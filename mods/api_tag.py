@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Request, Response, Form, Query, Path
+from fastapi import APIRouter, Request, Response, Form, Query, Path, Depends
 from fastapi.responses import JSONResponse, PlainTextResponse
 import tools
 from sql_logic import sql_account as account
 from sql_logic import sql_catalog as catalog
-from sqlalchemy.orm import sessionmaker
+from sql_logic.sql_session import request_session
 from sqlalchemy import insert, delete
 from ow_config import MAIN_URL
 from limits import LIMITS
 import standarts
+from caching.invalidation import catalog_changes
+from caching import autocomplete
+from sql_logic.sql_changes import record_change
 
 
 router = APIRouter()
@@ -15,6 +18,7 @@ router = APIRouter()
 
 @router.post(
     MAIN_URL+"/add/tag",
+    dependencies=[Depends(catalog_changes("tags"))],
     tags=["Tag"],
     summary="Добавление тега",
     status_code=202,
@@ -39,7 +43,7 @@ async def add_tag(
     access_result = await tools.access_admin(response=response, request=request)
 
     if access_result == True:
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
 
         insert_statement = insert(catalog.Tag).values(
             name=tag_name
@@ -48,8 +52,10 @@ async def add_tag(
         result = session.execute(insert_statement)
         id = result.lastrowid  # Получаем ID последней вставленной строки
 
+        record_change(session, "tags", id)
         session.commit()
         session.close()
+        await autocomplete.refresh("tags", [id])
 
         return JSONResponse(status_code=202, content=id)  # Возвращаем значение `id`
     else:
@@ -57,6 +63,7 @@ async def add_tag(
 
 @router.post(
     MAIN_URL+"/edit/tag",
+    dependencies=[Depends(catalog_changes("tags"))],
     tags=["Tag"],
     summary="Редактирование тега",
     status_code=202,
@@ -98,7 +105,7 @@ async def edit_tag(
     access_result = await tools.access_admin(response=response, request=request)
 
     if access_result == True:
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
 
         tag = session.query(catalog.Tag).filter_by(id=tag_id)
         if not tag.first():
@@ -114,14 +121,17 @@ async def edit_tag(
 
         # Меняем данные в БД
         tag.update(data_edit)
+        record_change(session, "tags", tag_id)
         session.commit()
         session.close()
+        await autocomplete.refresh("tags", [tag_id])
         return PlainTextResponse(status_code=202, content="Complite")
     else:
         return access_result
 
 @router.delete(
     MAIN_URL+"/delete/tag",
+    dependencies=[Depends(catalog_changes("tags", "mods"))],
     tags=["Tag"],
     summary="Удаление тега",
     status_code=202,
@@ -146,7 +156,7 @@ async def delete_tag(
     access_result = await tools.access_admin(response=response, request=request)
 
     if access_result == True:
-        session = sessionmaker(bind=catalog.engine)()
+        session = request_session(catalog.engine)
 
         delete_game = delete(catalog.Tag).where(catalog.Tag.id == tag_id)
 
@@ -157,8 +167,10 @@ async def delete_tag(
         session.execute(delete_game)
         session.execute(delete_mods_tags_association)
         session.execute(delete_game_tags_association)
+        record_change(session, "tags", tag_id, "delete")
         session.commit()
         session.close()
+        await autocomplete.refresh("tags", [tag_id])
         return PlainTextResponse(status_code=202, content="Complite")
     else:
         return access_result
@@ -46,3 +46,100 @@ LOCALHOST_CORS_ORIGINS = [
     "http://localhost:6660",
     "http://127.0.0.1:6660",
 ]
+
+
+# Кеш сессий (на каждый воркер)
+
+SESSION_CACHE_SIZE = 10000  # максимум access-токенов в кеше
+SESSION_CACHE_TTL = 60  # секунд, дополнительно ограничено end_date_access
+
+
+# Фоновые задачи (выполняет только один воркер)
+
+HOUSEKEEPING_INTERVAL = 60  # секунд
+HOUSEKEEPING_JITTER = 10  # секунд, случайная добавка к интервалу
+SESSION_FLUSH_INTERVAL = 15  # секунд между записью last_request_date в БД (на каждом воркере)
+
+
+# Пул потоков для bcrypt (пароли, токены)
+
+HASH_POOL_WORKERS = 2  # потоков на воркер
+HASH_QUEUE_LIMIT = 32  # задач в очереди сверх занятых потоков, дальше - 503
+
+
+# Кеш проверенных сервисных токенов (tools.check_token)
+
+TOKEN_CACHE_SIZE = 64
+TOKEN_CACHE_TTL = 300  # секунд
+
+
+# Подписанные access-токены (проверяются без обращения к БД)
+
+SIGNED_ACCESS_TOKENS = False
+ACCESS_TOKEN_SECRET = ""  # общий для всех воркеров/серверов, без него режим не включается
+REVOKED_SESSIONS_SYNC_INTERVAL = 10  # секунд между синхронизациями deny-list закрытых сессий
+REVOKED_SESSIONS_SYNC_OVERLAP = 30  # секунд перекрытия между синхронизациями (расхождение часов и коммитов)
+
+
+# Ротация refresh-токенов
+
+REFRESH_GRACE_SECONDS = 30  # сколько секунд после ротации еще принимается предыдущий refresh-токен
+REFRESH_GRACE_CACHE_SIZE = 10000
+
+
+# Пулы соединений MySQL (на воркер и на БД - см. sql_logic/sql_engine.py)
+# SQL_POOL_SIZE + SQL_MAX_OVERFLOW - общий бюджет sync и async движков, async получает свою долю из него.
+# max_connections MySQL должен быть не меньше (SQL_POOL_SIZE + SQL_MAX_OVERFLOW) * воркеров * баз
+
+SQL_POOL_SIZE = 5  # не меньше 2: по соединению sync и async движкам
+SQL_MAX_OVERFLOW = 10
+SQL_ASYNC_POOL_SIZE = 2  # из SQL_POOL_SIZE, остальное - sync движку
+SQL_ASYNC_MAX_OVERFLOW = 3  # из SQL_MAX_OVERFLOW
+SQL_POOL_RECYCLE = 3600  # секунд, меньше wait_timeout MySQL
+SQL_PRE_PING = "idle"  # "always" - пинг при каждом checkout, "idle" - только после простоя, "never"
+SQL_PRE_PING_IDLE = 30  # секунд простоя, после которых соединение пингуется
+
+
+# Кеш количества элементов в списках каталога (database_size)
+
+COUNT_CACHE_SIZE = 5000
+COUNT_CACHE_TTL = 60  # секунд, изменения на других воркерах видны не позже
+
+
+# Полнотекстовый поиск (FULLTEXT-индексы MySQL с парсером ngram создаются скриптом scripts/create_fulltext_indexes.py)
+
+FULLTEXT_SEARCH = True
+
+
+# Автодополнение (префиксный индекс названий в памяти воркера - см. caching/autocomplete.py)
+
+AUTOCOMPLETE_REBUILD_INTERVAL = 600  # секунд, полная перестройка (скачивания, правки с других воркеров)
+
+
+# HTTP-кеширование чтения каталога (ETag/If-None-Match и Cache-Control для CDN - см. caching/etag.py)
+
+CATALOG_CACHE_MAX_AGE = 30  # секунд, сколько CDN/браузер может отдавать публичные ответы без перепроверки
+
+
+# Кеш ответов анонимных запросов к спискам каталога (на воркер - см. caching/responses.py)
+
+RESPONSE_CACHE_SIZE = 1000
+RESPONSE_CACHE_TTL = 30  # секунд, изменения на других воркерах и счетчики скачиваний видны не позже
+
+
+# Потоковая выгрузка каталога в NDJSON (/export/{kind}.ndjson - см. sync/api_export.py)
+
+EXPORT_TOKEN = ""  # токен для зеркал в заголовке X-Export-Token, пусто - только админы
+EXPORT_YIELD_PER = 1000  # строк за одну выборку серверного курсора
+
+
+# Лента изменений каталога (/changes - см. sql_logic/sql_changes.py)
+
+CHANGES_SETTLE_SECONDS = 2  # свежие записи отдаются с этой задержкой, чтобы не пропустить незакоммиченные
+CHANGES_RETENTION_DAYS = 30  # сколько дней хранится журнал изменений; читатель с более старым курсором получает 410
+CHANGES_PRUNE_INTERVAL = 3600  # секунд между чистками журнала (на одном воркере)
+
+
+# Снимок словарей в памяти: теги, жанры и их связи с играми (на воркер - см. caching/dictionary.py)
+
+DICTIONARY_REFRESH_INTERVAL = 60  # секунд, перечитывание (изменения с других воркеров)
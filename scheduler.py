@@ -0,0 +1,117 @@
+"""Periodic background tasks of a worker (housekeeping)."""
+
+from __future__ import annotations
+
+import asyncio
+import random
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+
+@dataclass
+class PeriodicTask:
+    name: str
+    func: Callable[[], Awaitable[None]]
+    interval: float
+    jitter: float = 0.0
+    # True - задача выполняется только воркером-лидером (см. LeaderLock), False - каждым воркером
+    exclusive: bool = True
+
+
+class LeaderLock:
+    """
+    Leader election between gunicorn workers through a MySQL named lock (`GET_LOCK`).
+
+    The lock lives as long as the connection holding it, so the leader keeps a dedicated connection open.
+    It comes from an engine without a pool (`sql_engine.get_unpooled_engine`), not from the request pool;
+    workers that did not get the lock close theirs. If the leader dies, MySQL releases the lock and another
+    worker takes over on its next tick. The blocking queries run in a worker thread.
+    """
+
+    def __init__(self, engine: Engine, name: str) -> None:
+        self.engine = engine
+        self.name = name
+        self._connection: Connection | None = None
+        # Задачи спрашивают блокировку параллельно, а соединение одно
+        self._guard = asyncio.Lock()
+
+    async def acquire(self) -> bool:
+        async with self._guard:
+            return await asyncio.to_thread(self._acquire)
+
+    async def release(self) -> None:
+        async with self._guard:
+            await asyncio.to_thread(self._release)
+
+    def _acquire(self) -> bool:
+        try:
+            if self._connection is None:
+                self._connection = self.engine.connect()
+
+            params = {"name": self.name}
+            held = self._connection.execute(text("SELECT IS_USED_LOCK(:name) = CONNECTION_ID()"), params).scalar()
+            if not held:
+                held = self._connection.execute(text("SELECT GET_LOCK(:name, 0)"), params).scalar()
+            # Именованные блокировки не транзакционны, а висящая транзакция нам не нужна
+            self._connection.rollback()
+            if not held:
+                # Не лидер - соединение держать незачем
+                self._close()
+            return bool(held)
+        except Exception as exc:
+            print(f"Scheduler: lock `{self.name}` check failed: {exc!r}")
+            self._release()
+            return False
+
+    def _release(self) -> None:
+        if self._connection is None:
+            return
+        try:
+            self._connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": self.name})
+        except Exception:
+            pass
+        finally:
+            self._close()
+
+    def _close(self) -> None:
+        try:
+            self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+
+
+class Scheduler:
+    def __init__(self, lock: LeaderLock) -> None:
+        self.lock = lock
+        self.tasks: list[PeriodicTask] = []
+        self._running: list[asyncio.Task] = []
+
+    def add(self, task: PeriodicTask) -> None:
+        self.tasks.append(task)
+
+    def start(self) -> None:
+        for task in self.tasks:
+            self._running.append(asyncio.create_task(self._run(task), name=f"scheduler:{task.name}"))
+
+    async def stop(self) -> None:
+        for running in self._running:
+            running.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        self._running.clear()
+        await self.lock.release()
+
+    async def _run(self, task: PeriodicTask) -> None:
+        # Разносим первые запуски воркеров во времени
+        await asyncio.sleep(random.uniform(0, task.jitter))
+        while True:
+            if not task.exclusive or await self.lock.acquire():
+                try:
+                    await task.func()
+                except Exception as exc:
+                    print(f"Scheduler: task `{task.name}` failed: {exc!r}")
+
+            await asyncio.sleep(task.interval + random.uniform(0, task.jitter))
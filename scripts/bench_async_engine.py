@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Compare concurrent query throughput of the sync (pymysql) and async (aiomysql) engines.
+
+Simulates N concurrent requests inside one event loop, like a single gunicorn worker does.
+With the sync engine every query blocks the loop, so requests run one after another;
+the async engine lets them overlap up to the pool size.
+
+    python scripts/bench_async_engine.py --requests 500 --concurrency 50 --sleep 0.005
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Ensure repo root is on sys.path when running from other working directories
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from sqlalchemy import text
+
+from sql_logic import sql_catalog as catalog
+from sql_logic.sql_async import async_engine, dispose_async_engines
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark sync vs async MySQL engine under concurrent requests.",
+    )
+    parser.add_argument("--requests", type=int, default=500, help="Total number of simulated requests.")
+    parser.add_argument("--concurrency", type=int, default=50, help="Requests in flight at once.")
+    parser.add_argument(
+        "--sleep",
+        type=float,
+        default=0.005,
+        help="Server-side SLEEP() per query in seconds, stands in for query latency.",
+    )
+    parser.add_argument(
+        "--query",
+        default=None,
+        help="Custom SQL to run instead of SELECT SLEEP(...), e.g. a real catalog query.",
+    )
+    return parser.parse_args()
+
+
+async def run(label: str, handler, total: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def one() -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await handler()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{label:>6}: {total / elapsed:8.1f} req/s  "
+        f"median {statistics.median(latencies) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms  total {elapsed:6.2f} s"
+    )
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    statement = text(args.query) if args.query else text(f"SELECT SLEEP({float(args.sleep)})")
+
+    async def sync_handler() -> None:
+        # Так сейчас выглядят обработчики: async def с блокирующим запросом внутри
+        with catalog.engine.connect() as connection:
+            connection.execute(statement).fetchall()
+
+    engine = async_engine("catalog")
+
+    async def async_handler() -> None:
+        async with engine.connect() as connection:
+            (await connection.execute(statement)).fetchall()
+
+    # Прогрев пулов
+    await sync_handler()
+    await async_handler()
+
+    await run("sync", sync_handler, args.requests, args.concurrency)
+    await run("async", async_handler, args.requests, args.concurrency)
+
+    await dispose_async_engines()
+
+
+def main() -> int:
+    args = parse_args()
+    asyncio.run(main_async(args))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
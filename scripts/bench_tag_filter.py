@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Benchmark the "mods having all of these tags" filter of mod_list.
+
+Compares the old form (one correlated EXISTS per tag, `Mod.tags.any(...)`) with the grouped
+semi-join from `tools.mods_with_all_tags` for 1..90 tags (LIMITS.mod.filters_max), running the
+COUNT and the first page like mod_list does. Tags are taken from the most used ones, so the
+result sets are not trivially empty.
+
+    python scripts/bench_tag_filter.py --counts 1 2 5 10 20 45 90 --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Ensure repo root is on sys.path when running from other working directories
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+
+import tools
+from limits import LIMITS
+from sql_logic import sql_catalog as catalog
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Benchmark per-tag EXISTS vs grouped semi-join tag filtering.",
+    )
+    parser.add_argument(
+        "--counts",
+        type=int,
+        nargs="+",
+        default=[1, 2, 3, 5, 10, 20, 45, LIMITS.mod.filters_max],
+        help="Numbers of tags to filter by.",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (median is reported).")
+    parser.add_argument("--page-size", type=int, default=LIMITS.page.default, help="Page size of the fetched page.")
+    return parser.parse_args()
+
+
+def base_query(session):
+    return (
+        session.query(catalog.Mod.id)
+        .filter(catalog.Mod.condition == 0, catalog.Mod.public == 0)
+        .order_by(catalog.Mod.downloads, catalog.Mod.id)
+    )
+
+
+def exists_per_tag(session, tags: list[int]):
+    query = base_query(session)
+    for tag in tags:
+        query = query.filter(catalog.Mod.tags.any(catalog.Tag.id == tag))
+    return query
+
+
+def grouped_semi_join(session, tags: list[int]):
+    return base_query(session).filter(catalog.Mod.id.in_(tools.mods_with_all_tags(tags)))
+
+
+def measure(build, session, tags: list[int], repeat: int, page_size: int) -> tuple[float, int]:
+    timings = []
+    count = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        query = build(session, tags)
+        count = query.count()
+        query.limit(page_size).all()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), count
+
+
+def main() -> int:
+    args = parse_args()
+
+    session = sessionmaker(bind=catalog.engine)()
+    try:
+        popular = (
+            session.query(catalog.mods_tags.c.tag_id)
+            .group_by(catalog.mods_tags.c.tag_id)
+            .order_by(func.count().desc())
+            .limit(max(args.counts))
+            .all()
+        )
+        popular = [row.tag_id for row in popular]
+        if not popular:
+            print("No tag associations in the database.", file=sys.stderr)
+            return 1
+
+        print(f"{'tags':>5} {'EXISTS x N, ms':>15} {'grouped, ms':>12} {'speedup':>8} {'rows':>6}")
+        for n in args.counts:
+            tags = popular[:n]
+            old_time, old_count = measure(exists_per_tag, session, tags, args.repeat, args.page_size)
+            new_time, new_count = measure(grouped_semi_join, session, tags, args.repeat, args.page_size)
+            if old_count != new_count:
+                print(f"Result mismatch for {n} tags: {old_count} != {new_count}", file=sys.stderr)
+                return 1
+            print(
+                f"{len(tags):>5} {old_time * 1000:>15.2f} {new_time * 1000:>12.2f} "
+                f"{old_time / new_time if new_time else 0:>7.1f}x {new_count:>6}"
+            )
+    finally:
+        session.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""Create the FULLTEXT ngram indexes used by name search.
+
+Run once per database (and again after adding an index to `sql_search.FULLTEXT_INDEXES`),
+then restart the workers: they detect the available indexes on first search.
+Already existing indexes are skipped.
+
+    python scripts/create_fulltext_indexes.py
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+# Ensure repo root is on sys.path when running from other working directories
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from sql_logic import sql_search
+
+
+def main() -> int:
+    try:
+        sql_search.create_fulltext_indexes()
+    except Exception as exc:
+        print(f"Failed to create FULLTEXT indexes: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""Add the session token columns (hashes, rotation grace, generation, revocation) to an existing database.
+
+Run once per database before starting workers of the new version: they no longer alter the
+`sessions` table on import. Already existing columns are skipped.
+
+    python scripts/migrate_session_columns.py
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+# Ensure repo root is on sys.path when running from other working directories
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from sql_logic import sql_account
+
+
+def main() -> int:
+    try:
+        sql_account.migrate_session_token_columns()
+    except Exception as exc:
+        print(f"Failed to migrate the sessions table: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
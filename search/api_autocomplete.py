@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Query
+from fastapi.responses import JSONResponse
+import tools
+from ow_config import MAIN_URL
+from limits import LIMITS
+from caching import autocomplete
+
+
+router = APIRouter()
+
+
+@router.get(
+    MAIN_URL+"/autocomplete",
+    tags=["Search"],
+    summary="Подсказки для строки поиска",
+    status_code=200,
+    responses={
+        200: {
+            "description": "Для каждого запрошенного типа - до `limit` элементов, чье название (или слово в нем) начинается с `q`.",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "mods": [{"id": 1, "name": "Better Zombies"}],
+                        "games": [{"id": 2, "name": "Barotrauma"}],
+                    }
+                }
+            }
+        },
+        413: {
+            "description": "Неккоректный `limit` или неизвестный тип в `kinds`.",
+        },
+    }
+)
+async def autocomplete_names(
+    q: str = Query(..., description="Начало названия или любого слова в названии.", max_length=LIMITS.autocomplete.query_max),
+    kinds = Query('["mods", "games", "tags", "genres"]', description="Что подсказывать *(массив из `mods`, `games`, `tags`, `genres`)*.", examples={"example": {"value": "[\"mods\", \"games\"]"}}),
+    limit: int = Query(LIMITS.autocomplete.default, description="Максимум подсказок каждого типа. Диапазон - 1...20."),
+):
+    """
+    Подсказки по префиксу из индекса в памяти: без запросов к БД, результаты отсортированы по популярности
+    *(моды и игры - по скачиваниям, теги и жанры - по числу модов/игр)*. Моды - только полностью публичные.
+    """
+    kinds = tools.str_to_list(kinds)
+
+    if limit < 1 or limit > LIMITS.autocomplete.max:
+        return JSONResponse(status_code=413, content={"message": "incorrect limit", "error_id": 1})
+    elif not kinds or any(kind not in autocomplete.KINDS for kind in kinds):
+        return JSONResponse(status_code=413, content={"message": "unknown kind", "error_id": 2})
+
+    return {kind: autocomplete.suggest(kind, q, limit) for kind in kinds}
@@ -0,0 +1,78 @@
+"""
+Session tokens (access/refresh cookies).
+
+Tokens are random strings from `secrets`; the database only keeps their SHA-256 digest in the indexed
+`access_token_hash`/`refresh_token_hash` columns. Tokens issued before that were bcrypt hashes stored as is
+in `access_token`/`refresh_token` and are still accepted until they expire.
+
+With `SIGNED_ACCESS_TOKENS` enabled the access token is instead a stateless HMAC-signed token
+(`s1.<owner_id>.<session_id>.<generation>.<expires>.<signature>`) verified without a database round trip.
+`generation` is bumped on every rotation, so the deny-list can reject tokens issued before it.
+"""
+
+from __future__ import annotations
+
+import base64
+import datetime
+import hashlib
+import hmac
+import secrets
+
+import ow_config as config
+
+
+TOKEN_BYTES = 32
+SIGNED_PREFIX = "s1."
+
+# Секрет должен совпадать на всех воркерах/серверах. Без него подписанные токены не выдаются и не принимаются.
+ACCESS_TOKEN_SECRET = str(getattr(config, "ACCESS_TOKEN_SECRET", "") or "").encode("utf-8")
+SIGNED_ACCESS_TOKENS = bool(getattr(config, "SIGNED_ACCESS_TOKENS", False)) and bool(ACCESS_TOKEN_SECRET)
+
+
+def mint() -> str:
+    return secrets.token_urlsafe(TOKEN_BYTES)
+
+
+def digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def is_legacy(token: str) -> bool:
+    # Старые токены - bcrypt-хеши вида `$2b$06$...`, в новых символа `$` не бывает
+    return token.startswith("$2")
+
+
+def is_signed(token: str) -> bool:
+    # В token_urlsafe нет символа `.`, так что префикс однозначен
+    return token.startswith(SIGNED_PREFIX)
+
+
+def _signature(payload: str) -> str:
+    mac = hmac.new(ACCESS_TOKEN_SECRET, payload.encode("utf-8"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(mac).rstrip(b"=").decode("ascii")
+
+
+def sign_access(owner_id: int, session_id: int, expires: datetime.datetime, generation: int = 0) -> str:
+    payload = f"{SIGNED_PREFIX}{int(owner_id)}.{int(session_id)}.{int(generation)}.{int(expires.timestamp())}"
+    return f"{payload}.{_signature(payload)}"
+
+
+def verify_access(token: str) -> dict | None:
+    """Returns `{"id", "owner_id", "generation", "end_date_access"}` for a valid unexpired signed token, otherwise None."""
+    if not ACCESS_TOKEN_SECRET or not is_signed(token):
+        return None
+
+    payload, _, signature = token.rpartition(".")
+    if not hmac.compare_digest(signature, _signature(payload)):
+        return None
+
+    try:
+        owner_id, session_id, generation, expires = (int(part) for part in payload[len(SIGNED_PREFIX):].split("."))
+    except ValueError:
+        return None
+
+    end_date_access = datetime.datetime.fromtimestamp(expires)
+    if end_date_access <= datetime.datetime.now():
+        return None
+
+    return {"id": session_id, "owner_id": owner_id, "generation": generation, "end_date_access": end_date_access}
@@ -1,14 +1,14 @@
 from fastapi import APIRouter, Request, Response, Form, Query, Path, UploadFile, File
 from fastapi.responses import JSONResponse, RedirectResponse, PlainTextResponse
 from io import BytesIO
-import bcrypt
+import hashing
 import tools
 from ow_config import MAIN_URL
 import datetime
 import ow_config as config
 from limits import LIMITS
 from sqlalchemy import insert
-from sqlalchemy.orm import sessionmaker
+from sql_logic.sql_session import request_session
 from sql_logic import sql_account as account
 import standarts
 
@@ -50,7 +50,7 @@ async def info_profile(
 ):
     result = {}
     # Создание сессии
-    session = sessionmaker(bind=account.engine)()
+    session = request_session(account.engine)
 
     query = session.query(account.Account).filter_by(id=user_id)
     row = query.first()
@@ -154,7 +154,7 @@ async def avatar_profile(
     """
     Возвращает url, по которому можно получить аватар пользователя при условии, что он есть.
     """
-    session = sessionmaker(bind=account.engine)()
+    session = request_session(account.engine)
 
     avatar_url = session.query(account.Account.avatar_url).filter_by(id=user_id).first()
 
@@ -233,7 +233,7 @@ async def edit_profile(
     owner_id = access_result.get("owner_id", -1)  # id юзера запрашивающего данные
 
     # Создание сессии
-    session = sessionmaker(bind=account.engine)()
+    session = request_session(account.engine)
 
     # Получаем запись о юзере
     user_query = session.query(account.Account).filter_by(id=user_id)
@@ -364,8 +364,11 @@ async def edit_profile(
             return PlainTextResponse(status_code=413,
                                 content="Слишком длинный пароль! (максимальная длина 100 символов)")
 
-        query_update["password_hash"] = (
-            bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt(9))).decode('utf-8')
+        try:
+            query_update["password_hash"] = (await hashing.hashpw(new_password.encode('utf-8'), 9)).decode('utf-8')
+        except hashing.HashingOverloaded:
+            session.close()
+            raise
         query_update["last_password_reset"] = today
 
     if mute:
@@ -477,8 +480,7 @@ async def edit_profile_rights(
         owner_id = access_result.get("owner_id", -1)  # id юзера запрашивающего изменения
 
         # Создание сессии
-        USession = sessionmaker(bind=account.engine)
-        session = USession()
+        session = request_session(account.engine)
 
         # Получаем запись о юзере
         user_query = session.query(account.Account).filter_by(id=user_id)
@@ -574,7 +576,7 @@ async def delete_account(
         if user_id is not None and user_id != access_result.get("owner_id", -1):
             return PlainTextResponse(status_code=403, content="Вы не можете удалить этот аккаунт!")
         # Создание сессии
-        session = sessionmaker(bind=account.engine)()
+        session = request_session(account.engine)
 
         # Выполнение запроса
         user_id = access_result.get("owner_id", -1)
@@ -613,9 +615,11 @@ async def delete_account(
         })
         session.query(account.Session).filter_by(owner_id=user_id).update({
             "broken": "account deleted",
+            "revoked_at": datetime.datetime.now(),
         })
 
         session.commit()
+        account.forget_cached_sessions(owner_id=user_id)
 
         session.close()
         return PlainTextResponse(status_code=200, content="Успешно!")
@@ -4,7 +4,7 @@ from sql_logic import sql_account as account
 import json
 #from yandexid import AsyncYandexOAuth, AsyncYandexID
 from google_auth_oauthlib.flow import Flow
-import bcrypt
+import hashing
 from urllib import parse
 import datetime
 import random
@@ -16,7 +16,7 @@ from limits import LIMITS
 import ow_config as config
 import aiohttp
 from sqlalchemy import insert
-from sqlalchemy.orm import sessionmaker
+from sql_logic.sql_session import request_session
 import standarts
 
 
@@ -128,15 +128,22 @@ async def password_authorization(
     Рекомендую использовать внешние SSO сервисы авторизации.
     """
     # Создание сессии
-    session = sessionmaker(bind=account.engine)()
+    session = request_session(account.engine)
 
     # Получаем запись о юзере
     user_query = session.query(account.Account.id, account.Account.password_hash).filter_by(username=login)
     user = user_query.first()
 
 
-    if user and user.password_hash is not None and len(user.password_hash) > 1 and \
-            bcrypt.checkpw(password=password.encode('utf-8'), hashed_password=user.password_hash.encode('utf-8')):
+    password_ok = False
+    if user and user.password_hash is not None and len(user.password_hash) > 1:
+        try:
+            password_ok = await hashing.checkpw(password.encode('utf-8'), user.password_hash.encode('utf-8'))
+        except hashing.HashingOverloaded:
+            session.close()
+            raise
+
+    if password_ok:
         sessions_data = await account.gen_session(user_id=user.id, session=session, login_method="password")
 
         response.set_cookie(key='accessToken', value=sessions_data["access"]["token"], httponly=True, secure=config.COOKIE_SECURE, samesite=config.COOKIE_SAMESITE,
@@ -201,13 +208,16 @@ async def google_complite(
 
 
     # Создание сессии
-    session = sessionmaker(bind=account.engine)()
+    session = request_session(account.engine)
 
     # Выполнение запроса
     rows = session.query(account.Account.id).filter(account.Account.google_id == user_data["id"]).first()
 
     if not rows:
-        if session.query(account.blocked_account_creation).filter_by(google_id=user_data["id"]).first():
+        blocked = session.query(account.blocked_account_creation).filter_by(google_id=user_data["id"])
+        # Просроченные записи чистятся планировщиком, до этого момента их игнорируем
+        blocked = blocked.filter(account.blocked_account_creation.c.forget > datetime.datetime.now())
+        if blocked.first():
             return PlainTextResponse(status_code=410, content="Этот аккаунт Google использовался в недавно удаленном аккаунте Open Workshop!")
 
         access_result = await account.check_access(request=request, response=response)
@@ -326,7 +336,7 @@ async def yandex_complite(
 #    user_data = await AsyncYandexID(oauth_token=token.access_token).get_user_info_json()
 
     # Создание сессии
-#    session = sessionmaker(bind=account.engine)()
+#    session = request_session(account.engine)
 
     # Выполнение запроса
 #    rows = session.query(account.Account.id).filter(account.Account.yandex_id == user_data.id).first()
@@ -447,10 +457,9 @@ async def disconnect_service(
 
     if access_result and access_result.get("owner_id", -1) >= 0:
         # Создание сессии
-        Session = sessionmaker(bind=account.engine)
+        session = request_session(account.engine)
 
         # Выполнение запроса
-        session = Session()
         row = session.query(account.Account).filter_by(id=access_result.get("owner_id", -1))
         row_result = row.first()
         if row_result:
@@ -523,16 +532,21 @@ async def logout(
     """
 
     # Создание сессии
-    session = sessionmaker(bind=account.engine)()
+    session = request_session(account.engine)
 
-    query = session.query(account.Session).filter_by(access_token=request.cookies.get("accessToken", ""))
+    access_token = request.cookies.get("accessToken", "")
+    query = session.query(account.Session).filter(account.access_token_filter(access_token))
 
-    if query.first():
+    row = query.first()
+    if row:
         # Выполнение запроса
-        query.update({"broken": "logout"})
+        query.update({"broken": "logout", "revoked_at": datetime.datetime.now()})
         session.commit()
         session.close()
 
+        account.forget_cached_session(access_token)
+        account.revoke_session(row.id)
+
         # Удаление токенов у юзера
         response.delete_cookie(key='accessToken')
         response.delete_cookie(key='refreshToken')
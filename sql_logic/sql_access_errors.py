@@ -1,12 +1,8 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime
 from sqlalchemy.ext.declarative import declarative_base
-from .envs import DB_HOST, DB_PASSWORD, DB_PORT, DB_USER
+from .sql_engine import get_engine
 
-engine = create_engine(
-    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}"
-    f"@{DB_HOST}:{DB_PORT}/access",
-    pool_pre_ping=True,
-)
+engine = get_engine("access")
 base = declarative_base()
 
 class AccessError(base):
@@ -1,21 +1,45 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Table, ForeignKey, Boolean, insert
+from sqlalchemy import Column, Integer, String, DateTime, Table, ForeignKey, Boolean, insert, update, case, inspect, text, false
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from fastapi import Request, Response
-import bcrypt
+import asyncio
 import datetime
 import ow_config as config
-from .envs import DB_HOST, DB_PASSWORD, DB_PORT, DB_USER
+import session_tokens
+from caching.ttl_cache import TTLCache
+from .sql_engine import get_engine
 
-engine = create_engine(
-    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}"
-    f"@{DB_HOST}:{DB_PORT}/catalog",
-    pool_pre_ping=True,
-)
+engine = get_engine("catalog")
 base = declarative_base()
 
 STANDART_STR_TIME = "%d.%m.%Y/%H:%M:%S"
 
+# Кеш проверенных access-токенов (на воркер): токен -> словарь сессии
+session_cache = TTLCache(
+    maxsize=int(getattr(config, "SESSION_CACHE_SIZE", 10000)),
+    ttl=float(getattr(config, "SESSION_CACHE_TTL", 60)),
+)
+
+# Write-behind буфер для sessions.last_request_date: id сессии -> время последнего запроса
+_last_requests: dict[int, datetime.datetime] = {}
+LAST_REQUESTS_FLUSH_BATCH = 1000
+
+# Срок жизни access-токена: дольше запись deny-list хранить незачем
+ACCESS_TOKEN_LIFETIME = datetime.timedelta(minutes=40)
+# Deny-list для подписанных access-токенов: id сессии -> (минимальное допустимое поколение, когда запись можно забыть).
+# Ротация отзывает токены прошлых поколений, закрытие сессии - все (CLOSED_GENERATION). Синхронизируется с БД,
+# см. sync_revoked_sessions
+revoked_sessions: dict[int, tuple[int, datetime.datetime]] = {}
+CLOSED_GENERATION = 2**31
+_revoked_synced_at: datetime.datetime | None = None
+
+# Окно, в котором предыдущий refresh-токен еще принимается (параллельные запросы браузера во время ротации)
+REFRESH_GRACE_SECONDS = float(getattr(config, "REFRESH_GRACE_SECONDS", 30))
+REVOKED_SESSIONS_SYNC_OVERLAP = float(getattr(config, "REVOKED_SESSIONS_SYNC_OVERLAP", 30))
+# Недавние ротации: SHA-256 старого refresh-токена -> результат ротации (новые токены)
+recent_rotations = TTLCache(maxsize=int(getattr(config, "REFRESH_GRACE_CACHE_SIZE", 10000)), ttl=REFRESH_GRACE_SECONDS)
+_rotations_in_flight: dict[str, asyncio.Future] = {}
+
 class Account(base): # Аккаунты юзеров
     __tablename__ = 'accounts'
     id = Column(Integer, primary_key=True)
@@ -86,10 +110,22 @@ class Session(base): # Теги для модов
 
     owner_id = Column(Integer)
 
+    # Устаревший формат (bcrypt-строка как есть), принимается до истечения срока жизни
     access_token = Column(String(512))
     refresh_token = Column(String(512))
 
+    # SHA-256 от токенов (см. session_tokens)
+    access_token_hash = Column(String(64), index=True)
+    refresh_token_hash = Column(String(64), index=True)
+
+    # Предыдущий refresh-токен, принимается до previous_refresh_until без выдачи новых токенов
+    previous_refresh_token_hash = Column(String(64), index=True)
+    previous_refresh_until = Column(DateTime)
+
     broken = Column(String(124)) # Сессия закрыта по причине - `logout`, `too many sessions`
+    # Поколение токенов (растет при каждой ротации) и время последнего закрытия/ротации - по нему синхронизируется deny-list
+    generation = Column(Integer, default=0)
+    revoked_at = Column(DateTime, index=True)
 
     login_method = Column(String(124))
 
@@ -168,12 +204,14 @@ async def gen_session(user_id:int, session, login_method:str = "unknown"):
     row = row.filter(Session.end_date_refresh > ddate)
 
     if row.count() > 9:
-        row.update({"broken": "too many sessions"})
+        row.update({"broken": "too many sessions", "revoked_at": ddate})
+        forget_cached_sessions(owner_id=user_id)
 
 
-    # Генерируем псевдо-случайные токены
-    access_token = (bcrypt.hashpw(str(datetime.datetime.now().microsecond).encode('utf-8'), bcrypt.gensalt(6))).decode('utf-8')
-    refresh_token = (bcrypt.hashpw(str(datetime.datetime.now().microsecond).encode('utf-8'), bcrypt.gensalt(7))).decode('utf-8')
+    # Генерируем случайные токены (подписанный access-токен выдается после INSERT, ему нужен id сессии)
+    signed = session_tokens.SIGNED_ACCESS_TOKENS
+    access_token = None if signed else session_tokens.mint()
+    refresh_token = session_tokens.mint()
 
     # Определяем временные рамки жизни токенов
     end_access = ddate+datetime.timedelta(minutes=40)
@@ -183,8 +221,8 @@ async def gen_session(user_id:int, session, login_method:str = "unknown"):
     insert_statement = insert(Session).values(
         owner_id=user_id,
 
-        access_token=access_token,
-        refresh_token=refresh_token,
+        access_token_hash=None if signed else session_tokens.digest(access_token),
+        refresh_token_hash=session_tokens.digest(refresh_token),
 
         login_method=login_method,
 
@@ -193,79 +231,264 @@ async def gen_session(user_id:int, session, login_method:str = "unknown"):
         end_date_refresh=end_refresh
     )
     # Выполнение операции INSERT
-    session.execute(insert_statement)
+    result = session.execute(insert_statement)
+
+    if signed:
+        access_token = session_tokens.sign_access(owner_id=user_id, session_id=result.lastrowid, expires=end_access)
 
     return {"access": {"token": access_token, "end": end_access},
             "refresh": {"token": refresh_token, "end": end_refresh}}
 
-async def update_session(response: Response, request: Request, result_row: bool = False):
-    # Создание сессии
-    USession = sessionmaker(bind=engine)
-    session = USession()
-
-    # Выполнение запроса
-    old_refresh_token = request.cookies.get("refreshToken", "")
-    row = session.query(Session).filter_by(refresh_token=old_refresh_token, broken=None)
+def access_token_filter(token: str):
+    if session_tokens.is_signed(token):
+        claims = session_tokens.verify_access(token)
+        return Session.id == claims["id"] if claims else false()
+    if session_tokens.is_legacy(token):
+        return Session.access_token == token
+    return Session.access_token_hash == session_tokens.digest(token)
+
+def refresh_token_filter(token: str):
+    if session_tokens.is_legacy(token):
+        return Session.refresh_token == token
+    return Session.refresh_token_hash == session_tokens.digest(token)
+
+def _session_row(res) -> dict:
+    return {key: value for key, value in res.__dict__.items() if not key.startswith("_")}
+
+def _rotate_session(old_refresh_token: str):
+    """
+    Rotates the session tokens. Returns `{"access_token", "refresh_token", "end_access", "end_refresh", "row"}`,
+    `{"row"}` if the token was already rotated within the grace window (no new tokens), or None.
+    """
+    session = sessionmaker(bind=engine)()
+    try:
+        today = datetime.datetime.now()
+        res = session.query(Session).filter(refresh_token_filter(old_refresh_token)).filter_by(broken=None).filter(
+            Session.end_date_refresh > today
+        ).first()
+        if res:
+            end_access = today+ACCESS_TOKEN_LIFETIME
+            end_refresh = today+datetime.timedelta(days=60)
+            generation = (res.generation or 0) + 1
+
+            if session_tokens.SIGNED_ACCESS_TOKENS:
+                access_token = session_tokens.sign_access(
+                    owner_id=res.owner_id, session_id=res.id, expires=end_access, generation=generation
+                )
+            else:
+                access_token = session_tokens.mint()
+            refresh_token = session_tokens.mint()
+
+            # Обновление БД (только если токен еще не сменил другой воркер)
+            updated = session.query(Session).filter_by(id=res.id).filter(refresh_token_filter(old_refresh_token)).update({
+                "end_date_access": end_access, "end_date_refresh": end_refresh,
+                "access_token_hash": None if session_tokens.SIGNED_ACCESS_TOKENS else session_tokens.digest(access_token),
+                "refresh_token_hash": session_tokens.digest(refresh_token),
+                "access_token": None, "refresh_token": None,
+                "previous_refresh_token_hash": session_tokens.digest(old_refresh_token),
+                "previous_refresh_until": today+datetime.timedelta(seconds=REFRESH_GRACE_SECONDS),
+                "last_request_date": today,
+                "generation": generation, "revoked_at": today,
+            }, synchronize_session=False)
+            session.commit()
+
+            if updated:
+                # Старый подписанный access-токен больше не действует (другие воркеры узнают при синхронизации)
+                _deny_generations(res.id, generation, today)
+                return {
+                    "access_token": access_token, "refresh_token": refresh_token,
+                    "end_access": end_access, "end_refresh": end_refresh,
+                    "row": _session_row(session.query(Session).filter_by(id=res.id).first()),
+                }
+
+        # Токен уже сменил другой воркер - в пределах окна пускаем без выдачи новых токенов
+        res = session.query(Session).filter(
+            Session.previous_refresh_token_hash == session_tokens.digest(old_refresh_token),
+            Session.previous_refresh_until > today,
+        ).filter_by(broken=None).first()
+        if res:
+            return {"row": _session_row(res)}
+        return None
+    finally:
+        session.close()
 
-    today = datetime.datetime.now()
-    row = row.filter(Session.end_date_refresh > today)
+async def _rotate_once(key: str, old_refresh_token: str):
+    try:
+        rotation = await asyncio.to_thread(_rotate_session, old_refresh_token)
+        if rotation and "refresh_token" in rotation:
+            recent_rotations.set(key, rotation)
+        return rotation
+    finally:
+        _rotations_in_flight.pop(key, None)
 
-    res = row.first()
-    if res:
-        access_token = (bcrypt.hashpw(str(datetime.datetime.now().microsecond).encode('utf-8'), bcrypt.gensalt(6))).decode('utf-8')
-        refresh_token = (bcrypt.hashpw(str(datetime.datetime.now().microsecond).encode('utf-8'), bcrypt.gensalt(7))).decode('utf-8')
+def _set_session_cookies(response: Response, rotation: dict) -> None:
+    response.set_cookie(key='accessToken', value=rotation["access_token"], httponly=True, secure=config.COOKIE_SECURE, samesite=config.COOKIE_SAMESITE, max_age=2100)
+    response.set_cookie(key='refreshToken', value=rotation["refresh_token"], httponly=True, secure=config.COOKIE_SECURE, samesite=config.COOKIE_SAMESITE, max_age=5184000)
 
-        end_access = today+datetime.timedelta(minutes=40)
-        end_refresh = today+datetime.timedelta(days=60)
+    response.set_cookie(key='loginJS', value=rotation["end_refresh"].strftime(STANDART_STR_TIME), secure=config.COOKIE_SECURE, samesite=config.COOKIE_SAMESITE, max_age=5184000)
+    response.set_cookie(key='accessJS', value=rotation["end_access"].strftime(STANDART_STR_TIME), secure=config.COOKIE_SECURE, samesite=config.COOKIE_SAMESITE, max_age=5184000)
+    response.set_cookie(key='userID', value=str(rotation["row"]["owner_id"]), secure=config.COOKIE_SECURE, samesite=config.COOKIE_SAMESITE, max_age=5184000)
 
-        # Обновление БД
-        row.update({"end_date_access": end_access, "end_date_refresh": end_refresh,
-                    "access_token": access_token, "refresh_token": refresh_token,
-                    "last_request_date": today})
-        session.commit()
+async def update_session(response: Response, request: Request, result_row: bool = False):
+    old_refresh_token = request.cookies.get("refreshToken", "")
+    key = session_tokens.digest(old_refresh_token)
+
+    # Параллельные запросы с одним refresh-токеном ждут одну ротацию и получают те же новые токены
+    rotation = recent_rotations.get(key)
+    if rotation is None:
+        pending = _rotations_in_flight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(_rotate_once(key, old_refresh_token))
+            _rotations_in_flight[key] = pending
+        rotation = await asyncio.shield(pending)
+        if rotation is None:
+            return False
+
+    if "refresh_token" in rotation:
+        forget_cached_session(request.cookies.get("accessToken", ""))
 
         # Обновление данных в куки юзера
-        response.set_cookie(key='accessToken', value=access_token, httponly=True, secure=config.COOKIE_SECURE, samesite=config.COOKIE_SAMESITE, max_age=2100)
-        response.set_cookie(key='refreshToken', value=refresh_token, httponly=True, secure=config.COOKIE_SECURE, samesite=config.COOKIE_SAMESITE, max_age=5184000)
-
-        response.set_cookie(key='loginJS', value=end_refresh.strftime(STANDART_STR_TIME), secure=config.COOKIE_SECURE, samesite=config.COOKIE_SAMESITE, max_age=5184000)
-        response.set_cookie(key='accessJS', value=end_access.strftime(STANDART_STR_TIME), secure=config.COOKIE_SECURE, samesite=config.COOKIE_SAMESITE, max_age=5184000)
-        response.set_cookie(key='userID', value=str(res.owner_id), secure=config.COOKIE_SECURE, samesite=config.COOKIE_SAMESITE, max_age=5184000)
-
-        if result_row:
-            rr = session.query(Session).filter_by(id=res.id).first().__dict__
-            session.close()
-            return rr
-        else:
-            session.close()
-            return True
-    session.close()
-    return False
+        _set_session_cookies(response, rotation)
+
+    return rotation["row"] if result_row else True
 
 async def check_session(user_access_token:str):
+    if session_tokens.is_signed(user_access_token):
+        return check_signed_session(user_access_token)
+
+    cached = session_cache.get(user_access_token)
+    if cached is not None:
+        touch_session(cached["id"])
+        # Копия: вызывающий код не должен менять запись кеша, общую для всех запросов с этим токеном
+        return dict(cached)
+
     # Создание сессии
     USession = sessionmaker(bind=engine)
     session = USession()
 
     # Выполнение запроса
-    row = session.query(Session).filter_by(access_token=user_access_token, broken=None)
+    row = session.query(Session).filter(access_token_filter(user_access_token)).filter_by(broken=None)
 
     today = datetime.datetime.now()
     row = row.filter(Session.end_date_access > today)
 
     res = row.first()
     if res:
-        res = res.__dict__
-        # Обновление БД
-        row.update({"last_request_date": today})
-        session.commit()
+        res = {key: value for key, value in res.__dict__.items() if not key.startswith("_")}
         session.close()
 
+        touch_session(res["id"], today)
+
+        # Запись в кеше не должна пережить сам access-токен
+        session_cache.set(user_access_token, dict(res), ttl=(res["end_date_access"] - today).total_seconds())
         return res
 
     session.close()
     return False
 
+def check_signed_session(user_access_token: str):
+    # Проверка без обращения к БД: подпись, срок жизни и deny-list закрытых сессий
+    claims = session_tokens.verify_access(user_access_token)
+    if claims is None:
+        return False
+    denied = revoked_sessions.get(claims["id"])
+    if denied is not None and claims["generation"] < denied[0]:
+        return False
+
+    touch_session(claims["id"])
+    return claims
+
+def _deny_generations(session_id: int, min_generation: int, when: datetime.datetime) -> None:
+    # Токены, выданные до `when`, истекут не позже when + ACCESS_TOKEN_LIFETIME
+    current = revoked_sessions.get(session_id)
+    if current is None or current[0] <= min_generation:
+        revoked_sessions[session_id] = (min_generation, when + ACCESS_TOKEN_LIFETIME)
+
+def revoke_session(session_id: int) -> None:
+    _deny_generations(session_id, CLOSED_GENERATION, datetime.datetime.now())
+    recent_rotations.discard_where(lambda _key, rotation: rotation["row"]["id"] == session_id)
+
+def _load_revoked_sessions(since: datetime.datetime) -> list:
+    session = sessionmaker(bind=engine)()
+    try:
+        return session.query(Session.id, Session.broken, Session.generation, Session.revoked_at).filter(
+            Session.revoked_at > since,
+        ).all()
+    finally:
+        session.close()
+
+async def sync_revoked_sessions() -> int:
+    """
+    Pulls sessions closed or rotated since the previous sync into the deny-list (range over indexed `revoked_at`)
+    and forgets entries whose tokens have all expired.
+    """
+    global _revoked_synced_at
+
+    now = datetime.datetime.now()
+    if _revoked_synced_at is None:
+        since = now - ACCESS_TOKEN_LIFETIME
+    else:
+        # Перекрытие: часы серверов и момент коммита немного расходятся
+        since = _revoked_synced_at - datetime.timedelta(seconds=REVOKED_SESSIONS_SYNC_OVERLAP)
+
+    rows = await asyncio.to_thread(_load_revoked_sessions, since)
+    for row in rows:
+        min_generation = CLOSED_GENERATION if row.broken is not None else (row.generation or 0)
+        _deny_generations(row.id, min_generation, row.revoked_at)
+    _revoked_synced_at = now
+
+    for session_id in [session_id for session_id, (_, until) in revoked_sessions.items() if until <= now]:
+        revoked_sessions.pop(session_id, None)
+    return len(revoked_sessions)
+
+def touch_session(session_id: int, when: datetime.datetime | None = None) -> None:
+    """Remembers the time of the last request of a session. Written to the DB by `flush_last_requests`."""
+    _last_requests[session_id] = when or datetime.datetime.now()
+
+def _write_last_requests(pending: dict[int, datetime.datetime]) -> None:
+    session = sessionmaker(bind=engine)()
+    try:
+        ids = list(pending)
+        for start in range(0, len(ids), LAST_REQUESTS_FLUSH_BATCH):
+            batch = {session_id: pending[session_id] for session_id in ids[start:start+LAST_REQUESTS_FLUSH_BATCH]}
+            session.execute(
+                update(Session)
+                .where(Session.id.in_(batch))
+                .values(last_request_date=case(batch, value=Session.id))
+            )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+async def flush_last_requests() -> int:
+    """Writes the buffered last_request_date values with one bulk UPDATE per batch. Returns the number of sessions written."""
+    if not _last_requests:
+        return 0
+
+    pending = _last_requests.copy()
+    _last_requests.clear()
+
+    try:
+        # UPDATE по тысячам строк не должен держать event loop
+        await asyncio.to_thread(_write_last_requests, pending)
+    except Exception:
+        # Возвращаем в буфер то, что не успело записаться (не затирая более свежие отметки)
+        for session_id, when in pending.items():
+            _last_requests.setdefault(session_id, when)
+        raise
+
+    return len(pending)
+
+def forget_cached_session(access_token: str) -> None:
+    session_cache.pop(access_token)
+
+def forget_cached_sessions(owner_id: int) -> int:
+    recent_rotations.discard_where(lambda _key, rotation: rotation["row"]["owner_id"] == owner_id)
+    return session_cache.discard_where(lambda _token, cached: cached.get("owner_id") == owner_id)
+
 async def forget_accounts():
     # Создание сессии
     USession = sessionmaker(bind=engine)
@@ -280,7 +503,6 @@ async def forget_accounts():
     session.close()
 
 async def check_access(response: Response, request: Request):
-    await forget_accounts()
     if "accessToken" in request.cookies:
         access = await check_session(request.cookies.get("accessToken", ""))
         if access: return access
@@ -298,4 +520,26 @@ async def no_from_russia(request: Request):
 
     return False
 
+
+def migrate_session_token_columns():
+    """
+    Adds the token hash, rotation and revocation columns to an existing `sessions` table.
+    Run once per database with `scripts/migrate_session_columns.py` before starting the new workers.
+    """
+    # create_all не добавляет колонки в уже существующую таблицу
+    columns = {
+        "access_token_hash": "VARCHAR(64) NULL, ADD INDEX ix_sessions_access_token_hash (access_token_hash)",
+        "refresh_token_hash": "VARCHAR(64) NULL, ADD INDEX ix_sessions_refresh_token_hash (refresh_token_hash)",
+        "previous_refresh_token_hash": "VARCHAR(64) NULL, "
+                                       "ADD INDEX ix_sessions_previous_refresh_token_hash (previous_refresh_token_hash)",
+        "previous_refresh_until": "DATETIME NULL",
+        "generation": "INT NOT NULL DEFAULT 0",
+        "revoked_at": "DATETIME NULL, ADD INDEX ix_sessions_revoked_at (revoked_at)",
+    }
+    existing = {column["name"] for column in inspect(engine).get_columns(Session.__tablename__)}
+    with engine.begin() as connection:
+        for name, definition in columns.items():
+            if name not in existing:
+                connection.execute(text(f"ALTER TABLE sessions ADD COLUMN {name} {definition}"))
+
 base.metadata.create_all(engine)
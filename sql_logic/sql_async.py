@@ -0,0 +1,54 @@
+"""
+Async MySQL engines (SQLAlchemy `AsyncEngine` on `aiomysql`).
+
+The models stay in `sql_catalog`/`sql_account`/`sql_statistics`; this module only provides non-blocking
+connections to the same databases, so handlers can move off the synchronous `pymysql` engines one query at a time:
+
+    async with async_session_scope("catalog") as session:
+        game = (await session.execute(select(catalog.Game).filter_by(id=game_id))).scalar_one_or_none()
+"""
+
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from .sql_engine import dispose_async_engines as _dispose_engines, get_async_engine
+
+
+_sessionmakers: dict[str, async_sessionmaker[AsyncSession]] = {}
+
+
+def async_engine(database: str) -> AsyncEngine:
+    """Returns the worker's async engine for `database` (`catalog`, `access`), see `sql_engine`."""
+    return get_async_engine(database)
+
+
+def async_session_factory(database: str) -> async_sessionmaker[AsyncSession]:
+    factory = _sessionmakers.get(database)
+    if factory is None:
+        # expire_on_commit=False: после commit объекты читаются без ленивой загрузки (в async она недоступна)
+        factory = async_sessionmaker(bind=async_engine(database), expire_on_commit=False)
+        _sessionmakers[database] = factory
+    return factory
+
+
+@asynccontextmanager
+async def async_session_scope(database: str = "catalog") -> AsyncIterator[AsyncSession]:
+    """Yields an `AsyncSession`; commits on success, rolls back on error, always closes."""
+    session = async_session_factory(database)()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+
+async def dispose_async_engines() -> None:
+    _sessionmakers.clear()
+    await _dispose_engines()
@@ -1,13 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Text, DateTime, Table, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Table, ForeignKey
 from sqlalchemy.orm import relationship, declarative_base
 import ow_config as config
-from .envs import DB_HOST, DB_PASSWORD, DB_PORT, DB_USER
+from .sql_engine import get_engine
 
-engine = create_engine(
-    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}"
-    f"@{DB_HOST}:{DB_PORT}/catalog",
-    pool_pre_ping=True,
-)
+engine = get_engine("catalog")
 base = declarative_base()
 
 
@@ -118,4 +114,21 @@ class Tag(base): # Теги для модов
     associated_games = relationship('Game', secondary=allowed_mods_tags, backref='tags', viewonly=True)
 
 
+# Журнал изменений (только дописывается, см. sql_logic/sql_changes.py)
+class Change(base):
+    __tablename__ = 'catalog_changes'
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+
+    entity = Column(String(32)) # mods, games, genres, tags, resources
+    entity_id = Column(Integer)
+    action = Column(String(16)) # upsert, delete
+
+    date = Column(DateTime, index=True)
+
+changes_pruned = Table('catalog_changes_pruned', base.metadata, # Одна строка: до какого id журнал изменений удален
+    Column('id', Integer, primary_key=True),
+    Column('pruned_through', BigInteger)
+)
+
+
 base.metadata.create_all(engine)
\ No newline at end of file
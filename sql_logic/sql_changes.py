@@ -0,0 +1,137 @@
+"""
+Append-only catalog change log behind the `/changes` sync feed.
+
+Write paths call `record_change(session, entity, ids, action)` in their own transaction, right before
+`session.commit()`, so a change is logged if and only if it is committed. Associations are logged as an `upsert`
+of their owner (a mod for tags/dependencies, a game for genres/allowed tags); deleting a tag or a genre also
+removes its associations.
+
+Readers page by the autoincrement id. Ids are allocated at INSERT but become visible at COMMIT, so a slower
+transaction can commit an id lower than one a reader has already passed: `changes_since` only returns rows
+older than `CHANGES_SETTLE_SECONDS`, by which time such transactions have finished. Both the row dates and the
+settle window come from the database clock (`NOW()`), so workers with drifting clocks agree on them.
+
+Retention: rows older than `CHANGES_RETENTION_DAYS` are deleted by `prune_changes` (scheduler, one worker), which
+stores the highest deleted id in `catalog_changes_pruned` in the same transaction. A cursor below it means the
+reader has missed pruned changes: `changes_since` raises `CursorExpired` and the reader has to start over from
+a full `/export`. Gaps in the ids (rolled back inserts) do not matter, only the stored id does.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import timedelta
+from typing import Iterable, Literal
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session, sessionmaker
+
+import ow_config as config
+from . import sql_catalog as catalog
+
+
+ENTITIES = ("mods", "games", "genres", "tags", "resources")
+Action = Literal["upsert", "delete"]
+
+CHANGES_SETTLE_SECONDS = float(getattr(config, "CHANGES_SETTLE_SECONDS", 2))
+CHANGES_RETENTION_DAYS = float(getattr(config, "CHANGES_RETENTION_DAYS", 30))
+CHANGES_PRUNE_BATCH = 10000
+
+
+class CursorExpired(Exception):
+    """The cursor points at changes that were already pruned."""
+
+
+def record_change(session: Session, entity: str, entity_ids: Iterable[int] | int, action: Action = "upsert") -> None:
+    if isinstance(entity_ids, int):
+        entity_ids = [entity_ids]
+    rows = [
+        {"entity": entity, "entity_id": int(entity_id), "action": action}
+        for entity_id in dict.fromkeys(entity_ids)
+    ]
+    if rows:
+        # Время - по часам БД, как и окно в changes_since
+        session.execute(insert(catalog.Change).values(date=func.now()), rows)
+
+
+def changes_since(session: Session, since: int, limit: int, entities: list[str] | None = None) -> tuple[list[dict], int, bool]:
+    """
+    Changes after cursor `since`: (changes, next cursor, whether more are ready).
+
+    Within a batch only the last change of each entity is kept, so a mod edited ten times costs one line.
+    Raises `CursorExpired` if changes after `since` were pruned.
+    """
+    db_now, pruned_through = session.execute(
+        select(func.now(), select(func.max(catalog.changes_pruned.c.pruned_through)).scalar_subquery())
+    ).one()
+    # since=0 - чтение с начала журнала после полной выгрузки
+    if since > 0 and pruned_through is not None and since < pruned_through:
+        raise CursorExpired(since)
+
+    query = session.query(catalog.Change).filter(
+        catalog.Change.id > since,
+        catalog.Change.date <= db_now - timedelta(seconds=CHANGES_SETTLE_SECONDS),
+    )
+    if entities:
+        query = query.filter(catalog.Change.entity.in_(entities))
+
+    rows = query.order_by(catalog.Change.id).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest: dict[tuple[str, int], catalog.Change] = {}
+    for row in rows:
+        latest.pop((row.entity, row.entity_id), None)
+        latest[(row.entity, row.entity_id)] = row
+
+    changes = [
+        {"entity": row.entity, "id": row.entity_id, "action": row.action, "date": row.date}
+        for row in latest.values()
+    ]
+    return changes, (rows[-1].id if rows else since), more
+
+
+def _mark_pruned(session: Session, pruned_through: int) -> None:
+    marker = catalog.changes_pruned
+    updated = session.execute(update(marker).where(marker.c.id == 1).values(pruned_through=pruned_through)).rowcount
+    if not updated:
+        session.execute(insert(marker).values(id=1, pruned_through=pruned_through))
+
+
+def _prune(retention: timedelta) -> int:
+    session = sessionmaker(bind=catalog.engine)()
+    try:
+        oldest = session.query(func.min(catalog.Change.id)).scalar()
+        if oldest is not None and oldest > 1 and session.query(catalog.changes_pruned).first() is None:
+            # Журнал чистили до появления отметки - граница по самой ранней оставшейся записи
+            _mark_pruned(session, oldest - 1)
+            session.commit()
+
+        cutoff = session.query(func.now()).scalar() - retention
+        newest = session.query(func.max(catalog.Change.id)).scalar()
+        last_old = session.query(func.max(catalog.Change.id)).filter(catalog.Change.date < cutoff).scalar()
+        if newest is None or last_old is None:
+            return 0
+        # Последнюю запись не удаляем: по пустой таблице MySQL после рестарта может начать id заново
+        last_old = min(last_old, newest - 1)
+
+        deleted = 0
+        start = oldest
+        while start <= last_old:
+            # Пачками по диапазону первичного ключа, чтобы не держать долгую блокировку
+            end = min(start + CHANGES_PRUNE_BATCH - 1, last_old)
+            deleted += session.execute(
+                delete(catalog.Change).where(catalog.Change.id >= start, catalog.Change.id <= end)
+            ).rowcount
+            # Граница удаленного фиксируется вместе с удалением - по ней читатели получают 410
+            _mark_pruned(session, end)
+            session.commit()
+            start = end + 1
+        return deleted
+    finally:
+        session.close()
+
+
+async def prune_changes() -> int:
+    """Deletes changes older than `CHANGES_RETENTION_DAYS`. Returns the number of deleted rows."""
+    return await asyncio.to_thread(_prune, timedelta(days=CHANGES_RETENTION_DAYS))
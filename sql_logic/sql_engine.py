@@ -0,0 +1,159 @@
+"""
+Engine registry: one connection pool per database per worker.
+
+`sql_catalog` and `sql_account` share the `catalog` engine, `sql_statistics` and `sql_access_errors` share
+`access`. Pool sizing comes from `ow_config`:
+
+    SQL_POOL_SIZE, SQL_MAX_OVERFLOW, SQL_POOL_RECYCLE, SQL_PRE_PING ("always" | "idle" | "never"), SQL_PRE_PING_IDLE
+    SQL_ASYNC_POOL_SIZE, SQL_ASYNC_MAX_OVERFLOW
+
+`SQL_POOL_SIZE` + `SQL_MAX_OVERFLOW` is the connection budget of one worker per database, shared by the sync
+(`pymysql`) and the async (`aiomysql`) engine: the async engine gets `SQL_ASYNC_POOL_SIZE` + `SQL_ASYNC_MAX_OVERFLOW`
+of it, the sync engine the rest. MySQL `max_connections` has to cover budget * workers * databases, plus one connection
+of the scheduler leader (`get_unpooled_engine`).
+
+With `SQL_PRE_PING = "idle"` a connection is pinged on checkout only if it sat in the pool longer than
+`SQL_PRE_PING_IDLE` seconds, instead of a round trip on every checkout (`pool_pre_ping=True`).
+"""
+
+from __future__ import annotations
+
+import time
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+import ow_config as config
+from .envs import DB_HOST, DB_PASSWORD, DB_PORT, DB_USER
+
+
+SQL_POOL_SIZE = int(getattr(config, "SQL_POOL_SIZE", 5))
+SQL_MAX_OVERFLOW = int(getattr(config, "SQL_MAX_OVERFLOW", 10))
+SQL_POOL_RECYCLE = int(getattr(config, "SQL_POOL_RECYCLE", 3600))
+SQL_PRE_PING = str(getattr(config, "SQL_PRE_PING", "idle"))
+SQL_PRE_PING_IDLE = float(getattr(config, "SQL_PRE_PING_IDLE", 30))
+# Доля async-движка в общем бюджете соединений (по умолчанию - около трети)
+SQL_ASYNC_POOL_SIZE = int(getattr(config, "SQL_ASYNC_POOL_SIZE", max(1, SQL_POOL_SIZE // 3)))
+SQL_ASYNC_MAX_OVERFLOW = int(getattr(config, "SQL_ASYNC_MAX_OVERFLOW", SQL_MAX_OVERFLOW // 3))
+
+# Оба пула должны быть непустыми: pool_size=0 у QueuePool снимает ограничение
+if not 0 < SQL_ASYNC_POOL_SIZE < SQL_POOL_SIZE:
+    raise ValueError(f"SQL_ASYNC_POOL_SIZE must be between 1 and SQL_POOL_SIZE - 1, got {SQL_ASYNC_POOL_SIZE}")
+if not 0 <= SQL_ASYNC_MAX_OVERFLOW <= SQL_MAX_OVERFLOW:
+    raise ValueError(f"SQL_ASYNC_MAX_OVERFLOW must be between 0 and SQL_MAX_OVERFLOW, got {SQL_ASYNC_MAX_OVERFLOW}")
+if SQL_PRE_PING not in ("always", "idle", "never"):
+    raise ValueError(f"SQL_PRE_PING must be 'always', 'idle' or 'never', got {SQL_PRE_PING!r}")
+
+_engines: dict[str, Engine] = {}
+_async_engines: dict[str, AsyncEngine] = {}
+_unpooled_engines: dict[str, Engine] = {}
+
+
+def _pool_options(asynchronous: bool = False) -> dict:
+    if asynchronous:
+        pool_size, max_overflow = SQL_ASYNC_POOL_SIZE, SQL_ASYNC_MAX_OVERFLOW
+    else:
+        pool_size, max_overflow = SQL_POOL_SIZE - SQL_ASYNC_POOL_SIZE, SQL_MAX_OVERFLOW - SQL_ASYNC_MAX_OVERFLOW
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_recycle": SQL_POOL_RECYCLE,
+        "pool_pre_ping": SQL_PRE_PING == "always",
+    }
+
+
+def _ping_idle_connections(engine: Engine) -> None:
+    @event.listens_for(engine, "checkin")
+    def remember_checkin(dbapi_connection, connection_record) -> None:
+        connection_record.info["checked_in_at"] = time.monotonic()
+
+    @event.listens_for(engine, "checkout")
+    def ping_if_idle(dbapi_connection, connection_record, connection_proxy) -> None:
+        checked_in_at = connection_record.info.get("checked_in_at")
+        if checked_in_at is None or time.monotonic() - checked_in_at < SQL_PRE_PING_IDLE:
+            return
+        try:
+            ok = engine.dialect.do_ping(dbapi_connection)
+        except Exception:
+            ok = False
+        if not ok:
+            # Пул выбросит соединение и повторит checkout с новым
+            raise exc.DisconnectionError()
+
+
+def get_engine(database: str) -> Engine:
+    """Returns the shared engine for `database` (`catalog`, `access`)."""
+    engine = _engines.get(database)
+    if engine is None:
+        engine = create_engine(
+            f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}"
+            f"@{DB_HOST}:{DB_PORT}/{database}",
+            **_pool_options(),
+        )
+        if SQL_PRE_PING == "idle":
+            _ping_idle_connections(engine)
+        _engines[database] = engine
+    return engine
+
+
+def get_async_engine(database: str) -> AsyncEngine:
+    """Async (`aiomysql`) counterpart of `get_engine`, its pool is the async share of the connection budget."""
+    engine = _async_engines.get(database)
+    if engine is None:
+        engine = create_async_engine(
+            f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}"
+            f"@{DB_HOST}:{DB_PORT}/{database}",
+            **_pool_options(asynchronous=True),
+        )
+        if SQL_PRE_PING == "idle":
+            _ping_idle_connections(engine.sync_engine)
+        _async_engines[database] = engine
+    return engine
+
+
+def get_unpooled_engine(database: str) -> Engine:
+    """
+    Engine without a pool (`NullPool`) for connections held open for a long time (named locks of the scheduler):
+    they do not take a slot of the request pool and are closed for real on `close()`.
+    """
+    engine = _unpooled_engines.get(database)
+    if engine is None:
+        engine = create_engine(
+            f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}"
+            f"@{DB_HOST}:{DB_PORT}/{database}",
+            poolclass=NullPool,
+        )
+        _unpooled_engines[database] = engine
+    return engine
+
+
+async def dispose_async_engines() -> None:
+    for engine in _async_engines.values():
+        await engine.dispose()
+    _async_engines.clear()
+
+
+def pool_status() -> dict:
+    def describe(pool) -> dict:
+        return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        }
+
+    return {
+        "settings": {
+            "pool_size": SQL_POOL_SIZE,
+            "max_overflow": SQL_MAX_OVERFLOW,
+            "async_pool_size": SQL_ASYNC_POOL_SIZE,
+            "async_max_overflow": SQL_ASYNC_MAX_OVERFLOW,
+            "pool_recycle": SQL_POOL_RECYCLE,
+            "pre_ping": SQL_PRE_PING,
+            "pre_ping_idle": SQL_PRE_PING_IDLE,
+        },
+        "sync": {name: describe(engine.pool) for name, engine in _engines.items()},
+        "async": {name: describe(engine.sync_engine.pool) for name, engine in _async_engines.items()},
+    }
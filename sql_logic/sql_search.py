@@ -0,0 +1,88 @@
+"""
+Name search over the catalog: MySQL FULLTEXT indexes with the `ngram` parser.
+
+`ngram` splits text into overlapping character n-grams (`ngram_token_size`, 2 by default), so a query matches
+substrings and still ranks words with a typo by the share of common n-grams. `MATCH ... AGAINST` in natural
+language mode is served from the index and returns a relevance score, unlike `ilike('%name%')`, which scans
+the whole table. Where the indexes are unavailable (not MySQL, `FULLTEXT_SEARCH = False`, not created yet),
+callers fall back to `ilike`.
+
+The indexes are created once by `scripts/create_fulltext_indexes.py`, not on import: `ALTER TABLE` on a large
+table takes a while and must not run in every worker. Workers only check which indexes exist, on first use.
+"""
+
+from __future__ import annotations
+
+from sqlalchemy import text
+from sqlalchemy.dialects.mysql import match
+
+import ow_config as config
+from . import sql_catalog as catalog
+
+
+FULLTEXT_SEARCH = bool(getattr(config, "FULLTEXT_SEARCH", True))
+
+# Имя индекса -> (таблица, колонки). MATCH должен перечислять ровно колонки индекса.
+FULLTEXT_INDEXES = {
+    "ft_mods_name_short_description": ("mods", ("name", "short_description")),
+    "ft_games_name": ("games", ("name",)),
+}
+
+_available: set[str] | None = None
+
+
+def _index_exists(connection, table: str, index_name: str) -> bool:
+    return bool(connection.execute(text(
+        "SELECT COUNT(*) FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = :table AND index_name = :index"
+    ), {"table": table, "index": index_name}).scalar())
+
+
+def create_fulltext_indexes() -> None:
+    """Creates missing FULLTEXT indexes (idempotent). Used by `scripts/create_fulltext_indexes.py`."""
+    if catalog.engine.dialect.name != "mysql":
+        raise RuntimeError("FULLTEXT ngram indexes require MySQL")
+
+    for index_name, (table, columns) in FULLTEXT_INDEXES.items():
+        with catalog.engine.begin() as connection:
+            if _index_exists(connection, table, index_name):
+                print(f"Search: `{index_name}` already exists")
+                continue
+            print(f"Search: creating `{index_name}` on `{table}`...")
+            connection.execute(text(
+                f"ALTER TABLE {table} ADD FULLTEXT INDEX {index_name} ({', '.join(columns)}) WITH PARSER ngram"
+            ))
+
+
+def _detect_fulltext_indexes() -> set[str]:
+    available = set()
+    if not FULLTEXT_SEARCH or catalog.engine.dialect.name != "mysql":
+        return available
+
+    try:
+        with catalog.engine.connect() as connection:
+            for index_name, (table, _) in FULLTEXT_INDEXES.items():
+                if _index_exists(connection, table, index_name):
+                    available.add(table)
+                else:
+                    print(f"Search: FULLTEXT index `{index_name}` is missing, falling back to LIKE "
+                          f"(run scripts/create_fulltext_indexes.py)")
+    except Exception as exc:
+        print(f"Search: FULLTEXT indexes are unavailable, falling back to LIKE: {exc!r}")
+    return available
+
+
+def fulltext_available(table: str) -> bool:
+    # Проверяется один раз на воркер; после создания индексов воркеры нужно перезапустить
+    global _available
+    if _available is None:
+        _available = _detect_fulltext_indexes()
+    return table in _available
+
+
+def mods_relevance(query: str):
+    return match(catalog.Mod.name, catalog.Mod.short_description, against=query).in_natural_language_mode()
+
+
+def games_relevance(query: str):
+    return match(catalog.Game.name, against=query).in_natural_language_mode()
@@ -0,0 +1,121 @@
+"""
+Request-scoped ORM sessions.
+
+`request_db_scope` is registered as a global FastAPI dependency (see `main.py`). Inside a request
+`db_session(engine)` and `request_session(engine)` return one shared session per engine; the scope rolls back
+whatever was not committed and closes every session when the request ends, including early returns and exceptions:
+
+    with db_session(catalog.engine) as session:
+        mod = session.query(catalog.Mod).filter_by(id=mod_id).first()
+
+Ownership of the shared session:
+- the handler commits (or rolls back) at its write boundaries, so every read after a commit starts a new
+  transaction and sees the new data instead of an old REPEATABLE READ snapshot;
+- helpers (`tools`, `sql_logic`) that write through it only `flush()`: committing is the caller's decision;
+- `close()` called by a handler ends the current transaction (rollback of what was not committed) and returns the
+  connection to the pool; the session stays usable for the rest of the request.
+
+Outside a request (scheduler tasks, scripts) both open a standalone session; `db_session` closes it on exit.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Iterator
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+
+_factories: dict[Engine, sessionmaker] = {}
+
+
+class _RequestScope:
+    def __init__(self) -> None:
+        self.sessions: dict[Engine, Session] = {}
+        self.opened = 0
+
+    def get(self, engine: Engine) -> Session:
+        session = self.sessions.get(engine)
+        if session is None:
+            session = session_factory(engine)()
+            self.sessions[engine] = session
+            self.opened += 1
+        return session
+
+    def close(self) -> None:
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+
+
+_scope: ContextVar[_RequestScope | None] = ContextVar("db_request_scope", default=None)
+
+_requests = 0
+_sessions_opened = 0
+_max_sessions_per_request = 0
+
+
+def session_factory(engine: Engine) -> sessionmaker:
+    factory = _factories.get(engine)
+    if factory is None:
+        factory = sessionmaker(bind=engine)
+        _factories[engine] = factory
+    return factory
+
+
+def request_session(engine: Engine) -> Session:
+    """
+    The request's shared session for `engine`, for handlers that manage it without `with`.
+    Outside a request - a new standalone session, the caller closes it.
+    """
+    scope = _scope.get()
+    if scope is None:
+        return session_factory(engine)()
+    return scope.get(engine)
+
+
+@contextmanager
+def db_session(engine: Engine) -> Iterator[Session]:
+    scope = _scope.get()
+    if scope is None:
+        session = session_factory(engine)()
+        try:
+            yield session
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        return
+
+    # Откат при ошибке - дело владельца (обработчика или области запроса): здесь он выбросил бы
+    # и чужую незакоммиченную работу в той же сессии
+    yield scope.get(engine)
+
+
+async def request_db_scope() -> AsyncIterator[None]:
+    """FastAPI dependency: one session per engine for the whole request, closed at the end."""
+    global _requests, _sessions_opened, _max_sessions_per_request
+
+    scope = _RequestScope()
+    token = _scope.set(scope)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+        scope.close()
+
+        _requests += 1
+        _sessions_opened += scope.opened
+        _max_sessions_per_request = max(_max_sessions_per_request, scope.opened)
+
+
+def session_stats() -> dict:
+    return {
+        "requests": _requests,
+        "sessions_opened": _sessions_opened,
+        "sessions_per_request": round(_sessions_opened / _requests, 3) if _requests else 0.0,
+        "max_sessions_per_request": _max_sessions_per_request,
+    }
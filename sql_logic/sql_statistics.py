@@ -4,16 +4,12 @@ from contextlib import contextmanager
 from datetime import date, datetime
 from typing import Iterator
 
-from sqlalchemy import Column, Date, DateTime, Integer, String, create_engine, insert
+from sqlalchemy import Column, Date, DateTime, Integer, String, insert
 from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
-from .envs import DB_HOST, DB_PASSWORD, DB_PORT, DB_USER
+from .sql_engine import get_engine
 
-engine = create_engine(
-    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}"
-    f"@{DB_HOST}:{DB_PORT}/access",
-    pool_pre_ping=True,
-)
+engine = get_engine("access")
 Base = declarative_base()
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
@@ -109,6 +105,37 @@ def _increment_stat(
         )
 
 
+def _increment_stats_many(
+    session: Session,
+    model,
+    time_field,
+    time_value: datetime | date,
+    entity_type: str,
+    entity_ids: list[int],
+    name: str,
+) -> None:
+    # Один UPDATE по всем id, затем один INSERT для тех, у кого строки еще нет
+    filters = (
+        time_field == time_value,
+        model.type == str(entity_type),
+        model.type_id.in_(entity_ids),
+        model.name == name,
+    )
+    existing = {row.type_id for row in session.query(model.type_id).filter(*filters)}
+    if existing:
+        session.query(model).filter(*filters).update({model.count: model.count + 1}, synchronize_session=False)
+
+    missing = [entity_id for entity_id in entity_ids if entity_id not in existing]
+    if missing:
+        session.execute(
+            insert(model),
+            [
+                {time_field.name: time_value, "type": entity_type, "type_id": entity_id, "name": name, "count": 1}
+                for entity_id in missing
+            ],
+        )
+
+
 def create_processing(type: str, type_id: int, name: str, time_start: datetime) -> None:
     """Backward-compatible wrapper for recording processing time."""
     record_processing_time(entity_type=type, entity_id=type_id, name=name, time_start=time_start)
@@ -137,6 +164,15 @@ def update(type: str, type_id: int, name: str) -> None:
         _update_day(session=session, entity_type=type, entity_id=type_id, name=name, today=now.date())
 
 
+# То же для пачки сущностей одного типа (просмотр страницы с несколькими модами) - одна транзакция
+def update_many(type: str, type_ids: list[int], name: str) -> None:
+    now = datetime.now()
+    type_ids = [int(type_id) for type_id in dict.fromkeys(type_ids)]
+    with session_scope() as session:
+        _increment_stats_many(session, StatisticsHour, StatisticsHour.date_time, now.replace(minute=0, second=0, microsecond=0), type, type_ids, name)
+        _increment_stats_many(session, StatisticsDay, StatisticsDay.date, now.date(), type, type_ids, name)
+
+
 def update_hour(session: Session, type: str, type_id: int, name: str) -> None:
     _update_hour(session=session, entity_type=type, entity_id=type_id, name=name, now=datetime.now())
 
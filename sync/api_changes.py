@@ -0,0 +1,92 @@
+from fastapi import APIRouter, Request, Response, Query, Header
+from fastapi.responses import JSONResponse
+import tools
+import standarts
+from ow_config import MAIN_URL
+from limits import LIMITS
+from sql_logic import sql_catalog as catalog
+from sql_logic.sql_changes import ENTITIES, CursorExpired, changes_since
+from sql_logic.sql_session import db_session
+from fast_json import FastJSONResponse
+from sync.api_export import export_access
+
+
+router = APIRouter()
+
+
+@router.get(
+    MAIN_URL+"/changes",
+    tags=["Sync"],
+    summary="Лента изменений каталога",
+    status_code=200,
+    responses={
+        200: {
+            "description": "Изменения после курсора `since` и курсор для следующего запроса.",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "changes": [
+                            {"entity": "mods", "id": 12, "action": "upsert", "date": "2024-01-01T12:00:00"},
+                            {"entity": "resources", "id": 40, "action": "delete", "date": "2024-01-01T12:00:03"}
+                        ],
+                        "next_cursor": 1234,
+                        "more": False
+                    }
+                }
+            }
+        },
+        401: standarts.responses[401],
+        403: standarts.responses["admin"][403],
+        410: {
+            "description": "Курсор устарел: изменения после него уже удалены из журнала. Нужна полная выгрузка `/export`.",
+            "content": {
+                "application/json": {
+                    "example": {"message": "cursor expired", "error_id": 3}
+                }
+            }
+        },
+        413: {
+            "description": "Неккоректный `limit` или неизвестный тип в `entities`.",
+        },
+    }
+)
+async def catalog_changes_feed(
+    response: Response,
+    request: Request,
+    since: int = Query(0, description="Курсор: `next_cursor` из предыдущего ответа. `0` - с начала журнала."),
+    limit: int = Query(LIMITS.changes.default, description="Максимум записей журнала за запрос. Диапазон - 1...1000."),
+    entities = Query([], description="Фильтр по типам *(массив из `mods`, `games`, `genres`, `tags`, `resources`)*. Пустой - все.", examples={"example": {"value": "[\"mods\", \"resources\"]"}}),
+    x_export_token: str = Header("", description="Токен выгрузки для зеркал (`EXPORT_TOKEN` в конфиге). Без него - только для админов."),
+):
+    """
+    Инкрементальная синхронизация: что изменилось после `since`.
+
+    `upsert` - сущность создана или изменена *(в том числе ее теги, жанры, зависимости)*, ее нужно перезапросить,
+    `delete` - удалена. Удаление тега или жанра удаляет и все его ассоциации.
+    В пачке остается только последнее изменение каждой сущности. Если `more` - следующая пачка уже готова,
+    иначе повторить запрос с `next_cursor` позже. Самые свежие изменения *(последние пару секунд)* появляются с задержкой.
+
+    Полная начальная выгрузка - `/export/{kind}.ndjson`, затем эта лента. Доступ - как у выгрузки *(токен или админ)*:
+    журнал содержит и непубличные моды.
+
+    Журнал хранится `CHANGES_RETENTION_DAYS` дней *(по умолчанию 30)*. Если курсор старше самой ранней
+    оставшейся записи, ответ - `410`: нужно заново сделать полную выгрузку и продолжить ленту с `since=0`.
+    """
+    access_result = await export_access(response=response, request=request, x_export_token=x_export_token)
+    if access_result != True:
+        return access_result
+
+    entities = tools.str_to_list(entities)
+
+    if limit < 1 or limit > LIMITS.changes.max:
+        return JSONResponse(status_code=413, content={"message": "incorrect limit", "error_id": 1})
+    elif any(entity not in ENTITIES for entity in entities):
+        return JSONResponse(status_code=413, content={"message": "unknown entity", "error_id": 2})
+
+    try:
+        with db_session(catalog.engine) as session:
+            changes, next_cursor, more = changes_since(session, since=since, limit=limit, entities=entities)
+    except CursorExpired:
+        return JSONResponse(status_code=410, content={"message": "cursor expired", "error_id": 3})
+
+    return FastJSONResponse(content={"changes": changes, "next_cursor": next_cursor, "more": more}, response=response)
@@ -0,0 +1,178 @@
+from fastapi import APIRouter, Request, Response, Query, Path, Header
+from fastapi.responses import PlainTextResponse, StreamingResponse
+import hmac
+import threading
+import zlib
+import anyio
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+import tools
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+from sql_logic import sql_catalog as catalog
+from ow_config import MAIN_URL
+import ow_config as config
+import standarts
+import fast_json
+
+
+router = APIRouter()
+
+EXPORT_TOKEN = str(getattr(config, "EXPORT_TOKEN", ""))  # пусто - выгрузка только для админов
+EXPORT_YIELD_PER = int(getattr(config, "EXPORT_YIELD_PER", 1000))
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+public_mods_ids = select(catalog.Mod.id).where(catalog.Mod.condition == 0, catalog.Mod.public == 0)
+
+EXPORTS = {
+    # Только полностью публичные моды - как в каталоге
+    "mods": lambda description: select(
+        catalog.Mod.id, catalog.Mod.name, catalog.Mod.short_description,
+        *([catalog.Mod.description] if description else []),
+        catalog.Mod.size, catalog.Mod.source, catalog.Mod.source_id, catalog.Mod.downloads, catalog.Mod.game,
+        catalog.Mod.date_creation, catalog.Mod.date_update_file, catalog.Mod.date_edit,
+    ).where(catalog.Mod.condition == 0, catalog.Mod.public == 0).order_by(catalog.Mod.id),
+    "games": lambda description: select(
+        catalog.Game.id, catalog.Game.name, catalog.Game.type, catalog.Game.short_description,
+        *([catalog.Game.description] if description else []),
+        catalog.Game.mods_downloads, catalog.Game.mods_count, catalog.Game.creation_date,
+        catalog.Game.source, catalog.Game.source_id,
+    ).order_by(catalog.Game.id),
+    "genres": lambda description: select(catalog.Genre.id, catalog.Genre.name).order_by(catalog.Genre.id),
+    "tags": lambda description: select(catalog.Tag.id, catalog.Tag.name).order_by(catalog.Tag.id),
+    "mods_tags": lambda description: select(catalog.mods_tags.c.mod_id, catalog.mods_tags.c.tag_id).where(
+        catalog.mods_tags.c.mod_id.in_(public_mods_ids)
+    ),
+    "games_genres": lambda description: select(catalog.game_genres.c.game_id, catalog.game_genres.c.genre_id),
+    "games_tags": lambda description: select(catalog.allowed_mods_tags.c.game_id, catalog.allowed_mods_tags.c.tag_id),
+}
+
+
+def ndjson_rows(statement):
+    # Синхронный генератор: StreamingResponse гоняет его в пуле потоков.
+    # stream_results - серверный курсор (SSCursor у pymysql), в памяти не больше yield_per строк.
+    session = sessionmaker(bind=catalog.engine)()
+    finished = False
+    try:
+        result = session.execute(statement.execution_options(stream_results=True, yield_per=EXPORT_YIELD_PER))
+        buffer = bytearray()
+        for row in result:
+            buffer += fast_json.dumps(dict(row._mapping))
+            buffer += b"\n"
+            if len(buffer) >= EXPORT_CHUNK_BYTES:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+        finished = True
+    finally:
+        if not finished:
+            # Выгрузку прервали: закрытие SSCursor дочитало бы остаток таблицы, соединение дешевле выбросить
+            session.connection().invalidate()
+        session.close()
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 - gzip-заголовок
+    try:
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+    finally:
+        chunks.close()
+
+
+class _LockedIterator:
+    # next() из пула потоков может еще выполняться, когда запрос уже отменен - close() дождется его
+    def __init__(self, chunks) -> None:
+        self._chunks = chunks
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        with self._lock:
+            return next(self._chunks)
+
+    def close(self) -> None:
+        with self._lock:
+            self._chunks.close()
+
+
+async def closing_stream(chunks):
+    # Если клиент отключился, генератор (и его сессия с серверным курсором) закрывается сразу, а не сборщиком мусора
+    iterator = _LockedIterator(chunks)
+    try:
+        async for chunk in iterate_in_threadpool(iterator):
+            yield chunk
+    finally:
+        with anyio.CancelScope(shield=True):
+            await run_in_threadpool(iterator.close)
+
+
+async def export_access(response: Response, request: Request, x_export_token: str):
+    """`True` for a valid export token or an admin session, otherwise the error response (also used by `/changes`)."""
+    # Заголовки приходят в latin-1, а compare_digest для str принимает только ASCII - сравниваем байты
+    if EXPORT_TOKEN and x_export_token and hmac.compare_digest(x_export_token.encode(), EXPORT_TOKEN.encode()):
+        return True
+    return await tools.access_admin(response=response, request=request)
+
+
+@router.get(
+    MAIN_URL+"/export/{kind}.ndjson",
+    tags=["Sync"],
+    summary="Потоковая выгрузка каталога",
+    status_code=200,
+    responses={
+        200: {
+            "description": "Строки таблицы по одному JSON-объекту на строку *(NDJSON)*.",
+            "content": {
+                "application/x-ndjson": {
+                    "example": "{\"id\":1,\"name\":\"Tag\"}\n{\"id\":2,\"name\":\"Other tag\"}\n"
+                }
+            }
+        },
+        401: standarts.responses[401],
+        403: standarts.responses["admin"][403],
+        404: {
+            "description": "Неизвестный тип выгрузки.",
+            "content": {
+                "text/plain": {
+                    "example": "Unknown export."
+                }
+            }
+        },
+    }
+)
+async def export_ndjson(
+    response: Response,
+    request: Request,
+    kind: str = Path(description="Что выгрузить: `mods`, `games`, `genres`, `tags`, `mods_tags`, `games_genres`, `games_tags`."),
+    description: bool = Query(False, description="Включать ли полные описания (`mods`, `games`)."),
+    gzip: bool = Query(False, description="Сжимать ли поток gzip на лету *(также включается заголовком `Accept-Encoding: gzip`)*."),
+    x_export_token: str = Header("", description="Токен выгрузки для зеркал (`EXPORT_TOKEN` в конфиге). Без него - только для админов."),
+):
+    """
+    Вся таблица одним запросом для зеркал и поисковых индексаторов - вместо обхода `/list/mods/` по 50 штук.
+
+    Строки читаются серверным курсором и сразу отправляются клиенту, поэтому память не зависит от размера каталога.
+    Моды - только полностью публичные, связи `mods_tags` - только для них.
+    Порядок строк `mods`, `games`, `genres`, `tags` - по ID.
+    """
+    access_result = await export_access(response=response, request=request, x_export_token=x_export_token)
+    if access_result != True:
+        return access_result
+
+    if kind not in EXPORTS:
+        return PlainTextResponse(status_code=404, content="Unknown export.")
+
+    chunks = ndjson_rows(EXPORTS[kind](description))
+    headers = {"Content-Disposition": f'attachment; filename="{kind}.ndjson"', "Cache-Control": "no-store"}
+    if gzip or "gzip" in request.headers.get("accept-encoding", ""):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+
+    return StreamingResponse(closing_stream(chunks), media_type="application/x-ndjson", headers=headers)
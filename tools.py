@@ -1,16 +1,33 @@
 from sql_logic import sql_account as account
 from sql_logic import sql_catalog as catalog
+from sql_logic.sql_async import async_session_scope
+from sql_logic.sql_session import db_session
+from sql_logic.sql_changes import record_change
 import ow_config as config
 from io import BytesIO
 from fastapi import Request, Response
 from fastapi.responses import JSONResponse, PlainTextResponse
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import desc
+from sqlalchemy import desc, select, and_, or_, func, DateTime, Integer
 import aiohttp
 from PIL import Image, UnidentifiedImageError
+import base64
 import datetime
 import json
-import bcrypt
+import hmac
+import hashlib
+import secrets
+import hashing
+from caching.ttl_cache import TTLCache
+
+
+# Кеш успешно проверенных сервисных токенов: имя токена -> (хеш из config, HMAC токена).
+# Ключ HMAC живет только в памяти процесса, сами токены не хранятся.
+_VERIFIED_TOKEN_KEY = secrets.token_bytes(32)
+verified_tokens = TTLCache(
+    maxsize=int(getattr(config, "TOKEN_CACHE_SIZE", 64)),
+    ttl=float(getattr(config, "TOKEN_CACHE_TTL", 300)),
+)
 
 
 async def check_token(token_name: str, token: str) -> bool:
@@ -31,11 +48,19 @@ async def check_token(token_name: str, token: str) -> bool:
         print(f"Токен `{token_name}` не найден в config!")
         return False
     
-    # Хеш из config должен быть строкой, конвертируем в байты
-    stored_token_hash = stored_token_hash.encode()
-    
-    # Хешируем переданный токен с использованием bcrypt и проверяем соответствие
-    return bcrypt.checkpw(token.encode(), stored_token_hash)
+    # Повторная проверка уже подтвержденного токена - сравнение HMAC за постоянное время вместо bcrypt.
+    # Запись действительна, только пока хеш в config не поменялся.
+    token_mac = hmac.new(_VERIFIED_TOKEN_KEY, token.encode(), hashlib.sha256).digest()
+    verified = verified_tokens.get(token_name)
+    if verified is not None and verified[0] == stored_token_hash and hmac.compare_digest(verified[1], token_mac):
+        return True
+
+    # Хешируем переданный токен с использованием bcrypt (в пуле потоков) и проверяем соответствие
+    # (хеш из config должен быть строкой, конвертируем в байты)
+    result = await hashing.checkpw(token.encode(), stored_token_hash.encode())
+    if result:
+        verified_tokens.set(token_name, (stored_token_hash, token_mac))
+    return result
 
 async def access_admin(response: Response, request: Request) -> JSONResponse | bool:
     """
@@ -54,11 +79,11 @@ async def access_admin(response: Response, request: Request) -> JSONResponse | b
 
     if access_result and access_result.get("owner_id", -1) >= 0:
         # Выполнение запроса
-        session = sessionmaker(bind=account.engine)()
-        row = session.query(account.Account.admin).filter_by(id=access_result.get("owner_id", -1))
-        row_result = row.first()
+        async with async_session_scope("catalog") as session:
+            row = await session.execute(select(account.Account.admin).filter_by(id=access_result.get("owner_id", -1)))
+            row_result = row.first()
 
-        if row_result.admin:
+        if row_result and row_result.admin:
             return True
         else:
             return JSONResponse(status_code=403, content="Вы не админ!")
@@ -85,6 +110,27 @@ def str_to_list(string: str | list) -> list:
     return string
 
 
+def ids_to_int(ids: list) -> list[int] | None:
+    """
+    Coerce the elements of a parsed ID list to int, as the SQL comparison used to (`"5"` matches 5).
+
+    Returns:
+        list[int] | None: The IDs, or None if an element is not an integer or a string of one.
+    """
+    result = []
+    for item in ids:
+        if type(item) is int:
+            result.append(item)
+        elif isinstance(item, str):
+            try:
+                result.append(int(item))
+            except ValueError:
+                return None
+        else:
+            return None
+    return result
+
+
 def image_bytes_to_webp(data: bytes, quality: int = 80) -> bytes:
     """
     Convert image bytes to WebP. Raises ValueError if bytes are not an image.
@@ -157,13 +203,7 @@ async def anonymous_access_mods(user_id: int, mods_ids: list[int], edit: bool =
     """
     if isinstance(mods_ids, int): mods_ids = [mods_ids]
 
-    # Создание сессии
-    session = sessionmaker(bind=account.engine)()
-
-    # Выполнение запроса
-    user_req = session.query(account.Account).filter_by(id=user_id).first()
-
-    async def mini(session, user_req, mods_ids: list[int], edit: bool = False):
+    def mini(session, user_req, mods_ids: list[int], edit: bool = False):
         if user_req.admin:
             return mods_ids
         else:
@@ -175,15 +215,11 @@ async def anonymous_access_mods(user_id: int, mods_ids: list[int], edit: bool =
 
             mods_to_user = {mod.mod_id: mod.owner for mod in mods_to_user.all()}
 
-            session_catalog = sessionmaker(bind=account.engine)()
-            mods = session_catalog.query(catalog.Mod.id, catalog.Mod.public)
+            mods = session.query(catalog.Mod.id, catalog.Mod.public)
             mods = mods.filter(catalog.Mod.id.in_(mods_ids)).all()
 
             output_check = []
 
-            if len(mods) == 0:
-                return output_check
-
             for mod in mods:
                 if mod.id in mods_to_user:
                     if edit and(not user_req.change_self_mods or not mods_to_user.get(mod.id, False)):
@@ -192,8 +228,7 @@ async def anonymous_access_mods(user_id: int, mods_ids: list[int], edit: bool =
                     continue
 
                 output_check.append(mod.id)
-            else:
-                return output_check
+            return output_check
     # АДМИН
     # или
     # ВЛАДЕЛЕЦ МОДА и НЕ В МУТЕ и ИМЕЕТ ПРАВО НА РЕДАКТИРОВАНИЕ СВОИХ МОДОВ
@@ -205,24 +240,21 @@ async def anonymous_access_mods(user_id: int, mods_ids: list[int], edit: bool =
     #т.е.:
     #АДМИН или (НЕ В МУТЕ и ((в числе участников И имеет право на редактирование своих модов И (владелец ИЛИ действие не запрещено участникам)) ИЛИ не участник И имеет право на редактирование чужих модов))
 
-    if user_id > 0 and user_req:
-        mini_result = await mini(session=session, user_req=user_req, mods_ids=mods_ids, edit=edit)
-        session.close()
-        return mini_result if check_mode else len(mini_result) == len(mods_ids)
-    else:
-        session.close()
-        
+    # Аккаунты и каталог в одной БД - в рамках запроса это одна сессия (см. sql_logic/sql_session.py)
+    with db_session(account.engine) as session:
+        # Выполнение запроса
+        user_req = session.query(account.Account).filter_by(id=user_id).first() if user_id > 0 else None
+
+        if user_req:
+            mini_result = mini(session=session, user_req=user_req, mods_ids=mods_ids, edit=edit)
+            return mini_result if check_mode else len(mini_result) == len(mods_ids)
+
         if edit: return [] if check_mode else False
 
-        session_catalog = sessionmaker(bind=catalog.engine)()
-        mods = session_catalog.query(catalog.Mod.id).filter(catalog.Mod.id.in_(mods_ids))
+        mods = session.query(catalog.Mod.id).filter(catalog.Mod.id.in_(mods_ids))
         mods = mods.filter(catalog.Mod.public <= 1)
         if check_mode:
-            mods = mods.all()
-            
-            if len(mods) == 0: return []
-
-            return [mod.id for mod in mods]
+            return [mod.id for mod in mods.all()]
         else:
             return len(mods_ids) == mods.count()
 
@@ -275,12 +307,9 @@ async def check_game_exists(game_id:int) -> bool:
     Returns:
         bool: True if a game with the given ID exists, False otherwise.
     """
-    session = sessionmaker(bind=catalog.engine)()
-
-    result = session.query(catalog.Game).filter_by(id=game_id).first()
-
-    session.close()
-    return bool(result)
+    async with async_session_scope("catalog") as session:
+        result = await session.execute(select(catalog.Game.id).filter_by(id=game_id).limit(1))
+        return result.first() is not None
 
 async def storage_file_upload(type: str, path: str, file: BytesIO) -> tuple[int, str, bool]:
     """
@@ -330,6 +359,7 @@ async def delete_resources(owner_type:str, resources_ids:list[int] = [], owner_i
     Deletes resources based on the owner type and resource IDs or owner ID.
     If resources_ids is not empty, the resources with the specified IDs will be deleted. If owner_id is not -1, the resources of the specified owner will be deleted.
     If both resources_ids and owner_id are empty, return False (call error).
+    Rows are deleted in the request session with `flush()` only: the calling handler commits.
 
     Args:
         owner_type (str): The type of the owner.
@@ -345,16 +375,13 @@ async def delete_resources(owner_type:str, resources_ids:list[int] = [], owner_i
     if len(resources_ids) <= 0 and owner_id <= 0:
         return False
 
-    Session = sessionmaker(bind=catalog.engine)
-
-    session = Session()
-    query = session.query(catalog.Resource).filter_by(owner_type=owner_type)
+    with db_session(catalog.engine) as session:
+        query = session.query(catalog.Resource).filter_by(owner_type=owner_type)
 
-    if owner_id > 0: query = query.filter_by(owner_id=owner_id)
-    if len(resources_ids) > 0: query = query.filter(catalog.Resource.id.in_(resources_ids))
+        if owner_id > 0: query = query.filter_by(owner_id=owner_id)
+        if len(resources_ids) > 0: query = query.filter(catalog.Resource.id.in_(resources_ids))
 
-    resources = { i.id: i.url for i in query.all() }
-    session.close()
+        resources = { i.id: i.url for i in query.all() }
 
     deleted = []
     for resource in resources.keys():
@@ -368,46 +395,122 @@ async def delete_resources(owner_type:str, resources_ids:list[int] = [], owner_i
             deleted.append(resource)
 
     if len(deleted) > 0:
-        session = Session()
-        session.query(catalog.Resource).filter(catalog.Resource.id.in_(deleted)).delete(synchronize_session=False)
-        session.commit()
-        session.close()
+        with db_session(catalog.engine) as session:
+            session.query(catalog.Resource).filter(catalog.Resource.id.in_(deleted)).delete(synchronize_session=False)
+            record_change(session, "resources", deleted, "delete")
+            # Коммитит вызывающий обработчик вместе с остальными изменениями
+            session.flush()
     else:
         print("Delete Resources: No resources deleted")
 
     return True
 
 
-def sort_mods(sort_by: str): 
-    match sort_by:
+def mod_sort_key(sort_by: str):
+    """
+    Returns `(column, descending)` of the mods sort. The `i` prefix inverts the order.
+    """
+    descending = sort_by.startswith("i")
+    match sort_by.removeprefix("i"):
         case 'NAME':
-            return catalog.Mod.name
-        case 'iNAME':
-            return desc(catalog.Mod.name)
+            return catalog.Mod.name, descending
         case 'SIZE':
-            return catalog.Mod.size
-        case 'iSIZE':
-            return desc(catalog.Mod.size)
+            return catalog.Mod.size, descending
         case 'CREATION_DATE':
-            return catalog.Mod.date_creation
-        case 'iCREATION_DATE':
-            return desc(catalog.Mod.date_creation)
+            return catalog.Mod.date_creation, descending
         case 'UPDATE_DATE':
-            return catalog.Mod.date_update
-        case 'iUPDATE_DATE':
-            return desc(catalog.Mod.date_update)
-        case 'REQUEST_DATE':
-            return catalog.Mod.date_request
-        case 'iREQUEST_DATE':
-            return desc(catalog.Mod.date_request)
+            return catalog.Mod.date_update_file, descending
         case 'SOURCE':
-            return catalog.Mod.source
-        case 'iSOURCE':
-            return desc(catalog.Mod.source)
-        case 'iMOD_DOWNLOADS':
-            return desc(catalog.Mod.downloads)
+            return catalog.Mod.source, descending
+        case 'MOD_DOWNLOADS':
+            return catalog.Mod.downloads, descending
         case _:
-            return catalog.Mod.downloads  # По умолчанию сортируем по загрузкам
+            # По умолчанию сортируем по загрузкам (REQUEST_DATE - колонки даты запроса у модов нет)
+            return catalog.Mod.downloads, False
+
+
+def sort_mods(sort_by: str): 
+    column, descending = mod_sort_key(sort_by)
+    return desc(column) if descending else column
+
+
+def encode_cursor(sort_by: str, value, row_id: int) -> str:
+    """
+    Opaque keyset cursor: base64url(JSON `[sort, value of the sort column, id]`).
+    """
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort_by, value, row_id], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str, sort_by: str) -> tuple | None:
+    """
+    Returns `(value, id)` of the cursor or None if it is malformed or was made for another sort.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, row_id = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+
+    if cursor_sort != sort_by or type(row_id) is not int:
+        return None
+
+    column, _ = mod_sort_key(sort_by)
+    try:
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.datetime.fromisoformat(value)
+        elif value is not None and isinstance(column.type, Integer):
+            value = int(value)
+        elif value is not None and not isinstance(value, str):
+            return None
+    except (ValueError, TypeError):
+        return None
+
+    return value, row_id
+
+
+def keyset_after(column, descending: bool, value, row_id: int):
+    """
+    Condition "row comes after (value, id)" for ORDER BY column, id (both in the same direction).
+    MySQL puts NULL first in ascending order and last in descending.
+    """
+    if descending:
+        if value is None:
+            return and_(column == None, catalog.Mod.id < row_id)
+        return or_(column < value, and_(column == value, catalog.Mod.id < row_id), column == None)
+    else:
+        if value is None:
+            return or_(and_(column == None, catalog.Mod.id > row_id), column != None)
+        return or_(column > value, and_(column == value, catalog.Mod.id > row_id))
+
+
+def mods_with_all_tags(tags_ids: list[int]):
+    """
+    Subquery of IDs of mods that have every tag from `tags_ids`.
+    One grouped pass over `unity_mods_tags` instead of an EXISTS subquery per tag.
+    """
+    tags_ids = list(set(tags_ids))
+    return (
+        select(catalog.mods_tags.c.mod_id)
+        .where(catalog.mods_tags.c.tag_id.in_(tags_ids))
+        .group_by(catalog.mods_tags.c.mod_id)
+        .having(func.count(func.distinct(catalog.mods_tags.c.tag_id)) == len(tags_ids))
+    )
+
+
+def games_with_all_genres(genres_ids: list[int]):
+    """
+    Subquery of IDs of games that have every genre from `genres_ids` (see `mods_with_all_tags`).
+    """
+    genres_ids = list(set(genres_ids))
+    return (
+        select(catalog.game_genres.c.game_id)
+        .where(catalog.game_genres.c.genre_id.in_(genres_ids))
+        .group_by(catalog.game_genres.c.game_id)
+        .having(func.count(func.distinct(catalog.game_genres.c.genre_id)) == len(genres_ids))
+    )
 
 
 def sort_games(sort_by: str):